@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the memory used by parsed relationship fields.
+
+Usage: benchmark_relationship_memory.py [COUNT]
+
+Generates synthetic control fields for COUNT package archives (defaults to
+10000), parses them using :func:`.parse_control_fields()` (the same way
+:func:`.inspect_package_fields()` does before caching the parsed fields) and
+reports the memory allocated to the parsed fields, both with and without
+sharing of parsed expressions by :data:`.PARSE_CACHE`.
+"""
+
+# Standard library modules.
+import gc
+import logging
+import random
+import sys
+import tracemalloc
+
+# External dependencies.
+import coloredlogs
+from humanfriendly import Timer, format_size
+
+# Modules included in our package.
+from deb_pkg_tools.control import parse_control_fields
+from deb_pkg_tools.deps import PARSE_CACHE
+
+# Initialize a logger.
+logger = logging.getLogger('benchmark-relationship-memory')
+
+
+def main():
+    """Command line interface."""
+    coloredlogs.install()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    random.seed(42)
+    names = ['lib%s%i' % (random.choice(['foo', 'bar', 'baz', 'qux']), i) for i in range(count)]
+    unparsed = [generate_fields(name, names) for name in names]
+    for label, cache_size in (("without parse cache", 0), ("with parse cache", PARSE_CACHE.maxsize)):
+        PARSE_CACHE.clear()
+        PARSE_CACHE.maxsize = cache_size
+        gc.collect()
+        timer = Timer()
+        tracemalloc.start()
+        parsed = [parse_control_fields(fields) for fields in unparsed]
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        logger.info("Parsed fields of %i archives %s: %s (%s per archive) in %s.",
+                    len(parsed), label, format_size(size), format_size(size / len(parsed)), timer)
+        del parsed
+
+
+def generate_fields(name, names):
+    """Generate the (unparsed) control fields of a synthetic package archive."""
+    def relationship():
+        expression = random.choice(names)
+        if random.random() < 0.5:
+            expression += ' (%s %i.%i)' % (random.choice(['>=', '<<', '=']), random.randint(0, 5), random.randint(0, 9))
+        if random.random() < 0.1:
+            expression += ' | ' + random.choice(names)
+        return expression
+    return {
+        'Package': name,
+        'Version': '%i.%i-1' % (random.randint(0, 5), random.randint(0, 9)),
+        'Architecture': 'amd64',
+        'Depends': ', '.join(['libc6 (>= 2.15)'] + [relationship() for i in range(random.randint(1, 8))]),
+        'Recommends': ', '.join(relationship() for i in range(random.randint(0, 3))),
+    }
+
+
+if __name__ == '__main__':
+    main()
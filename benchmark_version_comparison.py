@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the available Debian version comparison implementations.
+
+Usage: benchmark_version_comparison.py [COUNT]
+
+The versions of the packages installed on the current system (according to
+``dpkg-query``) are used as a realistic corpus of version strings, when those
+aren't available a synthetic corpus is generated instead. COUNT sets the size
+of the corpus (defaults to 5000). The comparison implementations that are
+benchmarked are:
+
+- The pure Python implementation (sort keys and pairwise comparisons).
+- python-apt (when it's installed).
+- ``dpkg --compare-versions`` (only a small sample of pairs, because this
+  runs one external command per uncached comparison).
+"""
+
+# Standard library modules.
+import functools
+import logging
+import random
+import sys
+
+# External dependencies.
+import coloredlogs
+from executor import ExternalCommandFailed, execute
+from humanfriendly import Timer
+from humanfriendly.text import pluralize
+
+# Modules included in our package.
+from deb_pkg_tools.version import (
+    DPKG_COMPARISON_CACHE,
+    NATIVE_COMPARISON_CACHE,
+    compare_versions_apt,
+    compare_versions_external,
+    compare_versions_native,
+    get_apt_pkg,
+    sort_versions,
+)
+
+# Initialize a logger.
+logger = logging.getLogger('benchmark-version-comparison')
+
+# The number of pairs compared using ``dpkg --compare-versions``.
+DPKG_SAMPLE_SIZE = 100
+
+
+def main():
+    """Command line interface."""
+    coloredlogs.install()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    corpus = load_corpus(count)
+    pairs = [tuple(random.sample(corpus, 2)) for i in range(count)]
+    logger.info("Benchmarking using %s and %s ..",
+                pluralize(len(corpus), "version"),
+                pluralize(len(pairs), "pair"))
+    # Benchmark the pure Python implementation.
+    benchmark("native sort (sort keys)", lambda: sort_versions(corpus))
+    NATIVE_COMPARISON_CACHE.clear()
+    benchmark("native sort (pairwise)", lambda: sorted(corpus, key=functools.cmp_to_key(compare_native)))
+    NATIVE_COMPARISON_CACHE.clear()
+    benchmark("native pairs", lambda: [compare_versions_native(a, '<<', b) for a, b in pairs])
+    # Benchmark python-apt.
+    apt_pkg = get_apt_pkg()
+    if apt_pkg:
+        benchmark("apt sort", lambda: sorted(corpus, key=functools.cmp_to_key(apt_pkg.version_compare)))
+        benchmark("apt pairs", lambda: [compare_versions_apt(a, '<<', b) for a, b in pairs])
+        # Make sure the implementations agree.
+        mismatches = [(a, b) for a, b in pairs if (
+            compare_versions_native(a, '<<', b) != compare_versions_apt(a, '<<', b)
+        )]
+        if mismatches:
+            logger.error("Native and apt comparison disagree on %s: %s",
+                         pluralize(len(mismatches), "pair"), mismatches[:10])
+    else:
+        logger.info("Skipping python-apt benchmark (python-apt isn't installed).")
+    # Benchmark ``dpkg --compare-versions``.
+    DPKG_COMPARISON_CACHE.clear()
+    sample = pairs[:DPKG_SAMPLE_SIZE]
+    try:
+        benchmark("dpkg pairs (%i)" % len(sample), lambda: [compare_versions_external(a, '<<', b) for a, b in sample])
+    except ExternalCommandFailed:
+        logger.info("Skipping dpkg benchmark (dpkg isn't available).")
+
+
+def benchmark(label, function):
+    """Run a function and report how long it took."""
+    timer = Timer()
+    function()
+    logger.info("%s: %s", label, timer)
+
+
+def compare_native(version1, version2):
+    """Pairwise comparison function for :func:`functools.cmp_to_key()`."""
+    if compare_versions_native(version1, '<<', version2):
+        return -1
+    elif compare_versions_native(version1, '>>', version2):
+        return 1
+    return 0
+
+
+def load_corpus(count):
+    """Get a list of version strings."""
+    try:
+        output = execute('dpkg-query', '--show', '--showformat=${Version}\\n', capture=True, silent=True)
+        versions = sorted(set(output.split()))
+    except Exception:
+        versions = []
+    if len(versions) >= count:
+        return random.sample(versions, count)
+    logger.info("Generating synthetic version strings ..")
+    while len(versions) < count:
+        versions.append(generate_version())
+    return versions
+
+
+def generate_version():
+    """Generate a synthetic (but realistic looking) Debian version string."""
+    version = '.'.join(str(random.randint(0, 20)) for i in range(random.randint(1, 4)))
+    if random.random() < 0.1:
+        version = '%i:%s' % (random.randint(1, 3), version)
+    if random.random() < 0.2:
+        version += random.choice(['~rc', '~beta', '+dfsg', '+git', 'a']) + str(random.randint(1, 5))
+    if random.random() < 0.8:
+        version += '-%i' % random.randint(0, 5)
+        if random.random() < 0.3:
+            version += random.choice(['ubuntu', '+deb10u', '.', '~bpo']) + str(random.randint(1, 5))
+    return version
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
 # Debian packaging tools: Caching of package metadata.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: April 18, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """
@@ -94,7 +94,7 @@ __all__ = (
     "logger",
 )
 
-CACHE_FORMAT_REVISION = 2
+CACHE_FORMAT_REVISION = 3
 """The version number of the cache format (an integer)."""
 
 # Initialize a logger for this module.
@@ -1,7 +1,7 @@
 # Debian packaging tools: Command line interface
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: April 18, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """
@@ -29,6 +29,14 @@ Supported options:
     Perform static analysis on a package archive and its dependencies in order
     to recognize common errors as soon as possible.
 
+  -r, --rdepends=PACKAGE
+
+    List the package archives in the repository given as the first positional
+    argument (defaults to the current working directory) whose `Depends' or
+    `Pre-Depends' fields refer to the given PACKAGE. Use the syntax NAME=VERSION
+    to list only the package archives whose dependencies are satisfied by the
+    given version of the package.
+
   -p, --patch=FILE
 
     Patch fields into the existing control file given by FILE. To be used
@@ -50,7 +58,16 @@ Supported options:
   -u, --update-repo=DIR
 
     Create or update the trivial Debian binary package repository in the
-    directory given by DIR.
+    directory given by DIR. This option can be repeated and DIR can be a
+    pattern like `/srv/apt/*' to update multiple repositories concurrently.
+
+  --watch=DIR
+
+    Create or update the trivial Debian binary package repository in the
+    directory given by DIR and keep it up to date: Changes to the package
+    archives in the directory are detected using inotify (or by polling when
+    inotify isn't available) and the repository is updated as soon as a burst
+    of changes has settled down. Runs until interrupted.
 
   -a, --activate-repo=DIR
 
@@ -95,6 +112,7 @@ Supported options:
 import codecs
 import functools
 import getopt
+import glob
 import logging
 import multiprocessing
 import os.path
@@ -120,6 +138,7 @@ from humanfriendly.text import compact, format, pluralize
 from deb_pkg_tools.cache import get_default_cache
 from deb_pkg_tools.checks import check_package
 from deb_pkg_tools.control import patch_control_file
+from deb_pkg_tools.graph import find_reverse_dependencies
 from deb_pkg_tools.package import (
     build_package,
     collect_related_packages,
@@ -129,21 +148,27 @@ from deb_pkg_tools.package import (
 from deb_pkg_tools.repo import (
     activate_repository,
     deactivate_repository,
+    update_repositories,
     update_repository,
     with_repository,
 )
+from deb_pkg_tools.watch import RepositoryWatcher
 
 # Public identifiers that require documentation.
 __all__ = (
     "check_directory",
     "collect_packages",
     "collect_packages_worker",
+    "find_directories",
     "highlight",
     "logger",
     "main",
     "say",
     "show_package_metadata",
+    "show_reverse_dependencies",
     "smart_copy",
+    "update_repositories_wrapper",
+    "watch_repository",
     "with_repository_wrapper",
 )
 
@@ -163,13 +188,14 @@ def main():
     control_file = None
     control_fields = {}
     directory = None
+    repositories = []
     # Initialize the package cache.
     cache = get_default_cache()
     # Parse the command line options.
     try:
-        options, arguments = getopt.getopt(sys.argv[1:], 'i:c:C:p:s:b:u:a:d:w:yvh', [
-            'inspect=', 'collect=', 'check=', 'patch=', 'set=', 'build=',
-            'update-repo=', 'activate-repo=', 'deactivate-repo=', 'with-repo=',
+        options, arguments = getopt.getopt(sys.argv[1:], 'i:c:C:r:p:s:b:u:a:d:w:yvh', [
+            'inspect=', 'collect=', 'check=', 'rdepends=', 'patch=', 'set=', 'build=',
+            'update-repo=', 'watch=', 'activate-repo=', 'deactivate-repo=', 'with-repo=',
             'gc', 'garbage-collect', 'yes', 'verbose', 'help'
         ])
         for option, value in options:
@@ -179,6 +205,13 @@ def main():
                 directory = check_directory(value)
             elif option in ('-C', '--check'):
                 actions.append(functools.partial(check_package, archive=value, cache=cache))
+            elif option in ('-r', '--rdepends'):
+                actions.append(functools.partial(
+                    show_reverse_dependencies,
+                    package=value,
+                    directory=check_directory(arguments[0] if arguments else os.getcwd()),
+                    cache=cache,
+                ))
             elif option in ('-p', '--patch'):
                 control_file = os.path.abspath(value)
                 assert os.path.isfile(control_file), "Control file does not exist!"
@@ -192,7 +225,15 @@ def main():
                     repository=tempfile.gettempdir(),
                 ))
             elif option in ('-u', '--update-repo'):
-                actions.append(functools.partial(update_repository,
+                # All repositories are updated by a single action (so that they
+                # can be updated concurrently) at the position of the first -u.
+                if not repositories:
+                    actions.append(functools.partial(update_repositories_wrapper,
+                                                     directories=repositories,
+                                                     cache=cache))
+                repositories.extend(d for d in find_directories(value) if d not in repositories)
+            elif option == '--watch':
+                actions.append(functools.partial(watch_repository,
                                                  directory=check_directory(value),
                                                  cache=cache))
             elif option in ('-a', '--activate-repo'):
@@ -268,6 +309,31 @@ def show_package_metadata(archive):
             pathname=pathname)
 
 
+def show_reverse_dependencies(package, directory, cache=None):
+    """
+    Show the package archives in a repository that depend on a given package.
+
+    :param package: The name of a package (a string), optionally followed by
+                    an equals sign and a version number (``NAME=VERSION``).
+    :param directory: The pathname of a directory with ``*.deb`` archives (a
+                      string).
+    :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    """
+    name, _, version = package.partition('=')
+    name = name.strip()
+    version = version.strip() or None
+    archives = find_reverse_dependencies(name, version, directory, cache=cache)
+    description = "%s (version %s)" % (name, version) if version else name
+    if archives:
+        say(highlight("Found %s in %s that depend on %s:"),
+            pluralize(len(archives), "package archive"),
+            format_path(directory), description)
+        for archive in archives:
+            say(" - %s", format_path(archive.filename))
+    else:
+        say("No package archives in %s depend on %s.", format_path(directory), description)
+
+
 def highlight(text):
     """
     Highlight a piece of text using ANSI escape sequences.
@@ -387,6 +453,22 @@ def smart_copy(src, dst):
         logger.debug("Copied %s -> %s using hard link ..", format_path(src), format_path(dst))
 
 
+def watch_repository(directory, cache=None):
+    """
+    Keep a trivial repository up to date until interrupted.
+
+    :param directory: The pathname of a directory with ``*.deb`` packages (a string).
+    :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    """
+    watcher = RepositoryWatcher(directory, cache=cache)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        logger.info("Stopped watching repository %s.", format_path(directory))
+    finally:
+        watcher.close()
+
+
 def with_repository_wrapper(directory, command, cache):
     """
     Command line wrapper for :func:`deb_pkg_tools.repo.with_repository()`.
@@ -406,6 +488,50 @@ def with_repository_wrapper(directory, command, cache):
         sys.exit(1)
 
 
+def update_repositories_wrapper(directories, cache=None):
+    """
+    Update one or more trivial repositories (concurrently).
+
+    :param directories: A list of strings with the pathnames of directories
+                        with ``*.deb`` packages.
+    :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    :raises: :exc:`~exceptions.Exception` when one or more updates failed
+             (after all repositories have been updated).
+
+    A single repository is updated in the current process using
+    :func:`.update_repository()`, multiple repositories are updated
+    concurrently using :func:`.update_repositories()`.
+    """
+    if len(directories) == 1:
+        update_repository(directories[0], cache=cache)
+        return
+    failed = update_repositories(directories, cache=cache)
+    if failed:
+        raise Exception("Failed to update %s: %s" % (
+            pluralize(len(failed), "repository", "repositories"),
+            ", ".join(map(format_path, failed)),
+        ))
+
+
+def find_directories(argument):
+    """
+    Expand a command line argument that refers to one or more directories.
+
+    :param argument: The pathname of a directory or a pattern supported by
+                     :func:`glob.glob()` (a string).
+    :returns: A list of strings with absolute pathnames of directories.
+    :raises: :exc:`~exceptions.Exception` when the pattern doesn't match
+             any directories.
+    """
+    if not any(c in argument for c in '*?['):
+        return [check_directory(argument)]
+    directories = sorted(os.path.abspath(p) for p in glob.glob(parse_path(argument)) if os.path.isdir(p))
+    if not directories:
+        msg = "No directories match the pattern! (%s)"
+        raise Exception(msg % argument)
+    return directories
+
+
 def check_directory(argument):
     """
     Make sure a command line argument points to an existing directory.
@@ -1,7 +1,7 @@
 # Debian packaging tools: Compatibility functions.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: February 6, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """
@@ -12,15 +12,35 @@ that is compatible with Python 2.6 up to 3.5, filling in some missing bits that
 `six <http://six.readthedocs.org/>`_ doesn't provide.
 """
 
+# Standard library modules.
+import os
+
 # External dependencies.
 from six import PY2
 
 # Public identifiers that require documentation.
 __all__ = (
+    "replace",
     "str_compatible",
 )
 
 
+def replace(source, target):
+    """
+    Atomically rename a file, replacing the target if it exists.
+
+    :param source: The pathname of the file to rename (a string).
+    :param target: The new pathname of the file (a string).
+
+    Uses :func:`os.replace()` on Python 3 and :func:`os.rename()` on Python 2
+    (which has the same semantics on POSIX systems).
+    """
+    if PY2:
+        os.rename(source, target)
+    else:
+        os.replace(source, target)
+
+
 def str_compatible(cls):
     """
     A class decorator that defines ``__unicode__()`` and ``__str__()`` on Python 2.
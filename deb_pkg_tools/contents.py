@@ -0,0 +1,173 @@
+# Debian packaging tools: Contents indexes.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 18, 2026
+# URL: https://github.com/xolox/python-deb-pkg-tools
+
+"""
+Generation of ``Contents-<arch>`` indexes for trivial repositories.
+
+``Contents`` indexes map the pathnames of the files installed by the packages
+in a repository to the packages that contain them, this enables tools like
+:man:`apt-file` to search repositories without downloading any packages. Each
+line of the index contains a pathname (without the leading slash) followed by
+a comma separated list of qualified package names (``section/package``).
+
+The file listings are taken from :func:`.inspect_package_contents()`, so when
+a :class:`.PackageCache` is used only new archives are inspected using
+:man:`dpkg-deb`. The index is sorted using an external merge sort: at most
+:data:`CONTENTS_CHUNK_SIZE` entries are kept in memory, they are sorted and
+written to temporary files which are merged while the index is streamed to
+disk (see :func:`write_contents_file()`).
+"""
+
+# Standard library modules.
+import gzip
+import heapq
+import io
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+
+# External dependencies.
+from humanfriendly import Timer, format_path
+from humanfriendly.text import pluralize
+
+# Modules included in our package.
+from deb_pkg_tools.package import inspect_package_contents, inspect_package_fields
+
+# Public identifiers that require documentation.
+__all__ = (
+    "CONTENTS_CHUNK_SIZE",
+    "iter_contents",
+    "logger",
+    "update_contents",
+    "write_contents_file",
+)
+
+CONTENTS_CHUNK_SIZE = int(os.environ.get('DPT_CONTENTS_CHUNK_SIZE', '250000'))
+"""
+The maximum number of (pathname, package) pairs that :func:`write_contents_file()`
+sorts in memory (an integer, defaults to 250000). The environment variable
+``$DPT_CONTENTS_CHUNK_SIZE`` can be used to control the value of this variable.
+"""
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+
+def update_contents(archives, output_directory, cache=None, chunk_size=None):
+    """
+    Generate the ``Contents-<arch>.gz`` indexes of a trivial repository.
+
+    :param archives: A list of :class:`.PackageFile` objects (e.g. the result
+                     of :func:`.find_package_archives()`).
+    :param output_directory: The pathname of the directory where the indexes
+                             are created (a string).
+    :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    :param chunk_size: Refer to :func:`write_contents_file()`.
+    :returns: A list with the filenames of the generated indexes (strings).
+
+    One index is generated for each architecture, packages with the
+    architecture ``all`` are included in all indexes. When the repository
+    only contains packages with the architecture ``all`` a single
+    ``Contents-all.gz`` index is generated.
+    """
+    filenames = []
+    architectures = sorted(set(a.architecture for a in archives) - set(['all']))
+    if not architectures and archives:
+        architectures = ['all']
+    for architecture in architectures:
+        timer = Timer()
+        selected = sorted(a for a in archives if a.architecture in (architecture, 'all'))
+        filename = 'Contents-%s.gz' % architecture
+        pathname = os.path.join(output_directory, filename)
+        count = write_contents_file(pathname, iter_contents(selected, cache), chunk_size)
+        logger.debug("Generated %s (%s of %s) in %s.", format_path(pathname),
+                     pluralize(count, "file"), pluralize(len(selected), "package"), timer)
+        filenames.append(filename)
+    return filenames
+
+
+def iter_contents(archives, cache=None):
+    """
+    Iterate over the files contained in package archives.
+
+    :param archives: An iterable of :class:`.PackageFile` objects.
+    :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    :returns: A generator of tuples with two strings each: The pathname of a
+              file (without the leading slash) and the qualified name of the
+              package containing the file (``section/package``). Directories
+              are not included.
+    """
+    for archive in archives:
+        fields = inspect_package_fields(archive.filename, cache)
+        location = u'%s/%s' % (fields.get('Section', u'misc'), fields.get('Package', archive.name))
+        for pathname, entry in inspect_package_contents(archive.filename, cache).items():
+            if not entry.permissions.startswith('d'):
+                yield pathname.lstrip(u'/'), location
+
+
+def write_contents_file(filename, entries, chunk_size=None):
+    """
+    Write a sorted and gzip compressed ``Contents`` index.
+
+    :param filename: The pathname of the index (a string).
+    :param entries: An iterable of (pathname, package) tuples (e.g. the
+                    result of :func:`iter_contents()`).
+    :param chunk_size: The maximum number of entries that are sorted in memory
+                       (an integer, defaults to :data:`CONTENTS_CHUNK_SIZE`).
+    :returns: The number of lines in the index (an integer).
+
+    Entries are buffered until `chunk_size` is reached, then the buffer is
+    sorted and written to a temporary file (a sorted run). The runs and the
+    final buffer are merged using :func:`heapq.merge()`. The pathnames and
+    package names in the buffer are interned so that files contained in
+    multiple package versions are only stored once.
+    """
+    if chunk_size is None:
+        chunk_size = CONTENTS_CHUNK_SIZE
+    temporary_directory = tempfile.mkdtemp(prefix='contents-')
+    try:
+        runs = []
+        buffer = []
+        strings = {}
+        for pathname, location in entries:
+            buffer.append((strings.setdefault(pathname, pathname), strings.setdefault(location, location)))
+            if len(buffer) >= chunk_size:
+                runs.append(write_run(os.path.join(temporary_directory, str(len(runs))), buffer))
+                buffer = []
+                strings.clear()
+        buffer.sort()
+        count = 0
+        with open(filename, 'wb') as handle:
+            # Use a fixed modification time to keep the output reproducible.
+            with gzip.GzipFile(filename='', mode='wb', fileobj=handle, mtime=0) as compressed:
+                with io.TextIOWrapper(compressed, encoding='UTF-8') as writer:
+                    merged = heapq.merge(buffer, *[read_run(fn) for fn in runs])
+                    for pathname, group in itertools.groupby(merged, key=lambda e: e[0]):
+                        locations = sorted(set(location for _, location in group))
+                        writer.write(u'%-55s %s\n' % (pathname, u','.join(locations)))
+                        count += 1
+        return count
+    finally:
+        shutil.rmtree(temporary_directory)
+
+
+def write_run(filename, entries):
+    """Helper for :func:`write_contents_file()` to write a sorted run to a temporary file."""
+    entries.sort()
+    with io.open(filename, 'w', encoding='UTF-8') as handle:
+        for pathname, location in entries:
+            handle.write(u'%s\t%s\n' % (pathname, location))
+    return filename
+
+
+def read_run(filename):
+    """Helper for :func:`write_contents_file()` to read a sorted run from a temporary file."""
+    with io.open(filename, encoding='UTF-8') as handle:
+        for line in handle:
+            pathname, _, location = line.rstrip(u'\n').rpartition(u'\t')
+            yield pathname, location
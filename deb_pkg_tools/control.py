@@ -1,7 +1,7 @@
 # Debian packaging tools: Control file manipulation.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: May 11, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """
@@ -36,7 +36,7 @@ from humanfriendly.text import compact, concatenate, pluralize
 from six import string_types, text_type
 
 # Modules included in our package.
-from deb_pkg_tools.deps import parse_depends, RelationshipSet
+from deb_pkg_tools.deps import LazyRelationshipSet, RelationshipSet, parse_depends
 from deb_pkg_tools.utils import makedirs
 from deb_pkg_tools.deb822 import Deb822, parse_deb822
 
@@ -44,7 +44,9 @@ from deb_pkg_tools.deb822 import Deb822, parse_deb822
 __all__ = (
     "DEFAULT_CONTROL_FIELDS",
     "DEPENDS_LIKE_FIELDS",
+    "DEPENDS_LIKE_FIELD_SET",
     "MANDATORY_BINARY_CONTROL_FIELDS",
+    "NORMALIZED_FIELD_NAMES",
     "SPECIAL_CASES",
     "check_mandatory_fields",
     "create_control_file",
@@ -108,6 +110,13 @@ similar to the ``Depends`` field (in the sense that they contain a comma
 separated list of package names with optional version specifications).
 """
 
+DEPENDS_LIKE_FIELD_SET = frozenset(DEPENDS_LIKE_FIELDS)
+"""
+A :class:`frozenset` with the same field names as :data:`DEPENDS_LIKE_FIELDS`
+(membership tests on a set don't need to compare the field name to every
+element).
+"""
+
 INSTALLED_SIZE_FIELD = CaseInsensitiveKey('Installed-Size')
 """A case insensitive string to match the "Installed-Size" field name."""
 
@@ -119,6 +128,15 @@ lowercase, whereas the values contain the proper casing. Used by
 :func:`normalize_control_field_name()`.
 """
 
+NORMALIZED_FIELD_NAMES = {}
+"""
+A dictionary that maps field names to the result of
+:func:`normalize_control_field_name()`. Because the number of distinct field
+names is small this avoids repeatedly normalizing the same field names (the
+size of the dictionary is capped at 1000 entries to guard against unexpected
+input).
+"""
+
 
 def load_control_file(control_file):
     """
@@ -220,7 +238,7 @@ def merge_control_fields(defaults, overrides):
         if name not in field_names:
             field_names.append(name)
     for name in field_names:
-        if name in DEPENDS_LIKE_FIELDS:
+        if name in DEPENDS_LIKE_FIELD_SET:
             # Dependencies are merged instead of overridden.
             relationships = set()
             for source in [defaults, overrides]:
@@ -239,11 +257,15 @@ def merge_control_fields(defaults, overrides):
     return unparse_control_fields(merged)
 
 
-def parse_control_fields(input_fields):
+def parse_control_fields(input_fields, lazy=False):
     r"""
     Parse Debian control file fields.
 
     :param input_fields: The dictionary to convert.
+    :param lazy: :data:`True` to postpone the parsing of the fields given by
+                 :data:`DEPENDS_LIKE_FIELDS` until they're used (see
+                 :class:`.LazyRelationshipSet`), :data:`False` to parse them
+                 immediately (the default).
     :returns: A dictionary of the type :class:`.Deb822`.
 
     This function takes the result of the shallow parsing of control fields
@@ -312,14 +334,16 @@ def parse_control_fields(input_fields):
     logger.debug("Parsing %i control fields ..", len(input_fields))
     for name, unparsed_value in input_fields.items():
         name = normalize_control_field_name(name)
-        if name in DEPENDS_LIKE_FIELDS:
-            parsed_value = parse_depends(unparsed_value)
+        if name in DEPENDS_LIKE_FIELD_SET:
+            parsed_value = LazyRelationshipSet(unparsed_value) if lazy else parse_depends(unparsed_value)
         elif name == INSTALLED_SIZE_FIELD:
             parsed_value = int(unparsed_value)
         else:
             parsed_value = unparsed_value
         output_fields[name] = parsed_value
-    logger.debug("Parsed fields: %s", output_fields)
+    if not lazy:
+        # Rendering lazily parsed fields would defeat the purpose.
+        logger.debug("Parsed fields: %s", output_fields)
     return output_fields
 
 
@@ -341,7 +365,7 @@ def unparse_control_fields(input_fields):
     logger.debug("Unparsing %i control fields ..", len(input_fields))
     for name, parsed_value in input_fields.items():
         name = normalize_control_field_name(name)
-        if name in DEPENDS_LIKE_FIELDS:
+        if name in DEPENDS_LIKE_FIELD_SET:
             if isinstance(parsed_value, RelationshipSet):
                 # New interface (a RelationshipSet object).
                 unparsed_value = text_type(parsed_value)
@@ -386,7 +410,13 @@ def normalize_control_field_name(name):
 
     .. _Syntax of control files: http://www.debian.org/doc/debian-policy/ch-controlfields.html#s-controlsyntax
     """
-    return CaseInsensitiveKey(u'-'.join(SPECIAL_CASES.get(w.lower(), w.capitalize()) for w in name.split(u'-')))
+    try:
+        return NORMALIZED_FIELD_NAMES[name]
+    except KeyError:
+        normalized = CaseInsensitiveKey(u'-'.join(SPECIAL_CASES.get(w.lower(), w.capitalize()) for w in name.split(u'-')))
+        if len(NORMALIZED_FIELD_NAMES) < 1000:
+            NORMALIZED_FIELD_NAMES[name] = normalized
+        return normalized
 
 
 # Define aliases for backwards compatibility.
@@ -1,27 +1,52 @@
 # Debian packaging tools: Control file manipulation.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: May 11, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """Parsing and formatting of Debian control fields in the :man:`deb822` format."""
 
 # Standard library modules.
 import codecs
+import gzip
+import io
 import logging
 import textwrap
 
+# The lzma module is only available on Python 3.3+.
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
 # External dependencies.
 from humanfriendly.case import CaseInsensitiveDict
 from humanfriendly.text import compact, format, is_empty_line
 from six import text_type
 
 # Public identifiers that require documentation.
-__all__ = ("Deb822", "dump_deb822", "logger", "parse_deb822")
+__all__ = (
+    "Deb822",
+    "Deb822Writer",
+    "GZIP_MAGIC",
+    "XZ_MAGIC",
+    "decompress_handle",
+    "dump_deb822",
+    "format_field_value",
+    "iter_deb822",
+    "logger",
+    "parse_deb822",
+)
 
 # Initialize a logger.
 logger = logging.getLogger(__name__)
 
+GZIP_MAGIC = b"\x1f\x8b"
+"""The magic bytes at the start of a gzip compressed file (a byte string)."""
+
+XZ_MAGIC = b"\xfd7zXZ\x00"
+"""The magic bytes at the start of an xz compressed file (a byte string)."""
+
 
 def dump_deb822(fields):
     """
@@ -30,22 +55,33 @@ def dump_deb822(fields):
     :param fields: The control fields to dump (a dictionary).
     :returns: A Unicode string containing the formatted control fields.
     """
-    lines = []
-    for key, value in fields.items():
-        # Check for multi-line values.
-        if "\n" in value:
-            input_lines = value.splitlines()
-            output_lines = [input_lines.pop(0)]
-            for line in input_lines:
-                if line and not line.isspace():
-                    # Make sure continuation lines are indented.
-                    output_lines.append(u" " + line)
-                else:
-                    # Encode empty continuation lines as a dot (indented).
-                    output_lines.append(u" .")
-            value = u"\n".join(output_lines)
-        lines.append(u"%s: %s\n" % (key, value))
-    return u"".join(lines)
+    return u"".join(u"%s: %s\n" % (key, format_field_value(value)) for key, value in fields.items())
+
+
+def format_field_value(value):
+    """
+    Format the value of a control field.
+
+    :param value: The value of a control field (a string).
+    :returns: The formatted value (a string).
+
+    Continuation lines in multi-line values are indented and empty
+    continuation lines are encoded as a dot (indented). Values without
+    newlines are returned unchanged.
+    """
+    # Check for multi-line values.
+    if "\n" in value:
+        input_lines = value.splitlines()
+        output_lines = [input_lines[0]]
+        for line in input_lines[1:]:
+            if line and not line.isspace():
+                # Make sure continuation lines are indented.
+                output_lines.append(u" " + line)
+            else:
+                # Encode empty continuation lines as a dot (indented).
+                output_lines.append(u" .")
+        value = u"\n".join(output_lines)
+    return value
 
 
 def parse_deb822(text, filename=None):
@@ -61,16 +97,19 @@ def parse_deb822(text, filename=None):
     # Make sure we're dealing with Unicode text.
     if not isinstance(text, text_type):
         text = codecs.decode(text, "UTF-8")
+    input_lines = text.splitlines()
     # The following is not part of the deb822 standard - it was added to
     # deb-pkg-tools for convenient use in the test suite with indented string
     # literals. It's preserved for backwards compatibility, but may be removed
-    # in the future.
-    text = textwrap.dedent(text).strip()
-    # Get ready to parse the control fields.
-    input_lines = list(enumerate(text.splitlines(), start=1))
+    # in the future. Because dedenting requires an additional pass over the
+    # input it's only done when the first non-empty line is indented.
+    first_line = next((line for line in input_lines if not is_empty_line(line)), u"")
+    if first_line.startswith((u" ", u"\t")):
+        input_lines = textwrap.dedent(text).splitlines()
+    # Get ready to parse the control fields (in a single pass).
+    input_lines = enumerate(input_lines, start=1)
     parsed_fields = []
-    while input_lines:
-        line_number, line = input_lines.pop(0)
+    for line_number, line in input_lines:
         # Completely ignore comment lines (even nested between "continuation lines").
         if line.startswith(u"#"):
             continue
@@ -101,7 +140,7 @@ def parse_deb822(text, filename=None):
                             more_lnum=line_number,
                         )
                     )
-            # Stop the 'while' loop.
+            # Stop the 'for' loop.
             break
         # Check for "continuation lines".
         if line.startswith((u" ", u"\t")) and not line.isspace():
@@ -147,6 +186,193 @@ def parse_deb822(text, filename=None):
     return Deb822((key, u"\n".join(lines)) for key, lines in parsed_fields)
 
 
+def iter_deb822(handle, filename=None):
+    """
+    Incrementally parse a file containing multiple :man:`deb822` paragraphs.
+
+    :param handle: A file-like object opened in binary or text mode, or the
+                   filename of a file (a string). Binary input that's gzip or
+                   xz compressed is decompressed transparently (see
+                   :func:`decompress_handle()`).
+    :param filename: An optional string with the filename of the source file
+                     (only used for the purpose of error reporting, defaults
+                     to the ``name`` attribute of the file-like object).
+    :returns: A generator of :class:`Deb822` objects, one for each paragraph.
+    :raises: :exc:`~exceptions.ValueError` when the input can't be parsed
+             (the message includes the line number).
+
+    This is intended for files like ``Packages`` and ``Sources`` that contain
+    thousands of paragraphs: The input is read line by line and each
+    paragraph is yielded as soon as it has been parsed, so memory usage
+    doesn't depend on the size of the input. Unlike :func:`parse_deb822()`
+    the input is not dedented.
+    """
+    if isinstance(handle, (text_type, str)):
+        with io.open(handle, "rb") as file_handle:
+            for paragraph in iter_deb822(file_handle, filename=filename or handle):
+                yield paragraph
+        return
+    if filename is None:
+        filename = getattr(handle, "name", None)
+    handle = decompress_handle(handle)
+    parsed_fields = []
+    for line_number, line in enumerate(handle, start=1):
+        # Make sure we're dealing with Unicode text.
+        if not isinstance(line, text_type):
+            line = codecs.decode(line, "UTF-8")
+        line = line.rstrip(u"\r\n")
+        # Completely ignore comment lines (even nested between "continuation lines").
+        if line.startswith(u"#"):
+            continue
+        # Empty lines end the current paragraph (if any).
+        if is_empty_line(line):
+            if parsed_fields:
+                yield Deb822((key, u"\n".join(lines)) for key, lines in parsed_fields)
+                parsed_fields = []
+            continue
+        # Check for "continuation lines".
+        if line.startswith((u" ", u"\t")):
+            # Make sure the continuation line follows a key.
+            if not parsed_fields:
+                raise ValueError(
+                    render_error(
+                        filename,
+                        line_number,
+                        """
+                        Got continuation line without leading key!
+                        (current line is {line_text})
+                        """,
+                        line_text=repr(line),
+                    )
+                )
+            # Continuation lines containing only a dot are converted to empty lines.
+            line = line.strip()
+            if line == u".":
+                line = u""
+            # Store the continuation line under the preceding key.
+            parsed_fields[-1][1].append(line)
+        else:
+            # Try to split the line into a key and value.
+            key, delimiter, value = line.partition(":")
+            if not (key and delimiter):
+                raise ValueError(
+                    render_error(
+                        filename,
+                        line_number,
+                        """
+                        Line not recognized as key/value pair or continuation
+                        line! (current line is {line_text})
+                        """,
+                        line_text=repr(line),
+                    )
+                )
+            parsed_fields.append((key.strip(), [value.strip()]))
+    # Don't forget about the last paragraph.
+    if parsed_fields:
+        yield Deb822((key, u"\n".join(lines)) for key, lines in parsed_fields)
+
+
+def decompress_handle(handle):
+    """
+    Transparently decompress a gzip or xz compressed file.
+
+    :param handle: A file-like object.
+    :returns: A file-like object that yields decompressed data (this is the
+              given file-like object when it's not compressed).
+    :raises: :exc:`~exceptions.EnvironmentError` when an xz compressed file
+             is given but the :mod:`lzma` module isn't available.
+
+    The compression format is detected by peeking at the magic bytes at the
+    start of the file. This only works for binary mode file-like objects that
+    support :func:`~io.BufferedReader.peek()` or seeking, other file-like
+    objects are returned unchanged.
+    """
+    if hasattr(handle, "peek"):
+        magic = handle.peek(len(XZ_MAGIC))[:len(XZ_MAGIC)]
+    elif getattr(handle, "seekable", lambda: False)():
+        position = handle.tell()
+        magic = handle.read(len(XZ_MAGIC))
+        handle.seek(position)
+    else:
+        return handle
+    if not isinstance(magic, bytes):
+        return handle
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=handle, mode="rb")
+    if magic.startswith(XZ_MAGIC):
+        if lzma is None:
+            raise EnvironmentError("The lzma module is required to decompress xz compressed files!")
+        return lzma.LZMAFile(handle)
+    return handle
+
+
+class Deb822Writer(object):
+
+    """
+    Streaming writer of :man:`deb822` paragraphs to a binary file.
+
+    This is intended for writing files like ``Packages`` that contain many
+    paragraphs: Each paragraph is encoded to UTF-8 and written to the file
+    using a single :func:`~io.BufferedWriter.write()` call, the encoded field
+    names (including the delimiter) and the position of field names in the
+    field order are computed once and cached.
+    """
+
+    def __init__(self, handle, field_order=()):
+        """
+        Initialize a :class:`Deb822Writer` object.
+
+        :param handle: A file-like object opened in binary mode.
+        :param field_order: An iterable of strings with field names. Fields in
+                            this list are written first (in the given order),
+                            other fields are written in the order of the
+                            dictionaries passed to :func:`write()`.
+        """
+        self.handle = handle
+        self.field_ranks = dict((name.lower(), i) for i, name in enumerate(field_order))
+        self.field_keys = {}
+        self.count = 0
+
+    def get_field_key(self, name):
+        """
+        Get the sort key and encoded prefix of a field.
+
+        :param name: The name of a field (a string).
+        :returns: A tuple with two values:
+
+                  1. The position of the field in the field order (an integer).
+                  2. The field name and delimiter encoded to UTF-8 (a byte string).
+        """
+        try:
+            return self.field_keys[name]
+        except KeyError:
+            value = (
+                self.field_ranks.get(name.lower(), len(self.field_ranks)),
+                (u"%s: " % name).encode("UTF-8"),
+            )
+            self.field_keys[name] = value
+            return value
+
+    def write(self, fields):
+        """
+        Write a paragraph.
+
+        :param fields: The control fields to write (a dictionary).
+        """
+        entries = [(self.get_field_key(key), value) for key, value in fields.items()]
+        if self.field_ranks:
+            entries.sort(key=lambda entry: entry[0][0])
+        chunks = []
+        for (rank, prefix), value in entries:
+            chunks.append(prefix)
+            chunks.append(format_field_value(value).encode("UTF-8"))
+            chunks.append(b"\n")
+        # Paragraphs are separated by empty lines.
+        chunks.append(b"\n")
+        self.handle.write(b"".join(chunks))
+        self.count += 1
+
+
 def render_error(filename, line_number, text, *args, **kw):
     """Render an error message including line number and optional filename."""
     message = []
@@ -1,7 +1,7 @@
 # Debian packaging tools: Relationship parsing and evaluation.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: April 19, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """
@@ -39,21 +39,34 @@ python (>= 2.6), python (<< 3) | python (>= 3.4)
 As you can see the :func:`repr()` output of the relationship set shows the
 object tree and the :class:`str` output is the dependency line.
 
+Architecture restrictions (like ``[amd64]`` or ``[!hurd-any]``) and build
+profile restrictions (like ``<!nocheck>``) are evaluated when you pass the
+target architecture and/or the active build profiles:
+
+>>> dependencies = parse_depends('libc6 [linux-any], libc0.1 [kfreebsd-any], debhelper <!nocheck>')
+>>> dependencies.matches('libc6', architecture='amd64')
+True
+>>> dependencies.matches('libc0.1', architecture='amd64') is None
+True
+>>> dependencies.matches('debhelper', profiles=['nocheck']) is None
+True
+
 .. _chapter 7: http://www.debian.org/doc/debian-policy/ch-relationships.html#s-depsyntax
 """
 
 # Standard library modules.
 import functools
 import logging
+import os
 import re
 
 # External dependencies.
 from humanfriendly.text import compact, split
-from property_manager import PropertyManager, key_property
 from six import string_types, text_type
 
 # Modules included in our package.
 from deb_pkg_tools.compat import str_compatible
+from deb_pkg_tools.utils import LRUCache
 from deb_pkg_tools.version import compare_versions
 
 # Public identifiers that require documentation.
@@ -61,12 +74,22 @@ __all__ = (
     "ARCHITECTURE_RESTRICTIONS_MESSAGE",
     "AbstractRelationship",
     "AlternativeRelationship",
+    "CPU_ALIASES",
     "EXPRESSION_PATTERN",
+    "ImmutableObject",
+    "LazyRelationshipSet",
+    "PARSE_CACHE",
+    "PARSE_CACHE_SIZE",
+    "RESTRICTIONS_CACHE",
     "Relationship",
     "RelationshipSet",
     "VersionedRelationship",
     "cache_matches",
+    "cache_parsing",
+    "evaluate_architecture_restrictions",
+    "evaluate_profile_restrictions",
     "logger",
+    "match_architecture",
     "parse_alternatives",
     "parse_depends",
     "parse_relationship",
@@ -77,11 +100,11 @@ logger = logging.getLogger(__name__)
 
 # Define a compiled regular expression pattern that we will use to match
 # package relationship expressions consisting of a package name followed by
-# optional version and architecture restrictions.
+# optional version, architecture and build profile restrictions.
 EXPRESSION_PATTERN = re.compile(r'''
     # Capture all leading characters up to (but not including)
-    # the first parenthesis, bracket or space.
-    (?P<name> [^\(\[ ]+ )
+    # the first parenthesis, bracket, angle bracket or space.
+    (?P<name> [^\(\[< ]+ )
     # Ignore any whitespace.
     \s*
     # Optionally capture version restriction inside parentheses.
@@ -90,15 +113,80 @@ EXPRESSION_PATTERN = re.compile(r'''
     \s*
     # Optionally capture architecture restriction inside brackets.
     ( \[ (?P<architectures> [^\]]+ ) \] )?
+    # Ignore any whitespace.
+    \s*
+    # Optionally capture build profile restrictions inside angle brackets.
+    (?P<profiles> ( < [^>]* > \s* )+ )?
 ''', re.VERBOSE)
 
 ARCHITECTURE_RESTRICTIONS_MESSAGE = """
-Evaluation of architecture restrictions hasn't been implemented yet. If you
-think this would be useful to you then please submit a feature request at
-https://github.com/xolox/python-deb-pkg-tools/issues/9
+Evaluation of architecture restrictions requires a target architecture,
+please pass the `architecture` argument to the matches() method.
+"""
+
+CPU_ALIASES = dict(armel='arm', armhf='arm', x32='amd64')
+"""
+A dictionary that maps Debian architectures to the CPU name used in
+architecture wildcards (for architectures where these differ, e.g. the
+``armhf`` architecture matches the wildcard ``any-arm``).
+"""
+
+RESTRICTIONS_CACHE = LRUCache(maxsize=1000)
+"""
+This :class:`~deb_pkg_tools.utils.LRUCache` is used by
+:func:`evaluate_architecture_restrictions()` and
+:func:`evaluate_profile_restrictions()` to remember the result of evaluating
+restrictions, because the same restrictions occur over and over again.
+"""
+
+PARSE_CACHE_SIZE = int(os.environ.get('DPT_PARSE_CACHE_SIZE', '10000'))
+"""
+The maximum number of entries in :data:`PARSE_CACHE` (an integer, defaults to 10000).
+
+The environment variable ``$DPT_PARSE_CACHE_SIZE`` can be used to control the
+value of this variable.
+"""
+
+PARSE_CACHE = LRUCache(maxsize=PARSE_CACHE_SIZE)
+"""
+This :class:`~deb_pkg_tools.utils.LRUCache` is used by :func:`cache_parsing()`
+to cache the results of :func:`parse_depends()`, :func:`parse_alternatives()`
+and :func:`parse_relationship()`. Each key in the cache is a tuple of two
+values: (function_name, expression). Each value is a relationship object.
 """
 
 
+def cache_parsing(f):
+    """
+    Memoizing decorator for the relationship parsing functions.
+
+    The same relationship expressions (like ``libc6 (>= 2.15)``) occur over and
+    over again in a package repository. This decorator uses :data:`PARSE_CACHE`
+    to avoid parsing them more than once, which also means that the objects
+    returned for identical expressions are shared (and so is the cache
+    maintained by :func:`cache_matches()` on those objects). Expressions that
+    fail to parse are not cached.
+
+    .. warning:: Because the parsed objects are shared they should be treated
+                 as immutable. This is not enforced.
+    """
+    @functools.wraps(f)
+    def decorator(expression):
+        # Iterables of expressions are accepted by parse_depends() but they're not
+        # hashable (and iterators can only be consumed once) so we use a tuple.
+        if not isinstance(expression, string_types):
+            expression = tuple(expression)
+        key = (f.__name__, expression)
+        try:
+            return PARSE_CACHE[key]
+        except KeyError:
+            value = f(expression)
+            PARSE_CACHE[key] = value
+            return value
+    return decorator
+
+
+@cache_parsing
 def parse_depends(relationships):
     """
     Parse a Debian package relationship declaration line.
@@ -136,6 +224,7 @@ def parse_depends(relationships):
     return RelationshipSet(*map(parse_alternatives, relationships))
 
 
+@cache_parsing
 def parse_alternatives(expression):
     """
     Parse an expression containing one or more alternative relationships.
@@ -166,6 +255,7 @@ def parse_alternatives(expression):
         return parse_relationship(expression)
 
 
+@cache_parsing
 def parse_relationship(expression):
     """
     Parse an expression containing a package name and optional version/architecture restrictions.
@@ -193,9 +283,11 @@ def parse_relationship(expression):
     version = match.group('version')
     # Split the architecture restrictions into a tuple of strings.
     architectures = tuple((match.group('architectures') or '').split())
+    # Split the build profile restrictions into a tuple of tuples of strings.
+    profiles = tuple(tuple(group.split()) for group in re.findall('<([^>]*)>', match.group('profiles') or ''))
     if name and not version:
-        # A package name (and optional architecture restrictions) without version relation.
-        return Relationship(name=name, architectures=architectures)
+        # A package name (and optional restrictions) without version relation.
+        return Relationship(name=name, architectures=architectures, profiles=profiles)
     else:
         # A package name (and optional architecture restrictions) followed by a
         # relationship to specific version(s) of the package.
@@ -207,7 +299,96 @@ def parse_relationship(expression):
                 from version resulted in more than two tokens!
                 (expression: {e}, tokens: {t})
             """, e=expression, t=tokens))
-        return VersionedRelationship(name=name, architectures=architectures, operator=tokens[0], version=tokens[1])
+        return VersionedRelationship(
+            name=name,
+            operator=tokens[0],
+            version=tokens[1],
+            architectures=architectures,
+            profiles=profiles,
+        )
+
+
+def evaluate_architecture_restrictions(architectures, architecture):
+    """
+    Evaluate the architecture restrictions of a relationship.
+
+    :param architectures: A tuple of strings with architecture names and/or
+                          wildcards, optionally negated using ``!`` (refer to
+                          :attr:`Relationship.architectures`).
+    :param architecture: The target architecture (a string like ``amd64``).
+    :returns: :data:`True` if the restrictions are satisfied, :data:`False`
+              otherwise.
+    """
+    key = ('architectures', architectures, architecture)
+    try:
+        return RESTRICTIONS_CACHE[key]
+    except KeyError:
+        pass
+    included = [a for a in architectures if not a.startswith('!')]
+    excluded = [a[1:] for a in architectures if a.startswith('!')]
+    value = (
+        (not included or any(match_architecture(architecture, a) for a in included))
+        and not any(match_architecture(architecture, a) for a in excluded)
+    )
+    RESTRICTIONS_CACHE[key] = value
+    return value
+
+
+def evaluate_profile_restrictions(profiles, active_profiles):
+    """
+    Evaluate the build profile restrictions of a relationship.
+
+    :param profiles: A tuple of tuples of strings with build profile names,
+                     optionally negated using ``!`` (refer to
+                     :attr:`Relationship.profiles`).
+    :param active_profiles: An iterable of strings with the names of the
+                            active build profiles (may be empty).
+    :returns: :data:`True` if the restrictions are satisfied, :data:`False`
+              otherwise.
+
+    The restrictions are satisfied when at least one of the groups of terms
+    (``<...>``) is satisfied, a group is satisfied when all of its terms are
+    satisfied.
+    """
+    active_profiles = frozenset(active_profiles)
+    key = ('profiles', profiles, active_profiles)
+    try:
+        return RESTRICTIONS_CACHE[key]
+    except KeyError:
+        pass
+    value = any(all(
+        (term[1:] not in active_profiles) if term.startswith('!') else (term in active_profiles)
+        for term in group
+    ) for group in profiles)
+    RESTRICTIONS_CACHE[key] = value
+    return value
+
+
+def match_architecture(architecture, pattern):
+    """
+    Check if an architecture matches an architecture name or wildcard.
+
+    :param architecture: The name of an architecture (a string like ``amd64``).
+    :param pattern: An architecture name (like ``amd64``) or wildcard (like
+                    ``any``, ``linux-any`` or ``any-amd64``).
+    :returns: :data:`True` if the architecture matches, :data:`False` otherwise.
+
+    Wildcards are evaluated by splitting architecture names into an operating
+    system and CPU (e.g. ``kfreebsd-amd64`` becomes ``kfreebsd`` and
+    ``amd64`` while ``amd64`` becomes ``linux`` and ``amd64``), see also
+    :data:`CPU_ALIASES`.
+    """
+    if pattern == architecture or pattern == 'any':
+        return True
+    if '-' in pattern:
+        pattern_os, _, pattern_cpu = pattern.partition('-')
+        if '-' in architecture:
+            os_name, _, cpu = architecture.partition('-')
+        else:
+            os_name, cpu = 'linux', architecture
+        cpu = CPU_ALIASES.get(cpu, cpu)
+        return pattern_os in ('any', os_name) and pattern_cpu in ('any', cpu)
+    return False
 
 
 def cache_matches(f):
@@ -221,28 +402,114 @@ def cache_matches(f):
     something like 40 seconds...
     """
     @functools.wraps(f)
-    def decorator(self, package, version=None):
-        # Get or create the cache.
-        try:
-            cache = self._matches_cache
-        except AttributeError:
+    def decorator(self, package, version=None, architecture=None, profiles=None):
+        # Get or create the cache (we use object.__setattr__() because
+        # the relationship objects are immutable).
+        cache = getattr(self, '_matches_cache', None)
+        if cache is None:
             cache = {}
-            setattr(self, '_matches_cache', cache)
+            object.__setattr__(self, '_matches_cache', cache)
         # Get or create the entry.
-        key = (package, version)
+        if profiles is not None:
+            profiles = frozenset(profiles)
+        key = (package, version, architecture, profiles)
         try:
             return cache[key]
         except KeyError:
-            value = f(self, package, version)
+            if architecture is None and profiles is None:
+                # Stay compatible with overrides that don't support restrictions.
+                value = f(self, package, version)
+            else:
+                value = f(self, package, version, architecture, profiles)
             cache[key] = value
             return value
     return decorator
 
 
-class AbstractRelationship(PropertyManager):
+class ImmutableObject(object):
+
+    """
+    Base class for the immutable relationship objects defined in :mod:`deb_pkg_tools.deps`.
+
+    The parsed control fields of a large repository can easily contain millions
+    of relationship objects, so to keep memory usage down these objects use
+    :data:`~object.__slots__` instead of a :data:`~object.__dict__` (they used
+    to be :class:`~property_manager.PropertyManager` subclasses). Equality
+    comparison, sorting and hashing are based on :attr:`key_values` (just
+    like :class:`~property_manager.PropertyManager`) and the hash value is
+    computed when the object is created.
+    """
+
+    __slots__ = ('_hash', '_matches_cache')
+
+    key_properties = ()
+    """A tuple with the names of the attributes that define the identity of the object."""
+
+    def initialize(self, **values):
+        """
+        Initialize the attributes of an immutable object.
+
+        :param values: The values of the attributes given by :attr:`key_properties`.
+        """
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, '_matches_cache', None)
+        object.__setattr__(self, '_hash', hash(self.key_values))
+
+    @property
+    def key_values(self):
+        """A tuple of tuples with (name, value) pairs for each name in :attr:`key_properties`."""
+        return tuple((name, getattr(self, name)) for name in self.key_properties)
+
+    def __setattr__(self, name, value):
+        """Prevent modification of immutable objects."""
+        raise AttributeError("%s objects are immutable!" % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        """Prevent modification of immutable objects."""
+        raise AttributeError("%s objects are immutable!" % self.__class__.__name__)
+
+    def __hash__(self):
+        """Enable adding relationship objects to sets and using them as dictionary keys."""
+        return self._hash
+
+    def __eq__(self, other):
+        """Enable equality comparison between relationship objects."""
+        if self is other:
+            return True
+        elif isinstance(other, ImmutableObject):
+            # Objects with different hashes can't be equal.
+            return self._hash == other._hash and self.key_values == other.key_values
+        else:
+            return NotImplemented
+
+    def __ne__(self, other):
+        """Enable non-equality comparison between relationship objects."""
+        return not (self == other) if isinstance(other, ImmutableObject) else NotImplemented
+
+    def __lt__(self, other):
+        """Enable "less than" comparison between relationship objects."""
+        return self.key_values < other.key_values if isinstance(other, ImmutableObject) else NotImplemented
+
+    def __le__(self, other):
+        """Enable "less than or equal" comparison between relationship objects."""
+        return self.key_values <= other.key_values if isinstance(other, ImmutableObject) else NotImplemented
+
+    def __gt__(self, other):
+        """Enable "greater than" comparison between relationship objects."""
+        return self.key_values > other.key_values if isinstance(other, ImmutableObject) else NotImplemented
+
+    def __ge__(self, other):
+        """Enable "greater than or equal" comparison between relationship objects."""
+        return self.key_values >= other.key_values if isinstance(other, ImmutableObject) else NotImplemented
+
+
+class AbstractRelationship(ImmutableObject):
 
     """Abstract base class for the various types of relationship objects defined in :mod:`deb_pkg_tools.deps`."""
 
+    __slots__ = ()
+
     @property
     def names(self):
         """
@@ -254,12 +521,18 @@ class AbstractRelationship(PropertyManager):
         """
         raise NotImplementedError
 
-    def matches(self, name, version=None):
+    def matches(self, name, version=None, architecture=None, profiles=None):
         """
         Check if the relationship matches a given package and version.
 
         :param name: The name of a package (a string).
         :param version: The version number of a package (a string, optional).
+        :param architecture: The target architecture used to evaluate
+                             architecture restrictions (a string, optional).
+        :param profiles: The active build profiles used to evaluate build
+                         profile restrictions (an iterable of strings,
+                         optional). When this is :data:`None` build profile
+                         restrictions are ignored.
         :returns: One of the values :data:`True`, :data:`False` or :data:`None`
                   meaning the following:
 
@@ -269,7 +542,8 @@ class AbstractRelationship(PropertyManager):
                   - :data:`False` if the name matches but the version
                     invalidates the match,
 
-                  - :data:`None` if the name doesn't match at all.
+                  - :data:`None` if the name doesn't match at all (or the
+                    restrictions of the relationship aren't satisfied).
 
         .. note:: This method needs to be implemented by subclasses.
         """
@@ -283,39 +557,85 @@ class Relationship(AbstractRelationship):
     A simple package relationship referring only to the name of a package.
 
     Created by :func:`parse_relationship()`.
+
+    .. attribute:: name
+
+       The name of a package (a string).
+
+    .. attribute:: architectures
+
+       The architecture restriction(s) on the relationship (a tuple of strings).
+
+    .. attribute:: profiles
+
+       The build profile restriction(s) on the relationship (a tuple of
+       tuples of strings, one tuple for each ``<...>`` group).
     """
 
+    __slots__ = ('name', 'architectures', 'profiles')
+
     # Explicitly define the sort order of the key properties.
-    key_properties = 'name', 'architectures'
+    key_properties = 'name', 'architectures', 'profiles'
+
+    def __init__(self, name, architectures=(), profiles=()):
+        """
+        Initialize a :class:`Relationship` object.
 
-    @key_property
-    def name(self):
-        """The name of a package (a string)."""
+        :param name: The name of a package (a string).
+        :param architectures: The architecture restriction(s) on the
+                              relationship (an iterable of strings).
+        :param profiles: The build profile restriction(s) on the relationship
+                         (an iterable of iterables of strings).
+        """
+        self.initialize(
+            name=name,
+            architectures=tuple(architectures),
+            profiles=tuple(tuple(group) for group in profiles),
+        )
 
-    @key_property
-    def architectures(self):
-        """The architecture restriction(s) on the relationship (a tuple of strings)."""
-        return ()
+    def __reduce__(self):
+        """Enable pickling of :class:`Relationship` objects."""
+        return (self.__class__, (self.name, self.architectures, self.profiles))
 
     @property
     def names(self):
         """The name(s) of the packages in the relationship."""
         return set([self.name])
 
-    def matches(self, name, version=None):
+    def applies_to(self, architecture=None, profiles=None):
+        """
+        Check if the restrictions of the relationship are satisfied.
+
+        :param architecture: The target architecture (a string, optional).
+        :param profiles: The active build profiles (an iterable of strings or
+                         :data:`None` to ignore build profile restrictions).
+        :returns: :data:`True` if the relationship applies, :data:`False` otherwise.
+        :raises: :exc:`~exceptions.NotImplementedError` when :attr:`architectures`
+                 is not empty and `architecture` is :data:`None`.
+        """
+        if self.architectures:
+            if architecture is None:
+                raise NotImplementedError(compact(ARCHITECTURE_RESTRICTIONS_MESSAGE))
+            if not evaluate_architecture_restrictions(self.architectures, architecture):
+                return False
+        if self.profiles and profiles is not None:
+            return evaluate_profile_restrictions(self.profiles, profiles)
+        return True
+
+    def matches(self, name, version=None, architecture=None, profiles=None):
         """
         Check if the relationship matches a given package name.
 
         :param name: The name of a package (a string).
         :param version: The version number of a package (this parameter is ignored).
-        :returns: :data:`True` if the name matches, :data:`None` otherwise.
+        :param architecture: The target architecture (a string, optional).
+        :param profiles: The active build profiles (an iterable of strings, optional).
+        :returns: :data:`True` if the name matches (and the restrictions are
+                  satisfied), :data:`None` otherwise.
         :raises: :exc:`~exceptions.NotImplementedError` when :attr:`architectures`
-                 is not empty (because evaluation of architecture restrictions
-                 hasn't been implemented).
+                 is not empty and `architecture` is :data:`None`.
         """
-        if self.name == name:
-            if self.architectures:
-                raise NotImplementedError(compact(ARCHITECTURE_RESTRICTIONS_MESSAGE))
+        if self.name == name and self.applies_to(architecture, profiles):
             return True
 
     def __str__(self):
@@ -323,6 +643,8 @@ class Relationship(AbstractRelationship):
         expression = self.name
         if self.architectures:
             expression += u" [%s]" % " ".join(self.architectures)
+        if self.profiles:
+            expression += u" " + u" ".join(u"<%s>" % " ".join(group) for group in self.profiles)
         return expression
 
     def __repr__(self):
@@ -330,7 +652,11 @@ class Relationship(AbstractRelationship):
         return "%s(%s)" % (self.__class__.__name__, ', '.join([
             'name=%r' % self.name,
             'architectures=%s' % repr(self.architectures),
-        ]))
+        ] + self.restrictions_repr()))
+
+    def restrictions_repr(self):
+        """Helper for :func:`__repr__()` to include build profile restrictions only when they're used."""
+        return ['profiles=%r' % (self.profiles,)] if self.profiles else []
 
 
 @str_compatible
@@ -340,26 +666,54 @@ class VersionedRelationship(Relationship):
     A conditional package relationship that refers to a package and certain versions of that package.
 
     Created by :func:`parse_relationship()`.
+
+    .. attribute:: operator
+
+       An operator that compares Debian package version numbers (a string).
+
+    .. attribute:: version
+
+       The version number of a package (a string).
     """
 
+    __slots__ = ('operator', 'version')
+
     # Explicitly define the sort order of the key properties.
-    key_properties = 'name', 'operator', 'version', 'architectures'
+    key_properties = 'name', 'operator', 'version', 'architectures', 'profiles'
 
-    @key_property
-    def operator(self):
-        """An operator that compares Debian package version numbers (a string)."""
+    def __init__(self, name, operator, version, architectures=(), profiles=()):
+        """
+        Initialize a :class:`VersionedRelationship` object.
 
-    @key_property
-    def version(self):
-        """The version number of a package (a string)."""
+        :param name: The name of a package (a string).
+        :param operator: An operator that compares Debian package version numbers (a string).
+        :param version: The version number of a package (a string).
+        :param architectures: The architecture restriction(s) on the
+                              relationship (an iterable of strings).
+        :param profiles: The build profile restriction(s) on the relationship
+                         (an iterable of iterables of strings).
+        """
+        self.initialize(
+            name=name,
+            operator=operator,
+            version=version,
+            architectures=tuple(architectures),
+            profiles=tuple(tuple(group) for group in profiles),
+        )
+
+    def __reduce__(self):
+        """Enable pickling of :class:`VersionedRelationship` objects."""
+        return (self.__class__, (self.name, self.operator, self.version, self.architectures, self.profiles))
 
     @cache_matches
-    def matches(self, name, version=None):
+    def matches(self, name, version=None, architecture=None, profiles=None):
         """
         Check if the relationship matches a given package name and version.
 
         :param name: The name of a package (a string).
         :param version: The version number of a package (a string, optional).
+        :param architecture: The target architecture (a string, optional).
+        :param profiles: The active build profiles (an iterable of strings, optional).
         :returns: One of the values :data:`True`, :data:`False` or :data:`None`
                   meaning the following:
 
@@ -369,19 +723,16 @@ class VersionedRelationship(Relationship):
                   - :data:`False` if the name matches but the version
                     invalidates the match,
 
-                  - :data:`None` if the name doesn't match at all.
+                  - :data:`None` if the name doesn't match at all (or the
+                    restrictions of the relationship aren't satisfied).
         :raises: :exc:`~exceptions.NotImplementedError` when
-                 :attr:`~Relationship.architectures` is not empty (because
-                 evaluation of architecture restrictions hasn't been
-                 implemented).
+                 :attr:`~Relationship.architectures` is not empty and
+                 `architecture` is :data:`None`.
 
-        Uses the external command ``dpkg --compare-versions`` to ensure
-        compatibility with Debian's package version comparison algorithm.
+        Uses :func:`.compare_versions()` to compare versions.
         """
-        if self.name == name:
+        if self.name == name and self.applies_to(architecture, profiles):
             if version:
-                if self.architectures:
-                    raise NotImplementedError(compact(ARCHITECTURE_RESTRICTIONS_MESSAGE))
                 return compare_versions(version, self.operator, self.version)
             else:
                 return False
@@ -391,6 +742,8 @@ class VersionedRelationship(Relationship):
         expression = u'%s (%s %s)' % (self.name, self.operator, self.version)
         if self.architectures:
             expression += u" [%s]" % " ".join(self.architectures)
+        if self.profiles:
+            expression += u" " + u" ".join(u"<%s>" % " ".join(group) for group in self.profiles)
         return expression
 
     def __repr__(self):
@@ -400,7 +753,7 @@ class VersionedRelationship(Relationship):
             'operator=%r' % self.operator,
             'version=%r' % self.version,
             'architectures=%s' % repr(self.architectures),
-        ]))
+        ] + self.restrictions_repr()))
 
 
 @str_compatible
@@ -410,19 +763,27 @@ class AlternativeRelationship(AbstractRelationship):
     A package relationship that refers to one of several alternative packages.
 
     Created by :func:`parse_alternatives()`.
+
+    .. attribute:: relationships
+
+       A tuple of :class:`Relationship` objects.
     """
 
+    __slots__ = ('relationships',)
+
+    key_properties = ('relationships',)
+
     def __init__(self, *relationships):
         """
         Initialize an :class:`AlternativeRelationship` object.
 
         :param relationships: One or more :class:`Relationship` objects.
         """
-        self.relationships = tuple(relationships)
+        self.initialize(relationships=tuple(relationships))
 
-    @key_property
-    def relationships(self):
-        """A tuple of :class:`Relationship` objects."""
+    def __reduce__(self):
+        """Enable pickling of :class:`AlternativeRelationship` objects."""
+        return (self.__class__, self.relationships)
 
     @property
     def names(self):
@@ -437,19 +798,21 @@ class AlternativeRelationship(AbstractRelationship):
         return names
 
     @cache_matches
-    def matches(self, name, version=None):
+    def matches(self, name, version=None, architecture=None, profiles=None):
         """
         Check if the relationship matches a given package and version.
 
         :param name: The name of a package (a string).
         :param version: The version number of a package (a string, optional).
+        :param architecture: The target architecture (a string, optional).
+        :param profiles: The active build profiles (an iterable of strings, optional).
         :returns: :data:`True` if the name and version of an alternative match,
                   :data:`False` if the name of an alternative was matched but the
                   version didn't match, :data:`None` otherwise.
         """
         matches = None
         for alternative in self.relationships:
-            alternative_matches = alternative.matches(name, version)
+            alternative_matches = alternative.matches(name, version, architecture, profiles)
             if alternative_matches is True:
                 return True
             elif alternative_matches is False:
@@ -467,9 +830,19 @@ class AlternativeRelationship(AbstractRelationship):
 
 
 @str_compatible
-class RelationshipSet(PropertyManager):
+class RelationshipSet(ImmutableObject):
+
+    """
+    A set of package relationships. Created by :func:`parse_depends()`.
+
+    .. attribute:: relationships
 
-    """A set of package relationships. Created by :func:`parse_depends()`."""
+       A tuple of :class:`Relationship` objects.
+    """
+
+    __slots__ = ('relationships',)
+
+    key_properties = ('relationships',)
 
     def __init__(self, *relationships):
         """
@@ -477,11 +850,11 @@ class RelationshipSet(PropertyManager):
 
         :param relationships: One or more :class:`Relationship` objects.
         """
-        self.relationships = tuple(relationships)
+        self.initialize(relationships=tuple(relationships))
 
-    @key_property
-    def relationships(self):
-        """A tuple of :class:`Relationship` objects."""
+    def __reduce__(self):
+        """Enable pickling of :class:`RelationshipSet` objects."""
+        return (self.__class__, self.relationships)
 
     @property
     def names(self):
@@ -496,12 +869,14 @@ class RelationshipSet(PropertyManager):
         return names
 
     @cache_matches
-    def matches(self, name, version=None):
+    def matches(self, name, version=None, architecture=None, profiles=None):
         """
         Check if the set of relationships matches a given package and version.
 
         :param name: The name of a package (a string).
         :param version: The version number of a package (a string, optional).
+        :param architecture: The target architecture (a string, optional).
+        :param profiles: The active build profiles (an iterable of strings, optional).
         :returns: :data:`True` if all matched relationships evaluate to true,
                   :data:`False` if a relationship is matched and evaluates to false,
                   :data:`None` otherwise.
@@ -510,7 +885,7 @@ class RelationshipSet(PropertyManager):
                      :class:`RelationshipSet` objects are
                      immutable. This is not enforced.
         """
-        results = [r.matches(name, version) for r in self.relationships]
+        results = [r.matches(name, version, architecture, profiles) for r in self.relationships]
         matches = [r for r in results if r is not None]
         return all(matches) if matches else None
 
@@ -528,3 +903,53 @@ class RelationshipSet(PropertyManager):
     def __iter__(self):
         """Iterate over the relationships in a relationship set."""
         return iter(self.relationships)
+
+
+class LazyRelationshipSet(RelationshipSet):
+
+    """
+    A :class:`RelationshipSet` that postpones parsing until it's needed.
+
+    Used by :func:`.parse_control_fields()` (when `lazy` is :data:`True`) to
+    avoid parsing the relationship fields of package archives that are only
+    ever converted back to text (for example by :func:`.scan_packages()`).
+
+    .. attribute:: text
+
+       The unparsed relationship expression (a string).
+
+    The expression is parsed using :func:`parse_depends()` on the first access
+    to an attribute that requires the parsed relationships (this includes
+    equality comparison and hashing), after which the object behaves exactly
+    like a regular :class:`RelationshipSet`. Serializing the object to a
+    string returns the original text without parsing it.
+    """
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        """
+        Initialize a :class:`LazyRelationshipSet` object.
+
+        :param text: The unparsed relationship expression (a string).
+        """
+        object.__setattr__(self, 'text', text)
+
+    def __getattr__(self, name):
+        """Parse the relationship expression when the parsed relationships are first needed."""
+        if name in ('relationships', '_hash'):
+            self.initialize(relationships=parse_depends(self.text).relationships)
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    def __reduce__(self):
+        """Enable pickling of :class:`LazyRelationshipSet` objects (without parsing them)."""
+        return (self.__class__, (self.text,))
+
+    def __str__(self):
+        """Get the original relationship expression."""
+        return self.text
+
+    def __repr__(self, pretty=False, indent=0):
+        """Serialize a :class:`LazyRelationshipSet` object to a Python expression (like :class:`RelationshipSet`)."""
+        return RelationshipSet(*self.relationships).__repr__(pretty=pretty, indent=indent)
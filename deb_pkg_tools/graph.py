@@ -0,0 +1,501 @@
+# Debian packaging tools: Dependency graphs of repositories.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 18, 2026
+# URL: https://github.com/xolox/python-deb-pkg-tools
+
+"""
+Dependency graphs of Debian binary package repositories.
+
+The :mod:`deb_pkg_tools.graph` module builds a dependency graph of the
+``*.deb`` archives in a directory. The nodes of the graph are package archives
+and the edges are the resolved ``Depends`` and ``Pre-Depends`` relationships
+between those archives (see :data:`.DEPENDENCY_FIELDS`).
+
+Resolving relationships to package archives is relatively expensive on large
+repositories, so the graph can be persisted next to the :class:`.PackageCache`
+using :func:`load_dependency_graph()`. When the graph is loaded again only the
+package archives that were added, changed or removed since the previous run
+are rescanned and only the edges that may have been affected by those changes
+are resolved again.
+
+Once a graph has been built it can be queried using
+:func:`DependencyGraph.closure()` and
+:func:`DependencyGraph.reverse_dependencies()` and exported using
+:func:`DependencyGraph.to_json()` and :func:`DependencyGraph.to_dot()`.
+
+The question "which package archives depend on package X (version V)?" can be
+answered using :func:`find_reverse_dependencies()`, which is also available on
+the command line as ``deb-pkg-tools --rdepends``.
+"""
+
+# Standard library modules.
+import collections
+import errno
+import json
+import logging
+import operator
+import os
+
+# External dependencies.
+from humanfriendly import Timer, format_path
+from humanfriendly.text import pluralize
+from six.moves import cPickle as pickle
+
+# Modules included in our package.
+from deb_pkg_tools.cache import CACHE_FORMAT_REVISION
+from deb_pkg_tools.package import (
+    DEPENDENCY_FIELDS,
+    archive_sort_key,
+    find_package_archives,
+    inspect_package_fields,
+    parse_filename,
+)
+from deb_pkg_tools.utils import makedirs, sha1
+from deb_pkg_tools.version import sort_versions
+
+# Public identifiers that require documentation.
+__all__ = (
+    "DependencyGraph",
+    "GraphNode",
+    "find_reverse_dependencies",
+    "load_dependency_graph",
+    "logger",
+)
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+
+def load_dependency_graph(directory, cache=None):
+    """
+    Load (and if necessary update) the dependency graph of a repository.
+
+    :param directory: The pathname of a directory containing ``*.deb``
+                      archives (a string).
+    :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+                  When a cache is given the dependency graph is persisted in
+                  the cache directory so that it can be updated incrementally
+                  the next time it is loaded.
+    :returns: A :class:`DependencyGraph` object.
+    """
+    directory = os.path.realpath(directory)
+    graph = None
+    if cache:
+        cache_file = os.path.join(cache.directory, 'dependency-graph', '%s.pickle' % sha1(directory))
+        graph = DependencyGraph.load(cache_file, directory)
+    if graph is None:
+        graph = DependencyGraph(directory)
+    if graph.update(cache=cache) and cache:
+        graph.save(cache_file)
+    return graph
+
+
+def find_reverse_dependencies(name, version, directory, cache=None):
+    """
+    Find the package archives in a repository that depend on a given package.
+
+    :param name: The name of a package (a string).
+    :param version: The version of the package (a string) or :data:`None`.
+    :param directory: The pathname of a directory containing ``*.deb``
+                      archives (a string).
+    :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    :returns: A sorted list of :class:`.PackageFile` objects.
+
+    This is a shortcut for :func:`load_dependency_graph()` followed by
+    :func:`DependencyGraph.find_reverse_dependencies()`.
+    """
+    graph = load_dependency_graph(directory, cache=cache)
+    return graph.find_reverse_dependencies(name, version)
+
+
+class DependencyGraph(object):
+
+    """Dependency graph of the ``*.deb`` archives in a directory."""
+
+    def __init__(self, directory):
+        """
+        Initialize a :class:`DependencyGraph` object.
+
+        :param directory: The pathname of a directory containing ``*.deb``
+                          archives (a string).
+
+        The graph starts out empty, use :func:`update()` to populate it.
+        """
+        self.directory = os.path.realpath(directory)
+        self.nodes = {}
+        self.edges = {}
+        self.reverse_index_cache = None
+
+    @classmethod
+    def load(cls, cache_file, directory):
+        """
+        Load a dependency graph that was previously saved using :func:`save()`.
+
+        :param cache_file: The pathname of the file to load (a string).
+        :param directory: The pathname of the directory that the graph is
+                          expected to describe (a string).
+        :returns: A :class:`DependencyGraph` object or :data:`None` when the
+                  file doesn't exist, can't be loaded or is outdated.
+        """
+        try:
+            with open(cache_file, 'rb') as handle:
+                state = pickle.load(handle)
+            if state['revision'] == CACHE_FORMAT_REVISION and state['directory'] == os.path.realpath(directory):
+                graph = cls(directory)
+                graph.nodes = state['nodes']
+                graph.edges = state['edges']
+                logger.debug("Loaded dependency graph of %s from %s.", format_path(directory), format_path(cache_file))
+                return graph
+        except Exception:
+            pass
+
+    def save(self, cache_file):
+        """
+        Save the dependency graph to a file.
+
+        :param cache_file: The pathname of the file to save (a string).
+
+        The file is written to a temporary file first and then moved into
+        place, so concurrent readers never see a partially written file.
+        """
+        directory, filename = os.path.split(cache_file)
+        temporary_file = os.path.join(directory, '.%s-%i' % (filename, os.getpid()))
+        state = dict(
+            directory=self.directory,
+            edges=self.edges,
+            nodes=self.nodes,
+            revision=CACHE_FORMAT_REVISION,
+        )
+        try:
+            handle = open(temporary_file, 'wb')
+        except EnvironmentError as e:
+            # We may be missing the cache directory.
+            if e.errno != errno.ENOENT:
+                raise
+            makedirs(directory)
+            handle = open(temporary_file, 'wb')
+        with handle:
+            pickle.dump(state, handle)
+        os.rename(temporary_file, cache_file)
+
+    def update(self, cache=None):
+        """
+        Synchronize the dependency graph with the contents of the directory.
+
+        :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+        :returns: :data:`True` if the graph was changed, :data:`False` otherwise.
+
+        Package archives that were added or changed (based on their last
+        modified times) are scanned and package archives that were removed are
+        dropped from the graph. Edges are only resolved again for package
+        archives that were scanned and for package archives whose
+        relationships refer to the name of a package that was added, changed
+        or removed.
+        """
+        timer = Timer()
+        changed_names = set()
+        rescanned = set()
+        current_archives = dict((a.filename, a) for a in find_package_archives(self.directory, cache))
+        # Drop the nodes of package archives that no longer exist.
+        for filename in list(self.nodes):
+            if filename not in current_archives:
+                changed_names.add(self.nodes.pop(filename).archive.name)
+                self.edges.pop(filename, None)
+        # Add or refresh the nodes of new or modified package archives.
+        for filename, archive in current_archives.items():
+            last_modified = os.path.getmtime(filename)
+            node = self.nodes.get(filename)
+            if not (node and node.last_modified == last_modified):
+                control_fields = inspect_package_fields(filename, cache)
+                relationships = []
+                for field_name in DEPENDENCY_FIELDS:
+                    if field_name in control_fields:
+                        relationships.extend(control_fields[field_name])
+                names = set()
+                for relationship in relationships:
+                    names |= relationship.names
+                self.nodes[filename] = GraphNode(
+                    archive=archive,
+                    last_modified=last_modified,
+                    names=frozenset(names),
+                    relationships=tuple(relationships),
+                )
+                changed_names.add(archive.name)
+                rescanned.add(filename)
+        if not changed_names:
+            logger.debug("Dependency graph of %s is up to date.", format_path(self.directory))
+            return False
+        # Resolve the edges that may have been affected by the changes.
+        candidates = self.group_candidates()
+        num_resolved = 0
+        for filename, node in self.nodes.items():
+            if filename in rescanned or (node.names & changed_names):
+                self.edges[filename] = self.resolve(node, candidates)
+                num_resolved += 1
+        self.reverse_index_cache = None
+        logger.debug("Updated dependency graph of %s (resolved %s in %s).",
+                     format_path(self.directory), pluralize(num_resolved, "package archive"), timer)
+        return True
+
+    def group_candidates(self):
+        """
+        Group the package archives in the graph by package name.
+
+        :returns: A dictionary with package names (strings) as keys and lists
+                  of :class:`.PackageFile` objects as values. The lists are
+                  sorted by descending version because newer versions are
+                  preferred over older versions.
+        """
+        candidates = collections.defaultdict(list)
+        for node in self.nodes.values():
+            candidates[node.archive.name].append(node.archive)
+        for name in candidates:
+            candidates[name] = sort_versions(
+                sorted(candidates[name], key=archive_sort_key, reverse=True),
+                key=operator.attrgetter('version'), reverse=True,
+            )
+        return candidates
+
+    def resolve(self, node, candidates):
+        """
+        Resolve the relationships of a node to package archives.
+
+        :param node: The :class:`GraphNode` to resolve.
+        :param candidates: The result of :func:`group_candidates()`.
+        :returns: A :class:`frozenset` with filenames of package archives.
+
+        Each relationship is resolved to the newest package archive that
+        satisfies it. For relationships with alternatives the alternatives
+        are tried in the order in which they were declared. Relationships
+        that can't be satisfied by the package archives in the directory are
+        silently ignored, just like :func:`.collect_related_packages()` does.
+        Architecture restrictions (like ``foo [amd64]``) are evaluated using
+        the architecture of the package archive whose relationships are
+        resolved (the architecture ``all`` only satisfies negated
+        restrictions like ``foo [!amd64]``).
+        """
+        targets = set()
+        architecture = node.archive.architecture
+        for relationship in node.relationships:
+            for alternative in getattr(relationship, 'relationships', (relationship,)):
+                match = None
+                if alternative.name != node.archive.name:
+                    for archive in candidates.get(alternative.name, ()):
+                        if alternative.matches(archive.name, archive.version, architecture):
+                            match = archive
+                            break
+                if match:
+                    targets.add(match.filename)
+                    break
+        return frozenset(targets)
+
+    @property
+    def reverse_edges(self):
+        """
+        The edges of the graph in the opposite direction.
+
+        A dictionary with filenames of package archives as keys and sets of
+        filenames of the package archives that depend on them as values.
+        """
+        reverse_edges = collections.defaultdict(set)
+        for source, targets in self.edges.items():
+            for target in targets:
+                reverse_edges[target].add(source)
+        return reverse_edges
+
+    @property
+    def reverse_index(self):
+        """
+        An index of the package archives that refer to each package name.
+
+        A dictionary with package names (strings) as keys and sets of
+        filenames of the package archives whose dependencies refer to the
+        package name as values. The index is built from the (cached) control
+        fields of the package archives on first use and it's rebuilt after
+        :func:`update()` changes the graph.
+        """
+        if self.reverse_index_cache is None:
+            reverse_index = collections.defaultdict(set)
+            for filename, node in self.nodes.items():
+                for name in node.names:
+                    reverse_index[name].add(filename)
+            self.reverse_index_cache = dict(reverse_index)
+        return self.reverse_index_cache
+
+    def find_reverse_dependencies(self, name, version=None):
+        """
+        Find the package archives that depend on a given package.
+
+        :param name: The name of a package (a string).
+        :param version: The version of the package (a string, optional).
+        :returns: A sorted list of :class:`.PackageFile` objects.
+
+        When `version` is :data:`None` all package archives whose dependencies
+        refer to the package name are reported. When a version is given only
+        the package archives with a dependency on the package that is
+        satisfied by that version are reported. The package doesn't need to
+        be part of the graph, which makes it possible to judge the impact of
+        adding, upgrading or removing a package. Dependencies whose
+        architecture restrictions don't apply to the architecture of the
+        depending package archive are ignored (see :func:`resolve()`).
+        """
+        matches = []
+        for filename in self.reverse_index.get(name, ()):
+            node = self.nodes[filename]
+            for relationship in node.relationships:
+                if name in relationship.names:
+                    status = relationship.matches(name, version, node.archive.architecture)
+                    if status is True or (version is None and status is not None):
+                        matches.append(filename)
+                        break
+        return self.get_archives(matches)
+
+    def dependencies(self, archive):
+        """
+        Get the direct dependencies of a package archive.
+
+        :param archive: The filename of a package archive in the graph (a
+                        string) or a :class:`.PackageFile` object.
+        :returns: A sorted list of :class:`.PackageFile` objects.
+        """
+        return self.get_archives(self.edges.get(self.get_filename(archive), ()))
+
+    def closure(self, archive):
+        """
+        Get the transitive dependencies of a package archive.
+
+        :param archive: The filename of a package archive in the graph (a
+                        string) or a :class:`.PackageFile` object.
+        :returns: A sorted list of :class:`.PackageFile` objects (the given
+                  package archive is not included).
+        """
+        return self.get_archives(self.traverse(self.get_filename(archive), self.edges))
+
+    def reverse_dependencies(self, archive, transitive=False):
+        """
+        Get the package archives that depend on a package archive.
+
+        :param archive: The filename of a package archive in the graph (a
+                        string) or a :class:`.PackageFile` object.
+        :param transitive: :data:`True` to include indirect reverse
+                           dependencies, :data:`False` to include only direct
+                           reverse dependencies (the default).
+        :returns: A sorted list of :class:`.PackageFile` objects.
+        """
+        filename = self.get_filename(archive)
+        reverse_edges = self.reverse_edges
+        if transitive:
+            return self.get_archives(self.traverse(filename, reverse_edges))
+        else:
+            return self.get_archives(reverse_edges.get(filename, ()))
+
+    def traverse(self, filename, edges):
+        """Helper for :func:`closure()` and :func:`reverse_dependencies()` to follow edges."""
+        visited = set([filename])
+        pending = [filename]
+        while pending:
+            for target in edges.get(pending.pop(), ()):
+                if target not in visited:
+                    visited.add(target)
+                    pending.append(target)
+        visited.discard(filename)
+        return visited
+
+    def get_filename(self, archive):
+        """
+        Get the filename of a package archive in the graph.
+
+        :param archive: The filename of a package archive (a string) or a
+                        :class:`.PackageFile` object.
+        :returns: The absolute pathname of the package archive (a string).
+        :raises: :exc:`~exceptions.KeyError` when the package archive isn't
+                 part of the graph.
+        """
+        filename = parse_filename(archive).filename
+        if filename not in self.nodes:
+            msg = "Package archive %s is not part of the dependency graph of %s!"
+            raise KeyError(msg % (filename, self.directory))
+        return filename
+
+    def get_archives(self, filenames):
+        """Get a sorted list of :class:`.PackageFile` objects for the given filenames."""
+        return sorted(self.nodes[fn].archive for fn in filenames)
+
+    def to_dict(self):
+        """
+        Convert the dependency graph to a data structure of builtin types.
+
+        :returns: A dictionary with the keys ``directory``, ``nodes`` and
+                  ``edges``. Nodes are identified by the basename of the
+                  package archive and edges are represented as lists with
+                  two basenames (the depending and the depended upon package
+                  archive).
+        """
+        nodes = []
+        edges = []
+        for filename in sorted(self.nodes):
+            archive = self.nodes[filename].archive
+            nodes.append(dict(
+                id=os.path.basename(filename),
+                name=archive.name,
+                version=str(archive.version),
+                architecture=archive.architecture,
+            ))
+            for target in sorted(self.edges.get(filename, ())):
+                edges.append([os.path.basename(filename), os.path.basename(target)])
+        return dict(directory=self.directory, nodes=nodes, edges=edges)
+
+    def to_json(self):
+        """
+        Export the dependency graph in the JSON format.
+
+        :returns: A string with the result of :func:`to_dict()` encoded as JSON.
+        """
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def to_dot(self):
+        """
+        Export the dependency graph in the DOT format used by Graphviz_.
+
+        :returns: A string containing a ``digraph`` definition.
+
+        .. _Graphviz: https://graphviz.org/
+        """
+        # Package names, versions and archive filenames can't contain double
+        # quotes or backslashes so we don't need to escape them here.
+        data = self.to_dict()
+        lines = ['digraph dependencies {']
+        for node in data['nodes']:
+            lines.append('  "%s" [label="%s\\n%s"];' % (node['id'], node['name'], node['version']))
+        for source, target in data['edges']:
+            lines.append('  "%s" -> "%s";' % (source, target))
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+
+class GraphNode(collections.namedtuple('GraphNode', 'archive, last_modified, names, relationships')):
+
+    """
+    A named tuple representing a package archive in a :class:`DependencyGraph`.
+
+    .. attribute:: archive
+
+       The package archive (a :class:`.PackageFile` object).
+
+    .. attribute:: last_modified
+
+       The last modified time of the package archive when it was scanned (a
+       number).
+
+    .. attribute:: names
+
+       The package names referenced by the dependencies of the package archive
+       (a :class:`frozenset` of strings).
+
+    .. attribute:: relationships
+
+       The relationships parsed from the dependency fields of the package
+       archive (a tuple of relationship objects, refer to the
+       :mod:`deb_pkg_tools.deps` module).
+    """
@@ -0,0 +1,261 @@
+# Debian packaging tools: Random access to Packages files.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 18, 2026
+# URL: https://github.com/xolox/python-deb-pkg-tools
+
+"""
+Random access to the paragraphs in ``Packages`` files.
+
+Looking up the control fields of a single package in a big ``Packages`` file
+normally means parsing the whole file. The :mod:`deb_pkg_tools.offsets`
+module avoids this using a byte offset index:
+
+- :func:`build_offsets_index()` scans a ``Packages`` file once and records
+  the byte offsets of each paragraph keyed by the `Package`, `Version` and
+  `Architecture` fields. The index is persisted as JSON in a file next to the
+  ``Packages`` file (see :data:`OFFSETS_SUFFIX`).
+
+- :class:`PackagesIndex` loads the index (rebuilding it when it's missing or
+  stale), memory maps the ``Packages`` file and parses only the paragraphs
+  that are requested.
+
+Because the index refers to byte offsets it only works for uncompressed
+``Packages`` files.
+"""
+
+# Standard library modules.
+import collections
+import io
+import json
+import logging
+import mmap
+import os
+
+# External dependencies.
+from humanfriendly import Timer, format_path
+from humanfriendly.text import pluralize
+
+# Modules included in our package.
+from deb_pkg_tools.compat import replace
+from deb_pkg_tools.deb822 import parse_deb822
+
+# Public identifiers that require documentation.
+__all__ = (
+    "INDEX_FORMAT_REVISION",
+    "KEY_FIELDS",
+    "OFFSETS_SUFFIX",
+    "PackagesIndex",
+    "build_offsets_index",
+    "get_offsets_file",
+    "load_offsets_index",
+    "logger",
+)
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_REVISION = 1
+"""The version of the format of offset index files (an integer)."""
+
+KEY_FIELDS = (b'package', b'version', b'architecture')
+"""The (lowercase) names of the fields used to key paragraphs (a tuple of byte strings)."""
+
+OFFSETS_SUFFIX = '.offsets'
+"""The filename suffix of offset index files (a string, e.g. ``Packages.offsets``)."""
+
+
+def build_offsets_index(packages_file, offsets_file=None):
+    """
+    Build and save the byte offset index of a ``Packages`` file.
+
+    :param packages_file: The pathname of an uncompressed ``Packages`` file (a string).
+    :param offsets_file: The pathname of the index file (a string, defaults
+                         to the result of :func:`get_offsets_file()`).
+    :returns: The index (a dictionary).
+
+    The file is scanned line by line without parsing the paragraphs, only the
+    fields in :data:`KEY_FIELDS` are extracted. The index is written to a
+    temporary file that's renamed into place, so readers never see a
+    partially written index.
+    """
+    timer = Timer()
+    offsets_file = offsets_file or get_offsets_file(packages_file)
+    entries = []
+    with io.open(packages_file, 'rb') as handle:
+        stat = os.fstat(handle.fileno())
+        offset = 0
+        start = None
+        fields = {}
+        for line in handle:
+            if not line.strip():
+                if start is not None:
+                    entries.append(make_entry(fields, start, offset))
+                    start = None
+                    fields = {}
+            else:
+                if start is None:
+                    start = offset
+                if not line.startswith((b' ', b'\t', b'#')):
+                    name, _, value = line.partition(b':')
+                    name = name.strip().lower()
+                    if name in KEY_FIELDS:
+                        fields[name] = value.strip().decode('UTF-8')
+            offset += len(line)
+        if start is not None:
+            entries.append(make_entry(fields, start, offset))
+    index = dict(
+        revision=INDEX_FORMAT_REVISION,
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        entries=entries,
+    )
+    temporary_file = '%s.tmp-%i' % (offsets_file, os.getpid())
+    with io.open(temporary_file, 'w', encoding='UTF-8') as handle:
+        handle.write(json.dumps(index, separators=(',', ':')))
+    replace(temporary_file, offsets_file)
+    logger.debug("Indexed %s in %s in %s.", pluralize(len(entries), "paragraph"), format_path(packages_file), timer)
+    return index
+
+
+def make_entry(fields, start, end):
+    """Helper for :func:`build_offsets_index()` to create an index entry (a list)."""
+    return [fields.get(b'package'), fields.get(b'version'), fields.get(b'architecture'), start, end - start]
+
+
+def get_offsets_file(packages_file):
+    """
+    Get the pathname of the offset index of a ``Packages`` file.
+
+    :param packages_file: The pathname of a ``Packages`` file (a string).
+    :returns: The pathname of the index file (a string).
+    """
+    return packages_file + OFFSETS_SUFFIX
+
+
+def load_offsets_index(packages_file, offsets_file=None):
+    """
+    Load the byte offset index of a ``Packages`` file, rebuilding it when necessary.
+
+    :param packages_file: The pathname of an uncompressed ``Packages`` file (a string).
+    :param offsets_file: The pathname of the index file (a string, defaults
+                         to the result of :func:`get_offsets_file()`).
+    :returns: The index (a dictionary).
+
+    The index is rebuilt using :func:`build_offsets_index()` when the index
+    file doesn't exist, can't be parsed or when the size or last modified
+    time of the ``Packages`` file doesn't match the index.
+    """
+    offsets_file = offsets_file or get_offsets_file(packages_file)
+    try:
+        with io.open(offsets_file, encoding='UTF-8') as handle:
+            index = json.load(handle)
+        stat = os.stat(packages_file)
+        if (index.get('revision') == INDEX_FORMAT_REVISION and
+                index.get('size') == stat.st_size and
+                index.get('mtime') == stat.st_mtime):
+            return index
+        logger.debug("Offset index %s is stale, rebuilding it ..", format_path(offsets_file))
+    except (EnvironmentError, ValueError):
+        logger.debug("Offset index %s is missing or corrupt, rebuilding it ..", format_path(offsets_file))
+    return build_offsets_index(packages_file, offsets_file)
+
+
+class PackagesIndex(object):
+
+    """
+    Memory mapped random access to the paragraphs in a ``Packages`` file.
+
+    Here's an example:
+
+    >>> from deb_pkg_tools.offsets import PackagesIndex
+    >>> with PackagesIndex('/var/lib/apt/lists/deb.debian.org_debian_dists_buster_main_binary-amd64_Packages') as index:
+    ...     fields = index.get('bash', '5.0-4', 'amd64')
+    ...     print(fields['Maintainer'])
+    Matthias Klose <doko@debian.org>
+
+    Lookups take constant time and only the requested paragraphs are parsed
+    (using :func:`.parse_deb822()`).
+    """
+
+    def __init__(self, packages_file, offsets_file=None):
+        """
+        Initialize a :class:`PackagesIndex` object.
+
+        :param packages_file: The pathname of an uncompressed ``Packages`` file (a string).
+        :param offsets_file: The pathname of the index file (a string, defaults
+                             to the result of :func:`get_offsets_file()`).
+        """
+        self.packages_file = packages_file
+        self.offsets = {}
+        self.names = collections.defaultdict(list)
+        for package, version, architecture, start, length in load_offsets_index(packages_file, offsets_file)['entries']:
+            key = (package, version, architecture)
+            self.offsets[key] = (start, length)
+            self.names[package].append(key)
+        self.handle = io.open(packages_file, 'rb')
+        try:
+            self.mapping = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be memory mapped.
+            self.mapping = b''
+
+    def get(self, package, version, architecture):
+        """
+        Get the control fields of a specific package.
+
+        :param package: The name of the package (a string).
+        :param version: The version of the package (a string).
+        :param architecture: The architecture of the package (a string).
+        :returns: A :class:`.Deb822` object or :data:`None` when the package
+                  isn't present in the ``Packages`` file.
+        """
+        offsets = self.offsets.get((package, version, architecture))
+        if offsets:
+            return self.parse(*offsets)
+
+    def find(self, package):
+        """
+        Get the control fields of all versions and architectures of a package.
+
+        :param package: The name of the package (a string).
+        :returns: A list of :class:`.Deb822` objects (in the order of the
+                  ``Packages`` file).
+        """
+        return [self.parse(*self.offsets[key]) for key in self.names.get(package, [])]
+
+    def parse(self, start, length):
+        """
+        Parse the paragraph at the given byte offset.
+
+        :param start: The byte offset of the start of the paragraph (an integer).
+        :param length: The length of the paragraph in bytes (an integer).
+        :returns: A :class:`.Deb822` object.
+        """
+        return parse_deb822(self.mapping[start:start + length], filename=self.packages_file)
+
+    def close(self):
+        """Release the memory map and the file handle."""
+        if isinstance(self.mapping, mmap.mmap):
+            self.mapping.close()
+        self.handle.close()
+
+    def __contains__(self, key):
+        """Check whether a (package, version, architecture) tuple is present in the index."""
+        return key in self.offsets
+
+    def __iter__(self):
+        """Iterate over the (package, version, architecture) tuples in the index."""
+        return iter(self.offsets)
+
+    def __len__(self):
+        """Get the number of paragraphs in the index."""
+        return len(self.offsets)
+
+    def __enter__(self):
+        """Enable the use of :class:`PackagesIndex` as a context manager."""
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+        """Release the memory map and the file handle."""
+        self.close()
@@ -1,16 +1,18 @@
 # Debian packaging tools: Package manipulation.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: May 11, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """Functions to build and inspect Debian binary package archives (``*.deb`` files)."""
 
 # Standard library modules.
+import bisect
 import collections
 import copy
 import fnmatch
 import logging
+import operator
 import os
 import os.path
 import pipes
@@ -28,8 +30,10 @@ from humanfriendly.terminal.spinners import Spinner
 # Modules included in our package.
 from deb_pkg_tools.deb822 import parse_deb822
 from deb_pkg_tools.control import parse_control_fields, patch_control_file
+from deb_pkg_tools.deps import AlternativeRelationship, VersionedRelationship
 from deb_pkg_tools.utils import makedirs
-from deb_pkg_tools.version import Version
+from deb_pkg_tools import version
+from deb_pkg_tools.version import Version, max_version, sort_versions, version_sort_key
 
 # Public identifiers that require documentation.
 __all__ = (
@@ -48,6 +52,8 @@ __all__ = (
     "PackageFile",
     "ROOT_GROUP",
     "ROOT_USER",
+    "VersionIndex",
+    "archive_sort_key",
     "build_package",
     "clean_package_tree",
     "collect_related_packages",
@@ -62,6 +68,7 @@ __all__ = (
     "inspect_package",
     "inspect_package_contents",
     "inspect_package_fields",
+    "intersect_intervals",
     "is_binary_file",
     "logger",
     "match_relationships",
@@ -377,7 +384,7 @@ def find_package_archives(directory, cache=None):
     return archives
 
 
-def collect_related_packages(filename, strict=None, cache=None, interactive=None):
+def collect_related_packages(filename, strict=None, cache=None, interactive=None, architecture=None):
     """
     Collect the package archive(s) related to the given package archive.
 
@@ -388,6 +395,10 @@ def collect_related_packages(filename, strict=None, cache=None, interactive=None
                         :data:`False` to skip the interactive spinner or
                         :data:`None` to detect whether we're connected to an
                         interactive terminal.
+    :param architecture: The target architecture used to evaluate architecture
+                         restrictions in relationships (a string). Defaults to
+                         the architecture of the given package archive (unless
+                         that is ``all``).
     :returns: A list of :class:`PackageFile` objects.
 
     This works by parsing and resolving the dependencies of the given package
@@ -437,6 +448,8 @@ def collect_related_packages(filename, strict=None, cache=None, interactive=None
        2014-05-18 08:33:44 deb_pkg_tools.cli INFO Done! Copied 5 package archives to /tmp.
     """
     given_archive = parse_filename(filename, cache)
+    if architecture is None and given_archive.architecture != 'all':
+        architecture = given_archive.architecture
     logger.info("Collecting packages related to %s ..", format_path(given_archive.filename))
     # Group the related package archive candidates by name.
     candidate_archives = collections.defaultdict(list)
@@ -446,14 +459,17 @@ def collect_related_packages(filename, strict=None, cache=None, interactive=None
     # Sort the related package archive candidates by descending versions
     # because we want to prefer newer versions over older versions.
     for name in candidate_archives:
-        candidate_archives[name].sort(reverse=True)
+        candidate_archives[name] = sort_versions(
+            sorted(candidate_archives[name], key=archive_sort_key, reverse=True),
+            key=operator.attrgetter('version'), reverse=True,
+        )
     # Prepare for more than one attempt to find a converging set of related
     # package archives so we can properly deal with conflicts between
     # transitive (indirect) dependencies.
     while True:
         try:
             # Assuming there are no possible conflicts one call will be enough.
-            return collect_related_packages_helper(candidate_archives, given_archive, cache, interactive)
+            return collect_related_packages_helper(candidate_archives, given_archive, cache, interactive, architecture)
         except CollectedPackagesConflict as e:
             # If we do encounter conflicts we take the brute force approach of
             # removing the conflicting package archive(s) from the set of
@@ -469,11 +485,14 @@ def collect_related_packages(filename, strict=None, cache=None, interactive=None
                         pluralize(len(e.conflicts), "conflicting archive"))
 
 
-def collect_related_packages_helper(candidate_archives, given_archive, cache, interactive):
+def collect_related_packages_helper(candidate_archives, given_archive, cache, interactive, architecture=None):
     """Internal helper for package collection to enable simple conflict resolution."""
     # Enable mutation of the candidate archives data structure inside the scope
     # of this function without mutating the original data structure.
     candidate_archives = copy.deepcopy(candidate_archives)
+    # Index the candidates by version so that we can select the newest
+    # version that satisfies the relationships using binary search.
+    index = VersionIndex(archive for archives in candidate_archives.values() for archive in archives)
     # Prepare some internal state.
     archives_to_scan = [given_archive]
     collected_archives = []
@@ -491,46 +510,40 @@ def collect_related_packages_helper(candidate_archives, given_archive, cache, in
                     relationship_sets.add(control_fields[field_name])
             # For each group of package archives sharing the same package name ..
             for package_name in sorted(candidate_archives):
-                # For each version of the package ..
-                for package_archive in list(candidate_archives[package_name]):
-                    package_matches = match_relationships(package_archive, relationship_sets)
-                    spinner.step()
-                    if package_matches is True:
-                        logger.debug("Package archive matched all relationships: %s", package_archive.filename)
-                        # Move the selected version of the package archive from the
-                        # candidates to the list of selected package archives.
-                        collected_archives.append(package_archive)
-                        # Prepare to scan and collect dependencies of the selected
-                        # package archive in a future iteration of the outermost
-                        # (while) loop.
-                        archives_to_scan.append(package_archive)
-                        # Ignore all other versions of the package inside this call
-                        # to collect_related_packages_helper().
-                        candidate_archives.pop(package_name)
-                        # Break out of the loop to avoid scanning other versions of
-                        # this package archive; we've made our choice now.
-                        break
-                    elif package_matches is False:
-                        # If we're sure we can exclude this version of the package
-                        # from future iterations it could be worth it to speed up
-                        # the process on big repositories / dependency sets.
-                        candidate_archives[package_name].remove(package_archive)
-                        # Keep looking for a match in another version.
-                    elif package_matches is None:
-                        # Break out of the loop that scans multiple versions of the
-                        # same package because none of the relationship sets collected
-                        # so far reference the name of this package (this is intended
-                        # as a harmless optimization).
-                        break
+                # Find the versions of the package that satisfy the relationships.
+                matching_archives = index.find_matches(package_name, relationship_sets, architecture)
+                spinner.step()
+                if matching_archives:
+                    # Select the newest version of the package.
+                    package_archive = matching_archives[-1]
+                    logger.debug("Package archive matched all relationships: %s", package_archive.filename)
+                    # Move the selected version of the package archive from the
+                    # candidates to the list of selected package archives.
+                    collected_archives.append(package_archive)
+                    # Prepare to scan and collect dependencies of the selected
+                    # package archive in a future iteration of the outermost
+                    # (while) loop.
+                    archives_to_scan.append(package_archive)
+                    # Ignore all other versions of the package inside this call
+                    # to collect_related_packages_helper().
+                    candidate_archives.pop(package_name)
+                    index.discard(package_name)
+                elif matching_archives is not None:
+                    # None of the versions of the package satisfy the relationships
+                    # and because relationship sets are only ever added we can
+                    # exclude the package from future iterations (it could be worth
+                    # it to speed up the process on big repositories / dependency sets).
+                    candidate_archives[package_name] = []
+                    index.discard(package_name)
     # Check for conflicts in the collected set of related package archives.
-    conflicts = [a for a in collected_archives if not match_relationships(a, relationship_sets)]
+    conflicts = [a for a in collected_archives if not match_relationships(a, relationship_sets, architecture)]
     if conflicts:
         raise CollectedPackagesConflict(conflicts)
     else:
         return collected_archives
 
 
-def match_relationships(package_archive, relationship_sets):
+def match_relationships(package_archive, relationship_sets, architecture=None):
     """
     Internal helper for package collection to validate that all relationships are satisfied.
 
@@ -538,11 +551,12 @@ def match_relationships(package_archive, relationship_sets):
     that all relationships are satisfied while the set of related package
     archives is being collected and again afterwards to make sure that no
     previously drawn conclusions were invalidated by additionally collected
-    package archives.
+    package archives. The optional `architecture` argument is passed on to
+    :func:`~deb_pkg_tools.deps.RelationshipSet.matches()`.
     """
     archive_matches = None
     for relationships in relationship_sets:
-        status = relationships.matches(package_archive.name, package_archive.version)
+        status = relationships.matches(package_archive.name, package_archive.version, architecture)
         if status is True and archive_matches is not False:
             archive_matches = True
         elif status is False:
@@ -555,6 +569,184 @@ def match_relationships(package_archive, relationship_sets):
     return archive_matches
 
 
+class VersionIndex(object):
+
+    """
+    Index of package archives that answers relationship queries using binary search.
+
+    The package archives are grouped by package name and each group is sorted
+    by version (see :func:`.sort_versions()`). Each versioned relationship
+    then corresponds to a range of indexes in a group which can be found using
+    :mod:`bisect`, alternatives correspond to the union of such ranges and
+    relationship sets correspond to their intersection. This makes it possible
+    to find the archives that satisfy a set of relationships without
+    evaluating :func:`~deb_pkg_tools.deps.RelationshipSet.matches()` for
+    every version of a package.
+
+    Relationships whose architecture restrictions don't apply to the target
+    architecture are ignored. Relationships with architecture restrictions
+    (when no target architecture is given) and comparisons using ``dpkg
+    --compare-versions`` or python-apt (see :data:`.PREFER_DPKG` and
+    :data:`.PREFER_APT`) are evaluated using :func:`match_relationships()`
+    instead.
+    """
+
+    def __init__(self, archives=()):
+        """
+        Initialize a :class:`VersionIndex` object.
+
+        :param archives: An iterable of :class:`PackageFile` objects.
+        """
+        self.archives = {}
+        self.sort_keys = {}
+        grouped_archives = collections.defaultdict(list)
+        for archive in archives:
+            grouped_archives[archive.name].append(archive)
+        for name, archives in grouped_archives.items():
+            archives = sort_versions(sorted(archives, key=archive_sort_key), key=operator.attrgetter('version'))
+            self.archives[name] = archives
+            self.sort_keys[name] = [version_sort_key(a.version) for a in archives]
+
+    def discard(self, name):
+        """
+        Remove all versions of a package from the index.
+
+        :param name: The name of a package (a string).
+        """
+        self.archives.pop(name, None)
+        self.sort_keys.pop(name, None)
+
+    def find_matches(self, name, relationship_sets, architecture=None):
+        """
+        Find the versions of a package that satisfy the given relationships.
+
+        :param name: The name of a package (a string).
+        :param relationship_sets: An iterable of :class:`.RelationshipSet` objects.
+        :param architecture: The target architecture (a string, optional).
+        :returns: A list of :class:`PackageFile` objects sorted by ascending
+                  version (so the newest version comes last) or :data:`None`
+                  when none of the relationship sets reference the package.
+        """
+        archives = self.archives.get(name, [])
+        intervals = [(0, len(archives))]
+        referenced = False
+        for relationship_set in relationship_sets:
+            for relationship in relationship_set:
+                if name in relationship.names and self.applies(name, relationship, architecture):
+                    referenced = True
+                    matching_intervals = self.get_intervals(name, relationship, architecture)
+                    if matching_intervals is None:
+                        # Fall back to evaluating the relationships for each version.
+                        return [a for a in archives if match_relationships(a, relationship_sets, architecture)]
+                    intervals = intersect_intervals(intervals, matching_intervals)
+        if referenced:
+            return [archives[i] for start, end in intervals for i in range(start, end)]
+
+    def find_newest_match(self, name, relationship_sets, architecture=None):
+        """
+        Find the newest version of a package that satisfies the given relationships.
+
+        :param name: The name of a package (a string).
+        :param relationship_sets: An iterable of :class:`.RelationshipSet` objects.
+        :param architecture: The target architecture (a string, optional).
+        :returns: A :class:`PackageFile` object or :data:`None`.
+        """
+        matches = self.find_matches(name, relationship_sets, architecture)
+        return matches[-1] if matches else None
+
+    def applies(self, name, relationship, architecture=None):
+        """
+        Check whether a relationship that references a package applies to the target architecture.
+
+        :param name: The name of a package (a string).
+        :param relationship: A :class:`~deb_pkg_tools.deps.Relationship`,
+                             :class:`~deb_pkg_tools.deps.VersionedRelationship` or
+                             :class:`~deb_pkg_tools.deps.AlternativeRelationship` object.
+        :param architecture: The target architecture (a string or :data:`None`).
+        :returns: :data:`False` if none of the (alternative) relationships
+                  that reference the package apply to the target
+                  architecture, :data:`True` otherwise (this is always the
+                  case when no target architecture is given).
+        """
+        if architecture is None:
+            return True
+        if isinstance(relationship, AlternativeRelationship):
+            return any(r.applies_to(architecture) for r in relationship.relationships if name in r.names)
+        return relationship.applies_to(architecture)
+
+    def get_intervals(self, name, relationship, architecture=None):
+        """
+        Get the ranges of indexes of the versions that satisfy a relationship.
+
+        :param name: The name of a package (a string).
+        :param relationship: A :class:`~deb_pkg_tools.deps.Relationship`,
+                             :class:`~deb_pkg_tools.deps.VersionedRelationship` or
+                             :class:`~deb_pkg_tools.deps.AlternativeRelationship` object.
+        :param architecture: The target architecture (a string, optional).
+        :returns: A sorted list of non-overlapping (start, end) tuples or
+                  :data:`None` when the relationship can't be evaluated using
+                  binary search.
+        """
+        if isinstance(relationship, AlternativeRelationship):
+            intervals = []
+            for alternative in relationship.relationships:
+                if name in alternative.names and self.applies(name, alternative, architecture):
+                    alternative_intervals = self.get_intervals(name, alternative, architecture)
+                    if alternative_intervals is None:
+                        return None
+                    intervals.extend(alternative_intervals)
+            # Merge overlapping ranges to get the union.
+            merged = []
+            for start, end in sorted(intervals):
+                if merged and start <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+                elif start < end:
+                    merged.append((start, end))
+            return merged
+        if (relationship.architectures and architecture is None) or version.PREFER_DPKG or version.PREFER_APT:
+            return None
+        sort_keys = self.sort_keys.get(name, [])
+        if not isinstance(relationship, VersionedRelationship):
+            return [(0, len(sort_keys))]
+        key = version_sort_key(relationship.version)
+        if relationship.operator == '=':
+            return [(bisect.bisect_left(sort_keys, key), bisect.bisect_right(sort_keys, key))]
+        elif relationship.operator == '<<':
+            return [(0, bisect.bisect_left(sort_keys, key))]
+        elif relationship.operator in ('<', '<='):
+            return [(0, bisect.bisect_right(sort_keys, key))]
+        elif relationship.operator == '>>':
+            return [(bisect.bisect_right(sort_keys, key), len(sort_keys))]
+        elif relationship.operator in ('>', '>='):
+            return [(bisect.bisect_left(sort_keys, key), len(sort_keys))]
+        # Let match_relationships() report unsupported operators.
+        return None
+
+
+def intersect_intervals(a, b):
+    """
+    Intersect two sorted lists of non-overlapping (start, end) tuples.
+
+    :param a: A sorted list of non-overlapping (start, end) tuples.
+    :param b: A sorted list of non-overlapping (start, end) tuples.
+    :returns: A sorted list of non-overlapping (start, end) tuples.
+
+    Used by :class:`VersionIndex` to intersect ranges of versions.
+    """
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
 class CollectedPackagesConflict(Exception):
 
     """Exception raised by :func:`collect_related_packages_helper()`."""
@@ -581,14 +773,17 @@ def find_latest_version(packages, cache=None):
     :raises: :exc:`~exceptions.ValueError` when not all of the given package
              archives share the same package name.
 
-    This function uses :class:`.Version` objects for version comparison.
+    This function uses :func:`.max_version()` for version comparison.
     """
-    packages = sorted(parse_filename(fn, cache) for fn in packages)
+    packages = [parse_filename(fn, cache) for fn in packages]
     names = set(p.name for p in packages)
     if len(names) > 1:
         msg = "Refusing to compare unrelated packages! (%s)"
         raise ValueError(msg % concatenate(sorted(names)))
-    return packages[-1]
+    # When multiple archives share the highest version max_version() picks the
+    # first one, so we sort by descending architecture and filename to select
+    # the same archive that sorting by PackageFile tuples would select.
+    return max_version(sorted(packages, key=archive_sort_key, reverse=True), key=operator.attrgetter('version'))
 
 
 def group_by_latest_versions(packages, cache=None):
@@ -610,6 +805,18 @@ def group_by_latest_versions(packages, cache=None):
     return dict((n, find_latest_version(p, cache)) for n, p in grouped_packages.items())
 
 
+def archive_sort_key(archive):
+    """
+    Get a key to break ties between package archives that share the same version.
+
+    :param archive: A :class:`PackageFile` object.
+    :returns: A tuple with the architecture and filename of the archive.
+
+    Used by :func:`collect_related_packages()` and :func:`find_latest_version()`.
+    """
+    return (archive.architecture, archive.filename)
+
+
 def inspect_package(archive, cache=None):
     """
     Get the metadata and contents from a ``*.deb`` archive.
@@ -632,7 +839,8 @@ def inspect_package_fields(archive, cache=None):
     :param archive: The pathname of an existing ``*.deb`` archive.
     :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
     :returns: A dictionary with control file fields (the result of
-              :func:`.parse_control_fields()`).
+              :func:`.parse_control_fields()`). Relationship fields are
+              parsed lazily (see :class:`.LazyRelationshipSet`).
 
     Here's an example:
 
@@ -665,7 +873,7 @@ def inspect_package_fields(archive, cache=None):
         if value is not None:
             return value
     listing = execute('dpkg-deb', '-f', archive, logger=logger, capture=True)
-    fields = parse_control_fields(parse_deb822(listing, filename=archive))
+    fields = parse_control_fields(parse_deb822(listing, filename=archive), lazy=True)
     if cache:
         entry.set_value(fields)
     return fields
@@ -0,0 +1,294 @@
+# Debian packaging tools: Incremental index diffs.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 18, 2026
+# URL: https://github.com/xolox/python-deb-pkg-tools
+
+"""
+Incremental index diffs (PDiffs) for trivial repositories.
+
+When a ``Packages`` file is updated apt clients normally download the whole
+(compressed) file again. Repositories can avoid this by publishing ed style
+patches between successive versions of the ``Packages`` file in the
+``Packages.diff`` directory, together with an ``Index`` file that lists the
+patches (this is the format used by the Debian archive, see
+:man:`apt-ftparchive` and the ``Acquire::PDiffs`` option of :man:`apt.conf`).
+
+The :func:`update_pdiffs()` function is used by :func:`.update_repository()`
+to generate a patch each time the ``Packages`` file changes. Patches are
+computed per paragraph instead of per line (see :func:`diff_paragraphs()`),
+because the paragraphs in ``Packages`` files generated by
+:func:`.scan_packages()` are sorted this takes linear time.
+"""
+
+# Standard library modules.
+import gzip
+import hashlib
+import io
+import logging
+import os
+import shutil
+import time
+
+# External dependencies.
+from humanfriendly import format_path
+
+# Modules included in our package.
+from deb_pkg_tools.deb822 import parse_deb822
+from deb_pkg_tools.version import version_sort_key
+
+# Public identifiers that require documentation.
+__all__ = (
+    "PDIFF_HISTORY",
+    "diff_paragraphs",
+    "get_digest",
+    "get_paragraph_key",
+    "load_pdiff_history",
+    "logger",
+    "read_paragraphs",
+    "update_pdiffs",
+)
+
+PDIFF_HISTORY = int(os.environ.get('DPT_PDIFF_HISTORY', '20'))
+"""
+The maximum number of patches kept in the ``Packages.diff`` directory (an
+integer, defaults to 20). Clients whose ``Packages`` file is older than the
+oldest patch download the full ``Packages`` file instead. The environment
+variable ``$DPT_PDIFF_HISTORY`` can be used to control the value of this
+variable.
+"""
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+
+def update_pdiffs(old_file, new_file, diff_directory, previous_directory=None, history=None):
+    """
+    Generate the ``Packages.diff`` directory for a new ``Packages`` file.
+
+    :param old_file: The pathname of the currently published ``Packages``
+                     file (a string, the file doesn't have to exist).
+    :param new_file: The pathname of the new ``Packages`` file (a string).
+    :param diff_directory: The pathname of the ``Packages.diff`` directory to
+                           create (a string).
+    :param previous_directory: The pathname of the currently published
+                               ``Packages.diff`` directory (a string or
+                               :data:`None`). Patches listed in its ``Index``
+                               file are carried over.
+    :param history: The maximum number of patches to keep (an integer,
+                    defaults to :data:`PDIFF_HISTORY`).
+    :returns: The name of the new patch (a string) or :data:`None` when no
+              patch was generated.
+    """
+    if history is None:
+        history = PDIFF_HISTORY
+    if not os.path.isdir(diff_directory):
+        os.makedirs(diff_directory)
+    # Carry over the patches of previous updates.
+    entries = []
+    if previous_directory:
+        for entry in load_pdiff_history(previous_directory):
+            source = os.path.join(previous_directory, entry['name'] + '.gz')
+            if os.path.isfile(source):
+                target = os.path.join(diff_directory, entry['name'] + '.gz')
+                try:
+                    os.link(source, target)
+                except OSError:
+                    shutil.copy(source, target)
+                entries.append(entry)
+    # Generate a patch from the old to the new file?
+    patch_name = None
+    new_digest, new_size = get_digest(new_file)
+    if os.path.isfile(old_file):
+        old_digest, old_size = get_digest(old_file)
+        if old_digest != new_digest:
+            patch_name = time.strftime('%Y-%m-%d-%H%M.%S', time.gmtime())
+            existing_names = set(entry['name'] for entry in entries)
+            while patch_name in existing_names:
+                patch_name += '.1'
+            script = diff_paragraphs(read_paragraphs(old_file), read_paragraphs(new_file))
+            compressed_file = os.path.join(diff_directory, patch_name + '.gz')
+            with open(compressed_file, 'wb') as handle:
+                # Use a fixed modification time to keep the output reproducible.
+                with gzip.GzipFile(filename='', mode='wb', fileobj=handle, mtime=0) as compressed:
+                    compressed.write(script)
+            logger.debug("Generated patch %s (%i bytes).", format_path(compressed_file), len(script))
+            entries.append(dict(
+                name=patch_name,
+                history=(old_digest, old_size),
+                patch=(hashlib.sha256(script).hexdigest(), len(script)),
+                download=get_digest(compressed_file),
+            ))
+    # Discard the oldest patches.
+    for entry in entries[:-history] if history > 0 else entries:
+        os.unlink(os.path.join(diff_directory, entry['name'] + '.gz'))
+    entries = entries[-history:] if history > 0 else []
+    # Generate the `Index' file.
+    lines = [u"SHA256-Current: %s %i" % (new_digest, new_size)]
+    for field, key, suffix in (('SHA256-History', 'history', ''),
+                               ('SHA256-Patches', 'patch', ''),
+                               ('SHA256-Download', 'download', '.gz')):
+        lines.append(u"%s:" % field)
+        for entry in entries:
+            digest, size = entry[key]
+            lines.append(u" %s %i %s%s" % (digest, size, entry['name'], suffix))
+    with io.open(os.path.join(diff_directory, 'Index'), 'w', encoding='UTF-8') as handle:
+        handle.write(u"\n".join(lines) + u"\n")
+    return patch_name
+
+
+def load_pdiff_history(directory):
+    """
+    Load the patches listed in the ``Index`` file of a ``Packages.diff`` directory.
+
+    :param directory: The pathname of a ``Packages.diff`` directory (a string).
+    :returns: A list of dictionaries (one for each patch, oldest first) with
+              the keys ``name``, ``history``, ``patch`` and ``download``. The
+              values of the last three keys are tuples with a SHA256 digest
+              (a string) and a size (an integer). When the ``Index`` file
+              doesn't exist an empty list is returned.
+    """
+    try:
+        with open(os.path.join(directory, 'Index'), 'rb') as handle:
+            fields = parse_deb822(handle.read())
+    except EnvironmentError:
+        return []
+    entries = {}
+    names = []
+    for field, key in (('SHA256-History', 'history'), ('SHA256-Patches', 'patch'), ('SHA256-Download', 'download')):
+        for line in fields.get(field, u'').splitlines():
+            tokens = line.split()
+            if len(tokens) == 3:
+                digest, size, name = tokens
+                if key == 'download' and name.endswith('.gz'):
+                    name = name[:-3]
+                if name not in entries:
+                    entries[name] = dict(name=name)
+                    names.append(name)
+                entries[name][key] = (digest, int(size))
+    return [entries[n] for n in names if all(k in entries[n] for k in ('history', 'patch', 'download'))]
+
+
+def read_paragraphs(filename):
+    """
+    Split a ``Packages`` file into paragraphs without parsing them.
+
+    :param filename: The pathname of a ``Packages`` file (a string).
+    :returns: A list of paragraphs, each paragraph is a tuple with the lines
+              of the paragraph, including the trailing empty line (byte
+              strings without line endings).
+    """
+    paragraphs = []
+    lines = []
+    with open(filename, 'rb') as handle:
+        for line in handle:
+            line = line.rstrip(b'\r\n')
+            lines.append(line)
+            if not line.strip():
+                paragraphs.append(tuple(lines))
+                lines = []
+    if lines:
+        paragraphs.append(tuple(lines))
+    return paragraphs
+
+
+def get_paragraph_key(lines):
+    """
+    Get the sort key of a paragraph in a ``Packages`` file.
+
+    :param lines: A sequence of byte strings with the lines of the paragraph.
+    :returns: A tuple with the package name, the version sort key (see
+              :func:`.version_sort_key()`), the architecture and filename
+              (the same key as :func:`.packages_sort_key()`).
+    """
+    fields = {}
+    for line in lines:
+        if line and not line.startswith((b' ', b'\t')):
+            name, _, value = line.partition(b':')
+            fields[name.strip().lower()] = value.strip().decode('UTF-8')
+    return (
+        fields.get(b'package', u''),
+        version_sort_key(fields.get(b'version', u'0')),
+        fields.get(b'architecture', u''),
+        fields.get(b'filename', u''),
+    )
+
+
+def diff_paragraphs(old_paragraphs, new_paragraphs):
+    """
+    Generate an ed script that transforms one list of paragraphs into another.
+
+    :param old_paragraphs: The paragraphs of the old ``Packages`` file (the
+                           result of :func:`read_paragraphs()`).
+    :param new_paragraphs: The paragraphs of the new ``Packages`` file (the
+                           result of :func:`read_paragraphs()`).
+    :returns: The ed script (a byte string).
+
+    The paragraphs are aligned by merging the two lists on their sort keys
+    (see :func:`get_paragraph_key()`), which takes linear time when the lists
+    are sorted (otherwise the script is still correct but bigger than
+    necessary). Sort keys are only computed for paragraphs that changed. Just
+    like ``diff --ed`` the commands are emitted in reverse order, so that the
+    line numbers of each command refer to the old file.
+    """
+    hunks = []
+    current = None
+    old_line = 0
+    i = j = 0
+    while i < len(old_paragraphs) or j < len(new_paragraphs):
+        old_lines = old_paragraphs[i] if i < len(old_paragraphs) else None
+        new_lines = new_paragraphs[j] if j < len(new_paragraphs) else None
+        if old_lines == new_lines:
+            # Unchanged paragraph.
+            current = None
+            old_line += len(old_lines)
+            i += 1
+            j += 1
+            continue
+        if current is None:
+            # Start a new hunk: [first old line, last old line, new lines].
+            current = [old_line, old_line, []]
+            hunks.append(current)
+        if old_lines is not None and new_lines is not None:
+            old_key = get_paragraph_key(old_lines)
+            new_key = get_paragraph_key(new_lines)
+        if new_lines is None or (old_lines is not None and old_key <= new_key):
+            # Delete (or replace) the old paragraph.
+            old_line += len(old_lines)
+            current[1] = old_line
+            i += 1
+            if new_lines is not None and old_key == new_key:
+                current[2].extend(new_lines)
+                j += 1
+        else:
+            # Insert the new paragraph.
+            current[2].extend(new_lines)
+            j += 1
+    commands = []
+    for start, end, lines in reversed(hunks):
+        if start == end:
+            commands.append(b'%ia' % start)
+        elif not lines:
+            commands.append(b'%i,%id' % (start + 1, end))
+            continue
+        else:
+            commands.append(b'%i,%ic' % (start + 1, end))
+        commands.extend(lines)
+        commands.append(b'.')
+    return b''.join(command + b'\n' for command in commands)
+
+
+def get_digest(filename):
+    """
+    Get the SHA256 digest and size of a file.
+
+    :param filename: The pathname of a file (a string).
+    :returns: A tuple with the hexadecimal digest (a string) and the size (an integer).
+    """
+    context = hashlib.sha256()
+    size = 0
+    with open(filename, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 64), b''):
+            context.update(chunk)
+            size += len(chunk)
+    return context.hexdigest(), size
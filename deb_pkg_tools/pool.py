@@ -0,0 +1,340 @@
+# Debian packaging tools: Pool based repositories.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 18, 2026
+# URL: https://github.com/xolox/python-deb-pkg-tools
+
+"""
+Create and update repositories with a ``pool`` / ``dists`` layout.
+
+The :func:`.update_repository()` function generates `trivial repositories`
+where the package archives and the indexes live in the same directory. The
+:func:`update_pool_repository()` function generates the structured layout
+used by the Debian archive instead:
+
+- The package archives live in the ``pool`` directory. Archives in a
+  subdirectory of ``pool`` belong to the component named after the
+  subdirectory (e.g. ``pool/main/f/foo/foo_1.0_all.deb``), archives directly
+  in ``pool`` belong to :data:`DEFAULT_COMPONENT`.
+
+- Each suite has its own indexes in ``dists/<suite>/<component>/binary-<arch>/``
+  and its own ``Release`` file in ``dists/<suite>``.
+
+The same package archive can be published in several suites, the paragraph
+of each archive is generated once and reused for all suites.
+"""
+
+# Standard library modules.
+import collections
+import filecmp
+import fnmatch
+import gzip
+import io
+import logging
+import os
+import shutil
+import tempfile
+
+# External dependencies.
+from humanfriendly import Timer, format_path
+from humanfriendly.text import concatenate, pluralize
+
+# Modules included in our package.
+from deb_pkg_tools.control import unparse_control_fields
+from deb_pkg_tools.deb822 import Deb822Writer
+from deb_pkg_tools.package import inspect_package_fields, parse_filename
+from deb_pkg_tools.repo import (
+    METADATA_DIRECTORY,
+    PACKAGES_FIELD_ORDER,
+    generate_release,
+    get_packages_entry,
+    get_release_fields,
+    is_release_published,
+    packages_sort_key,
+    replace_symlink,
+    select_gpg_key,
+)
+from deb_pkg_tools.utils import atomic_lock, find_debian_architecture, makedirs
+
+# Public identifiers that require documentation.
+__all__ = (
+    "DEFAULT_COMPONENT",
+    "DISTS_DIRECTORY",
+    "POOL_DIRECTORY",
+    "PoolArchive",
+    "find_pool_archives",
+    "generate_suite",
+    "is_suite_published",
+    "logger",
+    "publish_suite",
+    "update_pool_repository",
+)
+
+DEFAULT_COMPONENT = 'main'
+"""The component of package archives directly in the ``pool`` directory (a string)."""
+
+DISTS_DIRECTORY = 'dists'
+"""The name of the directory that contains the indexes of the suites (a string)."""
+
+POOL_DIRECTORY = 'pool'
+"""The name of the directory that contains the package archives (a string)."""
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+
+def update_pool_repository(directory, suites, architectures=None, release_fields={}, gpg_key=None, cache=None):
+    """
+    Create or update a repository with a ``pool`` / ``dists`` layout.
+
+    :param directory: The pathname of the repository (a string). The package
+                      archives are expected in the :data:`POOL_DIRECTORY`.
+    :param suites: A dictionary with suite names (strings) as keys and lists
+                   of :mod:`fnmatch` patterns as values. An archive is
+                   published in a suite when its pathname relative to the
+                   :data:`POOL_DIRECTORY` matches one of the patterns of
+                   the suite (e.g. ``{'stable': ['main/*'], 'unstable':
+                   ['*']}``).
+    :param architectures: A list of architectures (strings) for which indexes
+                          are generated. Defaults to the architectures of the
+                          archives in the pool (or the current architecture
+                          when all archives have the architecture ``all``).
+    :param release_fields: An optional dictionary with fields to set inside
+                           the ``Release`` files (see :func:`.get_release_fields()`).
+    :param gpg_key: The :class:`.GPGKey` object used to sign the ``Release``
+                    files. Defaults to the result of :func:`.select_gpg_key()`.
+    :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    :returns: A list with the names of the suites whose indexes changed.
+    :raises: :exc:`.ResourceLockedException` when the given repository
+             directory is being updated by another process.
+
+    The paragraphs of the archives in the pool are generated once (using
+    :func:`.inspect_package_fields()` and :func:`.get_packages_entry()`)
+    and shared by all suites, so publishing N suites doesn't require N scans
+    of the pool. Each suite is generated by :func:`generate_suite()` and
+    published by :func:`publish_suite()`.
+    """
+    with atomic_lock(directory):
+        timer = Timer()
+        gpg_key = gpg_key or select_gpg_key(directory)
+        archives = find_pool_archives(directory, cache=cache)
+        if not architectures:
+            architectures = sorted(set(a.architecture for a in archives) - set(['all'])) or [find_debian_architecture()]
+        logger.info("Updating %s of repository %s (%s) ..",
+                    pluralize(len(suites), "suite"), format_path(directory),
+                    pluralize(len(archives), "package archive"))
+        # Generate the paragraphs of the package archives once.
+        paragraphs = {}
+        for archive in archives:
+            fields = dict(inspect_package_fields(archive.filename, cache=cache))
+            fields.update(get_packages_entry(archive.filename, cache=cache))
+            fields['Filename'] = '/'.join((POOL_DIRECTORY, archive.pathname))
+            paragraphs[archive.pathname] = unparse_control_fields(fields)
+        # Generate and publish the suites.
+        metadata_directory = os.path.join(directory, METADATA_DIRECTORY)
+        makedirs(metadata_directory)
+        changed = []
+        for suite, patterns in sorted(suites.items()):
+            selected = [a for a in archives if any(fnmatch.fnmatch(a.pathname, p) for p in patterns)]
+            stage_directory = tempfile.mkdtemp(prefix='dists-%s-' % suite.replace('/', '_'), dir=metadata_directory)
+            published = False
+            try:
+                generate_suite(stage_directory, suite, selected, paragraphs, architectures)
+                published = publish_suite(directory, suite, stage_directory, release_fields, gpg_key)
+            finally:
+                if not published:
+                    shutil.rmtree(stage_directory)
+            if published:
+                changed.append(suite)
+        logger.info("Finished updating repository in %s (changed suites: %s).",
+                    timer, concatenate(changed) if changed else "none")
+        return changed
+
+
+def find_pool_archives(directory, cache=None):
+    """
+    Find the package archives in the pool of a repository.
+
+    :param directory: The pathname of the repository (a string).
+    :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    :returns: A sorted list of :class:`PoolArchive` objects.
+    """
+    pool_directory = os.path.join(directory, POOL_DIRECTORY)
+    archives = []
+    for root, dirs, files in os.walk(pool_directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith('.deb'):
+                pathname = os.path.join(root, filename)
+                relative_path = os.path.relpath(pathname, pool_directory).replace(os.sep, '/')
+                component = relative_path.split('/')[0] if '/' in relative_path else DEFAULT_COMPONENT
+                package = parse_filename(pathname, cache)
+                archives.append(PoolArchive(
+                    name=package.name,
+                    version=package.version,
+                    architecture=package.architecture,
+                    filename=pathname,
+                    pathname=relative_path,
+                    component=component,
+                ))
+    return archives
+
+
+def generate_suite(directory, suite, archives, paragraphs, architectures):
+    """
+    Generate the indexes of a suite.
+
+    :param directory: The pathname of the directory where the indexes are
+                      generated (a string, this directory becomes
+                      ``dists/<suite>``).
+    :param suite: The name of the suite (a string).
+    :param archives: The :class:`PoolArchive` objects in the suite (a list).
+    :param paragraphs: A dictionary with the paragraphs of the archives (the
+                       keys are :attr:`PoolArchive.pathname` values and the
+                       values are dictionaries with unparsed fields).
+    :param architectures: A list of architectures (strings).
+
+    One ``Packages`` and ``Packages.gz`` file is generated for each
+    combination of component and architecture, archives with the
+    architecture ``all`` are listed in the indexes of all architectures.
+    The paragraphs are sorted using :func:`.packages_sort_key()`.
+    """
+    components = sorted(set(a.component for a in archives)) or [DEFAULT_COMPONENT]
+    grouped = collections.defaultdict(list)
+    for archive in archives:
+        for architecture in (architectures if archive.architecture == 'all' else [archive.architecture]):
+            grouped[(archive.component, architecture)].append(paragraphs[archive.pathname])
+    for component in components:
+        for architecture in architectures:
+            index_directory = os.path.join(directory, component, 'binary-%s' % architecture)
+            makedirs(index_directory)
+            packages_file = os.path.join(index_directory, 'Packages')
+            selected = sorted(grouped.get((component, architecture), []), key=packages_sort_key)
+            with io.open(packages_file, 'wb', buffering=1024 * 1024) as handle:
+                writer = Deb822Writer(handle, field_order=PACKAGES_FIELD_ORDER)
+                for fields in selected:
+                    writer.write(fields)
+            with open(packages_file, 'rb') as source:
+                with open(packages_file + '.gz', 'wb') as handle:
+                    # Use a fixed modification time to keep the output reproducible.
+                    with gzip.GzipFile(filename='', mode='wb', fileobj=handle, mtime=0) as target:
+                        shutil.copyfileobj(source, target)
+            logger.debug("Wrote %s to %s.", pluralize(len(selected), "entry", "entries"),
+                         format_path(os.path.join(DISTS_DIRECTORY, suite, component, 'binary-%s' % architecture)))
+
+
+def publish_suite(directory, suite, stage_directory, release_fields={}, gpg_key=None):
+    """
+    Atomically publish the indexes of a suite.
+
+    :param directory: The pathname of the repository (a string).
+    :param suite: The name of the suite (a string).
+    :param stage_directory: The pathname of the directory with the indexes
+                            generated by :func:`generate_suite()` (a string).
+    :param release_fields: An optional dictionary with fields to set inside
+                           the ``Release`` file.
+    :param gpg_key: The :class:`.GPGKey` object used to sign the ``Release``
+                    file (or :data:`None`).
+    :returns: :data:`True` if the suite was published, :data:`False` if the
+              published indexes were already up to date.
+
+    ``dists/<suite>`` is a symbolic link to a directory inside the
+    :data:`.METADATA_DIRECTORY`, publishing a new version of the suite
+    replaces this symbolic link using :func:`.replace_symlink()`.
+    """
+    suite_link = os.path.join(directory, DISTS_DIRECTORY, suite)
+    # Get the fields to set inside the `Release' file of the suite.
+    components = sorted(e for e in os.listdir(stage_directory) if os.path.isdir(os.path.join(stage_directory, e)))
+    architectures = sorted(set(
+        e[len('binary-'):] for c in components for e in os.listdir(os.path.join(stage_directory, c))
+    ))
+    fields = get_release_fields(directory, release_fields)
+    fields.setdefault('suite', suite)
+    fields.setdefault('codename', suite)
+    fields.setdefault('components', ' '.join(components))
+    fields.setdefault('architectures', ' '.join(architectures))
+    if is_suite_published(suite_link, stage_directory, gpg_key, fields):
+        logger.info("Indexes of suite %s didn't change, skipping update.", suite)
+        return False
+    # Generate the `Release' file of the suite.
+    generate_release(stage_directory, fields, gpg_key)
+    # Make the stage directory readable for HTTP servers (mkdtemp() uses 0700).
+    os.chmod(stage_directory, 0o755)
+    # Replace the symbolic link (a directory created by other tools is removed first).
+    makedirs(os.path.dirname(suite_link))
+    previous_version = None
+    if os.path.islink(suite_link):
+        previous_version = os.path.realpath(suite_link)
+    elif os.path.isdir(suite_link):
+        shutil.rmtree(suite_link)
+    target = os.path.relpath(stage_directory, os.path.dirname(suite_link))
+    logger.debug("Publishing suite %s (%s) ..", suite, target)
+    replace_symlink(suite_link, target)
+    if previous_version and os.path.isdir(previous_version):
+        shutil.rmtree(previous_version)
+    return True
+
+
+def is_suite_published(suite_directory, stage_directory, gpg_key=None, release_fields=None):
+    """
+    Check whether the indexes of a suite have already been published.
+
+    :param suite_directory: The pathname of the published suite (a string).
+    :param stage_directory: The pathname of the generated suite (a string).
+    :param gpg_key: The :class:`.GPGKey` object used to sign the repository
+                    (or :data:`None`).
+    :param release_fields: A dictionary with the fields that should be set
+                           inside the ``Release`` file or :data:`None` to
+                           ignore the fields of the ``Release`` file.
+    :returns: :data:`True` if the ``Release`` file of the published suite is
+              up to date (see :func:`.is_release_published()`) and the
+              published suite contains the same ``Packages`` files as the
+              generated suite, :data:`False` otherwise.
+    """
+    if not is_release_published(suite_directory, gpg_key, release_fields):
+        return False
+    generated = find_packages_files(stage_directory)
+    if find_packages_files(suite_directory) != generated:
+        return False
+    return all(filecmp.cmp(os.path.join(stage_directory, fn), os.path.join(suite_directory, fn), shallow=False)
+               for fn in generated)
+
+
+def find_packages_files(directory):
+    """Find the ``Packages`` files of a suite (a set of relative pathnames)."""
+    return set(
+        os.path.relpath(os.path.join(root, 'Packages'), directory)
+        for root, dirs, files in os.walk(directory) if 'Packages' in files
+    )
+
+
+class PoolArchive(collections.namedtuple('PoolArchive', 'name, version, architecture, filename, pathname, component')):
+
+    """
+    A named tuple with the details of a package archive in a pool.
+
+    .. attribute:: name
+
+       The name of the package (a string).
+
+    .. attribute:: version
+
+       The version of the package (a :class:`.Version` object).
+
+    .. attribute:: architecture
+
+       The architecture of the package (a string).
+
+    .. attribute:: filename
+
+       The absolute pathname of the package archive (a string).
+
+    .. attribute:: pathname
+
+       The pathname of the package archive relative to the
+       :data:`POOL_DIRECTORY` (a string with forward slashes).
+
+    .. attribute:: component
+
+       The component of the package archive (a string).
+    """
@@ -1,7 +1,7 @@
 # Debian packaging tools: Trivial repository management.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: April 18, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """
@@ -28,17 +28,22 @@ file, please refer to the documentation of :func:`select_gpg_key()`.
 """
 
 # Standard library modules.
+import contextlib
+import filecmp
 import fnmatch
 import functools
 import glob
 import hashlib
+import io
 import logging
+import multiprocessing
 import os
 import os.path
 import pipes
 import re
 import shutil
 import tempfile
+import time
 
 # External dependencies.
 from executor import execute, ExternalCommandFailed
@@ -46,27 +51,62 @@ from humanfriendly import coerce_boolean, format_path, Timer
 from humanfriendly.decorators import cached
 from humanfriendly.text import concatenate
 from humanfriendly.terminal.spinners import Spinner
+from six import text_type
 from six.moves import configparser
 
 # Modules included in our package.
 from deb_pkg_tools import config
+from deb_pkg_tools.compat import replace
+from deb_pkg_tools.contents import update_contents
 from deb_pkg_tools.control import unparse_control_fields
+from deb_pkg_tools.deb822 import Deb822Writer, parse_deb822
 from deb_pkg_tools.gpg import GPGKey, initialize_gnupg
+from deb_pkg_tools.offsets import build_offsets_index
 from deb_pkg_tools.package import find_package_archives, inspect_package_fields
-from deb_pkg_tools.utils import atomic_lock, find_installed_version, optimize_order, sha1
-from deb_pkg_tools.version import Version
+from deb_pkg_tools.pdiff import update_pdiffs
+from deb_pkg_tools.utils import atomic_lock, find_installed_version, makedirs, optimize_order, sha1
+from deb_pkg_tools.version import Version, version_sort_key
 
 # Public identifiers that require documentation.
 __all__ = (
     "ALLOW_SUDO",
+    "BY_HASH",
+    "BY_HASH_INDEXES",
+    "BY_HASH_RETENTION",
+    "CONTENTS",
+    "METADATA_DIGEST",
+    "METADATA_DIRECTORY",
+    "METADATA_FILES",
+    "PACKAGES_FIELD_ORDER",
+    "PDIFFS",
+    "RESOURCE_LIMITS",
     "activate_repository",
     "apt_supports_trusted_option",
     "deactivate_repository",
+    "find_published_archives",
+    "generate_release",
+    "get_metadata_digest",
+    "get_release_fields",
+    "get_sha256",
     "get_packages_entry",
+    "get_packages_paragraph",
+    "initialize_resource_limits",
+    "is_published",
+    "is_release_published",
+    "is_signed_by",
+    "limit_resource",
     "load_config",
+    "packages_sort_key",
+    "prune_by_hash",
+    "publish_by_hash",
+    "publish_metadata",
+    "replace_symlink",
+    "save_metadata_digest",
     "logger",
     "scan_packages",
     "select_gpg_key",
+    "update_repositories",
+    "update_repositories_worker",
     "update_repository",
     "with_repository",
 )
@@ -81,11 +121,98 @@ environment variable ``$DPT_SUDO`` can be used to control the value of this
 variable (see :func:`~humanfriendly.coerce_boolean()` for acceptable values).
 """
 
+PACKAGES_FIELD_ORDER = (
+    'Package', 'Package-Type', 'Architecture', 'Version', 'Built-Using',
+    'Multi-Arch', 'Priority', 'Essential', 'Section', 'Source', 'Origin',
+    'Maintainer', 'Original-Maintainer', 'Bugs', 'Installed-Size', 'Provides',
+    'Pre-Depends', 'Depends', 'Recommends', 'Suggests', 'Replaces', 'Breaks',
+    'Conflicts', 'Enhances', 'Filename', 'Size', 'MD5sum', 'SHA1', 'SHA256',
+    'Description',
+)
+"""
+The order of the fields in the paragraphs of ``Packages`` files generated by
+:func:`scan_packages()` (a tuple of strings). This is the canonical order
+used by :man:`apt-ftparchive`, fields that aren't listed here are written
+after the listed fields.
+"""
+
+BY_HASH = coerce_boolean(os.environ.get('DPT_BY_HASH', 'false'))
+"""
+:data:`True` to make :func:`update_repository()` publish the indexes under
+``by-hash/SHA256/<digest>`` and set ``Acquire-By-Hash: yes`` in the
+``Release`` file by default, :data:`False` otherwise (the default). The
+environment variable ``$DPT_BY_HASH`` can be used to control the value of
+this variable (see :func:`~humanfriendly.coerce_boolean()` for acceptable
+values).
+"""
+
+BY_HASH_INDEXES = ('Packages', 'Packages.gz')
+"""The filenames of the indexes that are published under ``by-hash`` (a tuple of strings)."""
+
+BY_HASH_RETENTION = int(os.environ.get('DPT_BY_HASH_RETENTION', str(60 * 60 * 24)))
+"""
+The number of seconds that indexes which are no longer referenced by the
+``Release`` file are kept under ``by-hash`` (an integer, defaults to one
+day). Clients that downloaded an older ``Release`` file can still fetch the
+matching indexes during this period. The environment variable
+``$DPT_BY_HASH_RETENTION`` can be used to control the value of this variable.
+"""
+
+CONTENTS = coerce_boolean(os.environ.get('DPT_CONTENTS', 'false'))
+"""
+:data:`True` to make :func:`update_repository()` generate ``Contents-<arch>``
+indexes by default (see :mod:`deb_pkg_tools.contents`), :data:`False`
+otherwise (the default). The environment variable ``$DPT_CONTENTS`` can be
+used to control the value of this variable (see
+:func:`~humanfriendly.coerce_boolean()` for acceptable values).
+"""
+
+PDIFFS = coerce_boolean(os.environ.get('DPT_PDIFFS', 'false'))
+"""
+:data:`True` to make :func:`update_repository()` generate incremental diffs
+of the ``Packages`` file in the ``Packages.diff`` directory by default (see
+:mod:`deb_pkg_tools.pdiff`), :data:`False` otherwise (the default). The
+environment variable ``$DPT_PDIFFS`` can be used to control the value of
+this variable (see :func:`~humanfriendly.coerce_boolean()` for acceptable
+values).
+"""
+
+METADATA_DIRECTORY = '.deb-pkg-tools'
+"""
+The name of the (hidden) subdirectory of a trivial repository that contains
+the versions of the generated metadata (a string, see :func:`publish_metadata()`).
+"""
+
+METADATA_DIGEST = 'digest'
+"""
+The name of the file in the :data:`METADATA_DIRECTORY` that contains the
+digest of the published configuration (a string, see :func:`get_metadata_digest()`).
+"""
+
+METADATA_FILES = (
+    'Contents-*.gz', 'Packages', 'Packages.gz', 'Packages.diff', 'Packages.offsets',
+    'Release', 'Release.gpg', 'InRelease',
+)
+"""
+The filenames of the metadata files that can be generated by
+:func:`update_repository()` (a tuple of strings, these may contain
+:mod:`fnmatch` patterns).
+"""
+
+RESOURCE_LIMITS = {}
+"""
+A dictionary with :mod:`multiprocessing` semaphores that bound the number of
+concurrent CPU intensive steps (the key ``cpu``, used for hashing and
+compression) and GPG signing operations (the key ``gpg``) in the worker
+processes started by :func:`update_repositories()`. Empty (unlimited)
+otherwise. Refer to :func:`limit_resource()` for details.
+"""
+
 # Initialize a logger.
 logger = logging.getLogger(__name__)
 
 
-def scan_packages(repository, packages_file=None, cache=None):
+def scan_packages(repository, packages_file=None, cache=None, deterministic=True, paragraphs=None):
     """
     A reimplementation of the ``dpkg-scanpackages -m`` command in Python.
 
@@ -101,6 +228,25 @@ def scan_packages(repository, packages_file=None, cache=None):
                           (a string). Defaults to the ``Packages`` file in
                           the given directory.
     :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    :param deterministic: :data:`True` to sort the paragraphs by package
+                          name, version and architecture (see
+                          :func:`packages_sort_key()`) so that the same set
+                          of package archives always results in a byte for
+                          byte identical ``Packages`` file (the default),
+                          :data:`False` to write the paragraphs in the order
+                          in which the package archives are scanned.
+    :param paragraphs: An optional dictionary that keeps the generated
+                       paragraphs in memory between calls (used by
+                       :class:`.RepositoryWatcher`). The keys are the
+                       pathnames of package archives and the values are
+                       tuples with the size and last modified time of the
+                       archive and its (unparsed) fields. Only archives that
+                       were added or changed since the previous call are
+                       inspected, entries of archives that were removed are
+                       discarded.
+
+    The fields in each paragraph are written in the order given by
+    :data:`PACKAGES_FIELD_ORDER`.
     """
     # By default the `Packages' file inside the repository is updated.
     if not packages_file:
@@ -110,18 +256,65 @@ def scan_packages(repository, packages_file=None, cache=None):
     package_archives = glob.glob(os.path.join(repository, '*.deb'))
     num_packages = len(package_archives)
     spinner = Spinner(total=num_packages)
-    with open(packages_file, 'wb') as handle:
+    with io.open(packages_file, 'wb', buffering=1024 * 1024) as handle:
+        writer = Deb822Writer(handle, field_order=PACKAGES_FIELD_ORDER)
+        generated = []
+        if paragraphs is not None:
+            for archive in set(paragraphs) - set(package_archives):
+                del paragraphs[archive]
         for i, archive in enumerate(optimize_order(package_archives), start=1):
-            fields = dict(inspect_package_fields(archive, cache=cache))
-            fields.update(get_packages_entry(archive, cache=cache))
-            deb822_dict = unparse_control_fields(fields)
-            deb822_dict.dump(handle)
-            handle.write(b'\n')
+            if paragraphs is not None:
+                stat = os.stat(archive)
+                fingerprint = (stat.st_size, stat.st_mtime)
+                entry = paragraphs.get(archive)
+                if entry and entry[:2] == fingerprint:
+                    fields = entry[2]
+                else:
+                    fields = get_packages_paragraph(archive, cache)
+                    paragraphs[archive] = fingerprint + (fields,)
+            else:
+                fields = get_packages_paragraph(archive, cache)
+            if deterministic:
+                generated.append(fields)
+            else:
+                writer.write(fields)
             spinner.step(label="Scanning package metadata", progress=i)
+        for fields in sorted(generated, key=packages_sort_key):
+            writer.write(fields)
     spinner.clear()
     logger.debug("Wrote %i entries to output Packages file in %s.", num_packages, timer)
 
 
+def get_packages_paragraph(archive, cache=None):
+    """
+    Get the paragraph of a package archive in a ``Packages`` file.
+
+    :param archive: The pathname of the package archive (a string).
+    :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    :returns: A dictionary with the (unparsed) fields returned by
+              :func:`.inspect_package_fields()` and :func:`get_packages_entry()`.
+    """
+    fields = dict(inspect_package_fields(archive, cache=cache))
+    fields.update(get_packages_entry(archive, cache=cache))
+    return unparse_control_fields(fields)
+
+
+def packages_sort_key(fields):
+    """
+    Get the sort key of a paragraph in a ``Packages`` file.
+
+    :param fields: The (unparsed) control fields of a package (a dictionary).
+    :returns: A tuple with the package name, the version sort key (see
+              :func:`.version_sort_key()`), the architecture and filename.
+    """
+    return (
+        fields.get('Package', u''),
+        version_sort_key(fields.get('Version', u'0')),
+        fields.get('Architecture', u''),
+        fields.get('Filename', u''),
+    )
+
+
 def get_packages_entry(pathname, cache=None):
     """
     Get a dictionary with the control fields required in a ``Packages`` file.
@@ -173,7 +366,7 @@ def get_packages_entry(pathname, cache=None):
     sha1_state = hashlib.sha1()
     sha256_state = hashlib.sha256()
     # Read the file once, in blocks, calculating all hashes at once.
-    with open(pathname, 'rb') as handle:
+    with limit_resource('cpu'), open(pathname, 'rb') as handle:
         for chunk in iter(functools.partial(handle.read, 1024), b''):
             md5_state.update(chunk)
             sha1_state.update(chunk)
@@ -190,7 +383,8 @@ def get_packages_entry(pathname, cache=None):
     return fields
 
 
-def update_repository(directory, release_fields={}, gpg_key=None, cache=None):
+def update_repository(directory, release_fields={}, gpg_key=None, cache=None,
+                      by_hash=None, pdiffs=None, contents=None, paragraphs=None):
     """
     Create or update a `trivial repository`_.
 
@@ -200,6 +394,18 @@ def update_repository(directory, release_fields={}, gpg_key=None, cache=None):
     :param gpg_key: The :class:`.GPGKey` object used to sign the repository.
                     Defaults to the result of :func:`select_gpg_key()`.
     :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+    :param by_hash: :data:`True` to publish the indexes under ``by-hash``
+                    (see :func:`publish_by_hash()`), :data:`False` to skip
+                    this. Defaults to :data:`BY_HASH`.
+    :param pdiffs: :data:`True` to generate incremental diffs of the
+                   ``Packages`` file (see :mod:`deb_pkg_tools.pdiff`),
+                   :data:`False` to skip this. Defaults to :data:`PDIFFS`.
+    :param contents: :data:`True` to generate ``Contents-<arch>`` indexes
+                     (see :mod:`deb_pkg_tools.contents`), :data:`False` to
+                     skip this. Defaults to :data:`CONTENTS`.
+    :param paragraphs: An optional dictionary that keeps the generated
+                       paragraphs in memory between calls (see
+                       :func:`scan_packages()`).
     :raises: :exc:`.ResourceLockedException` when the given repository
              directory is being updated by another process.
 
@@ -207,25 +413,40 @@ def update_repository(directory, release_fields={}, gpg_key=None, cache=None):
     apt-ftparchive_ and also uses gpg_ and gzip_. The following files are
     generated:
 
-    ===============  ==========================================================
-    Filename         Description
-    ===============  ==========================================================
-    ``Packages``     Provides the metadata of all ``*.deb`` packages in the
-                     `trivial repository`_ as a single text file. Generated
-                     using :class:`scan_packages()` (as a faster alternative
-                     to dpkg-scanpackages_).
-    ``Packages.gz``  A compressed version of the package metadata generated
-                     using gzip_.
-    ``Release``      Metadata about the release and hashes of the ``Packages``
-                     and ``Packages.gz`` files. Generated using
-                     apt-ftparchive_.
-    ``Release.gpg``  An ASCII-armored detached GPG signature of the ``Release``
-                     file. Generated using ``gpg --armor --sign
-                     --detach-sign``.
-    ``InRelease``    The contents of the ``Release`` file and its GPG signature
-                     combined into a single human readable file. Generated
-                     using ``gpg --armor --sign --clearsign``.
-    ===============  ==========================================================
+    ====================  =====================================================
+    Filename              Description
+    ====================  =====================================================
+    ``Packages``          Provides the metadata of all ``*.deb`` packages in the
+                          `trivial repository`_ as a single text file. Generated
+                          using :class:`scan_packages()` (as a faster alternative
+                          to dpkg-scanpackages_).
+    ``Packages.gz``       A compressed version of the package metadata generated
+                          using gzip_.
+    ``Release``           Metadata about the release and hashes of the ``Packages``
+                          and ``Packages.gz`` files. Generated using
+                          apt-ftparchive_.
+    ``Release.gpg``       An ASCII-armored detached GPG signature of the ``Release``
+                          file. Generated using ``gpg --armor --sign
+                          --detach-sign``.
+    ``InRelease``         The contents of the ``Release`` file and its GPG signature
+                          combined into a single human readable file. Generated
+                          using ``gpg --armor --sign --clearsign``.
+    ``Packages.offsets``  The byte offsets of the paragraphs in the ``Packages``
+                          file (see :mod:`deb_pkg_tools.offsets`).
+    ``Packages.diff/*``   Patches between successive versions of the ``Packages``
+                          file (only when `pdiffs` is :data:`True`, see
+                          :func:`.update_pdiffs()`).
+    ``Contents-*.gz``     The files contained in the packages (only when
+                          `contents` is :data:`True`, see
+                          :func:`.update_contents()`).
+    ``by-hash/SHA256/*``  The ``Packages`` and ``Packages.gz`` files named after
+                          their SHA256 digest (only when `by_hash` is
+                          :data:`True`, see :func:`publish_by_hash()`).
+    ====================  =====================================================
+
+    The files are generated in a new version directory inside the repository
+    and published atomically using :func:`publish_metadata()`, which means the
+    files in the repository directory are symbolic links.
 
     For more details about the ``Release.gpg`` and ``InRelease`` files please
     refer to the Debian wiki's section on secure-apt_.
@@ -239,32 +460,59 @@ def update_repository(directory, release_fields={}, gpg_key=None, cache=None):
     with atomic_lock(directory):
         timer = Timer()
         gpg_key = gpg_key or select_gpg_key(directory)
+        if by_hash is None:
+            by_hash = BY_HASH
+        if pdiffs is None:
+            pdiffs = PDIFFS
+        if contents is None:
+            contents = CONTENTS
+        # Get the fields to set inside the `Release' file.
+        release_fields = get_release_fields(directory, release_fields)
+        # Tell apt to fetch the indexes by their hash?
+        if by_hash:
+            release_fields.setdefault('acquire-by-hash', 'yes')
         # Figure out when the repository contents were last updated.
-        contents_last_updated = os.path.getmtime(directory)
-        for archive in find_package_archives(directory, cache=cache):
-            contents_last_updated = max(contents_last_updated, os.path.getmtime(archive.filename))
+        archives = find_package_archives(directory, cache=cache)
+        contents_last_updated = max([os.path.getmtime(a.filename) for a in archives] or [0])
         # Figure out when the repository metadata was last updated.
+        metadata_files = ['Packages', 'Packages.gz', 'Release']
+        # XXX If 1) no GPG key was provided, 2) apt doesn't require the
+        # repository to be signed and 3) `Release.gpg' doesn't exist, it should
+        # not cause an unnecessary repository update. That would turn the
+        # conditional update into an unconditional update, which is not the
+        # intention here :-)
+        for signed_file in 'Release.gpg', 'InRelease':
+            if os.path.isfile(os.path.join(directory, signed_file)) or gpg_key:
+                metadata_files.append(signed_file)
         try:
-            metadata_files = ['Packages', 'Packages.gz', 'Release']
-            # XXX If 1) no GPG key was provided, 2) apt doesn't require the
-            # repository to be signed and 3) `Release.gpg' doesn't exist, it should
-            # not cause an unnecessary repository update. That would turn the
-            # conditional update into an unconditional update, which is not the
-            # intention here :-)
-            for signed_file in 'Release.gpg', 'InRelease':
-                if os.path.isfile(os.path.join(directory, signed_file)) or gpg_key:
-                    metadata_files.append(signed_file)
             metadata_last_updated = max(os.path.getmtime(os.path.join(directory, fn)) for fn in metadata_files)
         except Exception:
             metadata_last_updated = 0
-        # If the repository doesn't actually need to be updated we'll skip the update.
+        # If the repository doesn't actually need to be updated we'll skip the
+        # update. Archives that were removed don't change any modification
+        # times and changes to the Release fields or the GPG key also require
+        # an update, so we compare the digest of the published configuration.
+        metadata_digest = get_metadata_digest(archives, release_fields, gpg_key)
         if metadata_last_updated >= contents_last_updated:
-            logger.info("Contents of repository %s didn't change, so no need to update it.", directory)
-            return
+            try:
+                with open(os.path.join(directory, METADATA_DIRECTORY, METADATA_DIGEST)) as handle:
+                    up_to_date = (handle.read().strip() == metadata_digest)
+            except EnvironmentError:
+                up_to_date = False
+            # When the digest is missing or different we fall back to checking
+            # the published metadata (this reads the `Packages' file and runs gpg).
+            if not up_to_date and (
+                find_published_archives(directory) == set(os.path.basename(a.filename) for a in archives)
+            ) and is_release_published(directory, gpg_key, release_fields):
+                save_metadata_digest(directory, metadata_digest)
+                up_to_date = True
+            if up_to_date:
+                logger.info("Contents of repository %s didn't change, so no need to update it.", directory)
+                return
         # The generated files `Packages', `Packages.gz', `Release' and `Release.gpg'
-        # are created in a temporary directory. Only once all of the files have been
-        # successfully generated they are moved to the repository directory. There
-        # are two reasons for this:
+        # are created in a new version directory on the same filesystem. Only once
+        # all of the files have been successfully generated they are published
+        # using publish_metadata(). There are two reasons for this:
         #
         # 1. If the repository directory is being served to apt-get clients we
         #    don't want them to catch us in the middle of updating the repository
@@ -273,62 +521,530 @@ def update_repository(directory, release_fields={}, gpg_key=None, cache=None):
         # 2. If we fail to generate one of the files it's better not to have
         #    changed any of them, for the same reason as point one :-)
         logger.info("%s trivial repository %s ..", "Updating" if metadata_last_updated else "Creating", directory)
-        temporary_directory = tempfile.mkdtemp(prefix='deb-pkg-tools-', suffix='-update-repo-stage')
+        metadata_directory = os.path.join(directory, METADATA_DIRECTORY)
+        makedirs(metadata_directory)
+        temporary_directory = tempfile.mkdtemp(prefix='stage-', dir=metadata_directory)
         logger.debug("Using temporary directory: %s", temporary_directory)
+        published = False
         try:
             # Generate the `Packages' file.
             logger.debug("Generating file: %s", format_path(os.path.join(directory, 'Packages')))
             scan_packages(repository=directory,
                           packages_file=os.path.join(temporary_directory, 'Packages'),
-                          cache=cache)
-            # Generate the `Packages.gz' file by compressing the `Packages' file.
+                          cache=cache,
+                          paragraphs=paragraphs)
+            # Skip the update when the published repository is already up to date
+            # (this avoids needlessly changing `Release' and its signatures).
+            if is_published(directory, os.path.join(temporary_directory, 'Packages'),
+                            gpg_key, by_hash, contents, release_fields):
+                logger.info("Packages file of repository %s didn't change, skipping update.", directory)
+                # Mark the published metadata as up to date, otherwise archives
+                # that were touched (or uploaded again) would cause the archives
+                # to be scanned again on every run. We only touch the `Release'
+                # file and its signatures because `Packages.offsets' is keyed on
+                # the last modified time of the `Packages' file.
+                for filename in metadata_files:
+                    pathname = os.path.join(directory, filename)
+                    if filename.startswith(('Release', 'InRelease')) and os.path.exists(pathname):
+                        os.utime(pathname, None)
+                save_metadata_digest(directory, metadata_digest)
+                return
+            # Generate the `Packages.gz' file by compressing the `Packages' file
+            # (without embedding a timestamp to keep the output reproducible).
             logger.debug("Generating file: %s", format_path(os.path.join(directory, 'Packages.gz')))
-            execute("gzip < Packages > Packages.gz", directory=temporary_directory, logger=logger)
-            # Generate the `Release' file.
+            with limit_resource('cpu'):
+                execute("gzip -n < Packages > Packages.gz", directory=temporary_directory, logger=logger)
+            # Generate the `Packages.diff' directory (before the `Release' file so it lists the index).
+            if pdiffs:
+                logger.debug("Generating directory: %s", format_path(os.path.join(directory, 'Packages.diff')))
+                with limit_resource('cpu'):
+                    update_pdiffs(old_file=os.path.join(directory, 'Packages'),
+                                  new_file=os.path.join(temporary_directory, 'Packages'),
+                                  diff_directory=os.path.join(temporary_directory, 'Packages.diff'),
+                                  previous_directory=os.path.join(directory, 'Packages.diff'))
+            # Generate the `Contents-<arch>.gz' indexes (before the `Release' file so it lists them).
+            if contents:
+                logger.debug("Generating Contents indexes of repository %s ..", format_path(directory))
+                with limit_resource('cpu'):
+                    update_contents(archives, temporary_directory, cache=cache)
+            # Generate the `Release' file and sign it (when a GPG key is given).
             logger.debug("Generating file: %s", format_path(os.path.join(directory, 'Release')))
-            # Get APT::FTPArchive::Release::* options from configuration file.
-            release_fields = dict((k.lower(), v) for k, v in release_fields.items())
-            for name, value in load_config(directory).items():
-                if name.startswith('release-'):
-                    name = re.sub('^release-', '', name)
-                    if name not in release_fields:
-                        release_fields[name] = value
-            # Override APT::FTPArchive::Release::* options from configuration file
-            # with options given to update_repository() explicitly by the caller.
-            options = []
-            for name, value in release_fields.items():
-                name = 'APT::FTPArchive::Release::%s' % name.capitalize()
-                options.append('-o %s' % pipes.quote('%s=%s' % (name, value)))
-            command = "LANG= apt-ftparchive %s release ." % ' '.join(options)
-            release_listing = execute(command, capture=True, directory=temporary_directory, logger=logger)
-            with open(os.path.join(temporary_directory, 'Release'), 'w') as handle:
-                handle.write(release_listing + '\n')
-            # Generate the `Release.gpg' and `InRelease' files by signing the `Release' file with GPG?
-            gpg_key_file = os.path.join(directory, 'Release.gpg')
-            in_release_file = os.path.join(directory, 'InRelease')
-            if gpg_key:
-                initialize_gnupg()
-                logger.debug("Generating file: %s", format_path(gpg_key_file))
-                command = "{gpg} --armor --sign --detach-sign --output Release.gpg Release"
-                execute(command.format(gpg=gpg_key.gpg_command), directory=temporary_directory, logger=logger)
-                logger.debug("Generating file: %s", format_path(in_release_file))
-                command = "{gpg} --armor --sign --clearsign --output InRelease Release"
-                execute(command.format(gpg=gpg_key.gpg_command), directory=temporary_directory, logger=logger)
-            else:
-                # XXX If 1) no GPG key was provided, 2) apt doesn't require the
-                # repository to be signed and 3) `Release.gpg' exists from a
-                # previous run, this file should be removed so we don't create an
-                # inconsistent repository index (when `Release' is updated but
-                # `Release.gpg' is not updated the signature becomes invalid).
-                for stale_file in gpg_key_file, in_release_file:
-                    if os.path.isfile(stale_file):
-                        os.unlink(stale_file)
-            # Move the generated files into the repository directory.
-            for entry in os.listdir(temporary_directory):
-                shutil.copy(os.path.join(temporary_directory, entry), os.path.join(directory, entry))
+            # XXX If 1) no GPG key was provided, 2) apt doesn't require the
+            # repository to be signed and 3) `Release.gpg' exists from a
+            # previous run, this file will be removed by publish_metadata() so
+            # we don't create an inconsistent repository index (when `Release'
+            # is updated but `Release.gpg' is not updated the signature becomes
+            # invalid).
+            generate_release(temporary_directory, release_fields, gpg_key)
+            # Index the byte offsets of the paragraphs in the `Packages' file (this is
+            # done after generating the `Release' file so it doesn't list the index).
+            build_offsets_index(os.path.join(temporary_directory, 'Packages'))
+            # Publish the indexes by hash before the `Release' file that refers to them.
+            if by_hash:
+                digests = publish_by_hash(directory, temporary_directory)
+            # Publish the generated files.
+            publish_metadata(directory, temporary_directory)
+            save_metadata_digest(directory, metadata_digest)
+            published = True
+            if by_hash:
+                prune_by_hash(directory, keep=digests)
             logger.info("Finished updating trivial repository in %s.", timer)
         finally:
-            shutil.rmtree(temporary_directory)
+            if not published:
+                shutil.rmtree(temporary_directory)
+
+
+def get_release_fields(directory, release_fields={}):
+    """
+    Get the fields to set inside the ``Release`` file of a repository.
+
+    :param directory: The pathname of a directory containing a repository (a string).
+    :param release_fields: A dictionary with fields given by the caller.
+    :returns: A dictionary with lowercase field names. The fields given by
+              the caller override the ``release-*`` options in the
+              configuration file (see :func:`load_config()`).
+    """
+    release_fields = dict((k.lower(), v) for k, v in release_fields.items())
+    for name, value in load_config(directory).items():
+        if name.startswith('release-'):
+            name = re.sub('^release-', '', name)
+            if name not in release_fields:
+                release_fields[name] = value
+    return release_fields
+
+
+def generate_release(directory, release_fields={}, gpg_key=None):
+    """
+    Generate the ``Release`` file of a directory with indexes and sign it.
+
+    :param directory: The pathname of a directory with indexes (a string).
+    :param release_fields: A dictionary with (lowercase) fields to set inside
+                           the ``Release`` file (see :func:`get_release_fields()`).
+    :param gpg_key: The :class:`.GPGKey` object used to create the
+                    ``Release.gpg`` and ``InRelease`` files (or :data:`None`).
+
+    The ``Release`` file is generated using :man:`apt-ftparchive`, the fields
+    are passed as ``APT::FTPArchive::Release::*`` options.
+    """
+    options = []
+    for name, value in sorted(release_fields.items()):
+        name = 'APT::FTPArchive::Release::%s' % name.capitalize()
+        options.append('-o %s' % pipes.quote('%s=%s' % (name, value)))
+    command = "LANG= apt-ftparchive %s release ." % ' '.join(options)
+    release_listing = execute(command, capture=True, directory=directory, logger=logger)
+    with open(os.path.join(directory, 'Release'), 'w') as handle:
+        handle.write(release_listing + '\n')
+    if gpg_key:
+        initialize_gnupg()
+        with limit_resource('gpg'):
+            logger.debug("Generating file: %s", format_path(os.path.join(directory, 'Release.gpg')))
+            command = "{gpg} --armor --sign --detach-sign --output Release.gpg Release"
+            execute(command.format(gpg=gpg_key.gpg_command), directory=directory, logger=logger)
+            logger.debug("Generating file: %s", format_path(os.path.join(directory, 'InRelease')))
+            command = "{gpg} --armor --sign --clearsign --output InRelease Release"
+            execute(command.format(gpg=gpg_key.gpg_command), directory=directory, logger=logger)
+
+
+def update_repositories(directories, concurrency=None, cpu_limit=None, gpg_limit=1, **options):
+    """
+    Create or update multiple trivial repositories concurrently.
+
+    :param directories: An iterable of strings with the pathnames of
+                        directories with ``*.deb`` packages.
+    :param concurrency: Override the number of concurrent processes (defaults
+                        to twice the value of :func:`multiprocessing.cpu_count()`
+                        or the number of directories, whichever is smaller).
+    :param cpu_limit: The maximum number of processes that are hashing or
+                      compressing at the same time (an integer, defaults to
+                      :func:`multiprocessing.cpu_count()`).
+    :param gpg_limit: The maximum number of processes that are signing
+                      ``Release`` files at the same time (an integer,
+                      defaults to 1).
+    :param options: Any keyword arguments are passed on to
+                    :func:`update_repository()`.
+    :returns: A list with the pathnames of the directories whose update
+              failed (empty when all updates succeeded).
+
+    A :mod:`multiprocessing` pool is used to update the repositories, the
+    bounds on CPU intensive steps and GPG signing are shared by all worker
+    processes (see :data:`RESOURCE_LIMITS`). Most repositories usually
+    haven't changed, those are skipped quickly by the existing up to date
+    check of :func:`update_repository()`, so it makes sense to run more
+    processes than there are CPU cores. When an update fails the error is
+    logged and the other repositories are still updated.
+    """
+    directories = list(directories)
+    if not directories:
+        return []
+    timer = Timer()
+    cpu_count = multiprocessing.cpu_count()
+    concurrency = min(len(directories), concurrency or cpu_count * 2)
+    limits = dict(
+        cpu=multiprocessing.BoundedSemaphore(cpu_limit or cpu_count),
+        gpg=multiprocessing.BoundedSemaphore(gpg_limit or 1),
+    )
+    logger.info("Updating %i repositories using %i processes ..", len(directories), concurrency)
+    pool = multiprocessing.Pool(concurrency, initializer=initialize_resource_limits, initargs=(limits,))
+    try:
+        arguments = [(directory, options) for directory in directories]
+        results = pool.map(update_repositories_worker, arguments, chunksize=1)
+    finally:
+        pool.terminate()
+    failed = [d for d, success in zip(directories, results) if not success]
+    logger.info("Finished updating %i repositories in %s (%i failed).", len(directories), timer, len(failed))
+    return failed
+
+
+def update_repositories_worker(args):
+    """Helper for :func:`update_repositories()` that enables concurrent updates."""
+    directory, options = args
+    try:
+        update_repository(directory, **options)
+        return True
+    except Exception:
+        # Log a full traceback in the child process because the multiprocessing
+        # module doesn't preserve the traceback when propagating the exception
+        # to the parent process.
+        logger.exception("Failed to update repository %s!", format_path(directory))
+        return False
+
+
+def initialize_resource_limits(limits):
+    """Helper for :func:`update_repositories()` to initialize :data:`RESOURCE_LIMITS` in worker processes."""
+    RESOURCE_LIMITS.update(limits)
+
+
+@contextlib.contextmanager
+def limit_resource(name):
+    """
+    Bound the number of processes that use a resource at the same time.
+
+    :param name: The name of the resource (one of the keys of :data:`RESOURCE_LIMITS`).
+
+    When :data:`RESOURCE_LIMITS` contains a semaphore for the resource this
+    context manager acquires the semaphore for the duration of the
+    :keyword:`with` block, otherwise it does nothing.
+    """
+    semaphore = RESOURCE_LIMITS.get(name)
+    if semaphore is None:
+        yield
+    else:
+        with semaphore:
+            yield
+
+
+def publish_metadata(directory, version_directory):
+    """
+    Atomically publish a new version of the metadata of a trivial repository.
+
+    :param directory: The pathname of a directory containing a trivial
+                      repository (a string).
+    :param version_directory: The pathname of a directory containing the
+                              generated metadata files (a string). This must
+                              be a subdirectory of the :data:`METADATA_DIRECTORY`
+                              in the repository directory.
+
+    The metadata files in the repository directory are symbolic links that
+    point into the ``current`` symbolic link in the :data:`METADATA_DIRECTORY`,
+    which points to the current version directory. Publishing a new version
+    swaps the ``current`` symbolic link using :func:`.compat.replace()`, so
+    clients always see a consistent set of metadata files and no files need
+    to be copied. Afterwards metadata files that are no longer generated are
+    removed from the repository directory (see :data:`METADATA_FILES`) and
+    previous version directories are cleaned up.
+    """
+    metadata_directory = os.path.join(directory, METADATA_DIRECTORY)
+    version_name = os.path.basename(version_directory)
+    current_link = os.path.join(metadata_directory, 'current')
+    # Make the version directory readable for HTTP servers (mkdtemp() uses 0700).
+    os.chmod(version_directory, 0o755)
+    # Atomically switch to the new version of the metadata.
+    logger.debug("Publishing metadata version %s ..", version_name)
+    replace_symlink(current_link, version_name)
+    # Make sure the metadata files in the repository directory point to the current version.
+    generated_files = os.listdir(version_directory)
+    for filename in generated_files:
+        target = os.path.join(METADATA_DIRECTORY, 'current', filename)
+        pathname = os.path.join(directory, filename)
+        if not (os.path.islink(pathname) and os.readlink(pathname) == target):
+            replace_symlink(pathname, target)
+    # Remove metadata files that are no longer generated.
+    for filename in os.listdir(directory):
+        pathname = os.path.join(directory, filename)
+        if (filename not in generated_files and any(fnmatch.fnmatch(filename, p) for p in METADATA_FILES)
+                and os.path.lexists(pathname)):
+            logger.debug("Removing stale metadata file: %s", format_path(pathname))
+            os.unlink(pathname)
+    # Clean up previous versions of the metadata.
+    for entry in os.listdir(metadata_directory):
+        if entry not in ('current', version_name, METADATA_DIGEST):
+            shutil.rmtree(os.path.join(metadata_directory, entry))
+
+
+def publish_by_hash(directory, version_directory, filenames=BY_HASH_INDEXES):
+    """
+    Publish indexes under their SHA256 digest (for ``Acquire-By-Hash``).
+
+    :param directory: The pathname of a directory containing a trivial
+                      repository (a string).
+    :param version_directory: The pathname of a directory containing the
+                              generated indexes (a string).
+    :param filenames: The filenames of the indexes to publish (an iterable of
+                      strings, defaults to :data:`BY_HASH_INDEXES`).
+    :returns: A set with the SHA256 digests of the published indexes (strings).
+
+    The indexes are hard linked (or copied, when hard linking fails) to
+    ``by-hash/SHA256/<digest>`` in the repository directory. Because the
+    filename is determined by the contents these files never change, which
+    means clients can't download an index that doesn't match the ``Release``
+    file they just downloaded and proxies can cache the files indefinitely.
+    Indexes that were already published have their modification time updated
+    so that :func:`prune_by_hash()` doesn't remove them.
+    """
+    by_hash_directory = os.path.join(directory, 'by-hash', 'SHA256')
+    makedirs(by_hash_directory)
+    digests = set()
+    for filename in filenames:
+        source = os.path.join(version_directory, filename)
+        if os.path.isfile(source):
+            digest = get_sha256(source)
+            target = os.path.join(by_hash_directory, digest)
+            if os.path.isfile(target):
+                os.utime(target, None)
+            else:
+                logger.debug("Publishing %s as %s ..", filename, format_path(target))
+                temporary_file = '%s.tmp-%i' % (target, os.getpid())
+                try:
+                    os.link(source, temporary_file)
+                except OSError:
+                    shutil.copy(source, temporary_file)
+                replace(temporary_file, target)
+            digests.add(digest)
+    return digests
+
+
+def prune_by_hash(directory, keep=(), retention=None):
+    """
+    Remove stale indexes from the ``by-hash`` directory.
+
+    :param directory: The pathname of a directory containing a trivial
+                      repository (a string).
+    :param keep: An iterable with the SHA256 digests of the indexes that are
+                 referenced by the current ``Release`` file (strings).
+    :param retention: The number of seconds that unreferenced indexes are kept
+                      (an integer, defaults to :data:`BY_HASH_RETENTION`).
+    :returns: The number of removed indexes (an integer).
+    """
+    by_hash_directory = os.path.join(directory, 'by-hash', 'SHA256')
+    if retention is None:
+        retention = BY_HASH_RETENTION
+    keep = set(keep)
+    threshold = time.time() - retention
+    removed = 0
+    for digest in os.listdir(by_hash_directory) if os.path.isdir(by_hash_directory) else []:
+        pathname = os.path.join(by_hash_directory, digest)
+        if digest not in keep and os.path.getmtime(pathname) < threshold:
+            logger.debug("Pruning stale index: %s", format_path(pathname))
+            os.unlink(pathname)
+            removed += 1
+    return removed
+
+
+def get_metadata_digest(archives, release_fields, gpg_key=None):
+    """
+    Get a digest of the configuration that determines the metadata of a trivial repository.
+
+    :param archives: A list of :class:`.PackageFile` objects.
+    :param release_fields: A dictionary with the fields of the ``Release``
+                           file (see :func:`get_release_fields()`).
+    :param gpg_key: The :class:`.GPGKey` object used to sign the repository
+                    (or :data:`None`).
+    :returns: The SHA1 digest of the filenames of the package archives, the
+              fields of the ``Release`` file and the GPG key (a string).
+
+    The GPG key is identified by its configuration and the size and last
+    modified time of its key ring files, so this doesn't run gpg. Refer to
+    :func:`save_metadata_digest()` for how the digest is used.
+    """
+    lines = ['archive %s' % fn for fn in sorted(os.path.basename(a.filename) for a in archives)]
+    lines.extend('field %s: %s' % (n.lower(), text_type(v).strip()) for n, v in sorted(release_fields.items()))
+    if gpg_key:
+        lines.append('key %s %s %s %s' % (gpg_key.directory_effective, gpg_key.key_id,
+                                          gpg_key.public_key_file, gpg_key.secret_key_file))
+        for pathname in (gpg_key.public_key_file, gpg_key.secret_key_file,
+                         os.path.join(gpg_key.directory_effective, 'pubring.kbx'),
+                         os.path.join(gpg_key.directory_effective, 'pubring.gpg'),
+                         os.path.join(gpg_key.directory_effective, 'secring.gpg'),
+                         os.path.join(gpg_key.directory_effective, 'private-keys-v1.d')):
+            if pathname and os.path.exists(pathname):
+                stat = os.stat(pathname)
+                lines.append('keyring %s %i %r' % (pathname, stat.st_size, stat.st_mtime))
+    return sha1('\n'.join(lines))
+
+
+def save_metadata_digest(directory, digest):
+    """
+    Record the digest of the configuration of the published metadata.
+
+    :param directory: The pathname of a directory containing a trivial
+                      repository (a string).
+    :param digest: The result of :func:`get_metadata_digest()` (a string).
+
+    The digest is stored in the :data:`METADATA_DIGEST` file so that
+    :func:`update_repository()` can skip unchanged repositories by comparing
+    modification times and the digest, without reading the ``Packages`` file
+    or running gpg to check the signature of the ``Release`` file. A missing
+    or partially written digest only causes the full check to be done again.
+    """
+    metadata_directory = os.path.join(directory, METADATA_DIRECTORY)
+    makedirs(metadata_directory)
+    with open(os.path.join(metadata_directory, METADATA_DIGEST), 'w') as handle:
+        handle.write('%s\n' % digest)
+
+
+def get_sha256(filename):
+    """
+    Calculate the SHA256 digest of a file.
+
+    :param filename: The pathname of the file (a string).
+    :returns: The hexadecimal digest (a string).
+    """
+    context = hashlib.sha256()
+    with open(filename, 'rb') as handle:
+        for chunk in iter(functools.partial(handle.read, 1024 * 64), b''):
+            context.update(chunk)
+    return context.hexdigest()
+
+
+def replace_symlink(pathname, target):
+    """
+    Atomically create or replace a symbolic link.
+
+    :param pathname: The pathname of the symbolic link (a string).
+    :param target: The target of the symbolic link (a string).
+    """
+    temporary_link = '%s.tmp-%i' % (pathname, os.getpid())
+    os.symlink(target, temporary_link)
+    replace(temporary_link, pathname)
+
+
+def find_published_archives(directory):
+    """
+    Find the package archives listed in the ``Packages`` file of a trivial repository.
+
+    :param directory: The pathname of a directory containing a trivial
+                      repository (a string).
+    :returns: A set with the filenames of the package archives (strings) or
+              :data:`None` when the ``Packages`` file doesn't exist.
+
+    The ``Packages`` file is scanned for ``Filename`` fields without parsing
+    the paragraphs.
+    """
+    filenames = set()
+    try:
+        with io.open(os.path.join(directory, 'Packages'), 'rb') as handle:
+            for line in handle:
+                if line.startswith(b'Filename:'):
+                    filenames.add(line.partition(b':')[2].strip().decode('UTF-8'))
+    except EnvironmentError:
+        return None
+    return filenames
+
+
+def is_published(directory, packages_file, gpg_key=None, by_hash=False, contents=False, release_fields=None):
+    """
+    Check whether a generated ``Packages`` file has already been published.
+
+    :param directory: The pathname of a directory containing a trivial
+                      repository (a string).
+    :param packages_file: The pathname of a generated ``Packages`` file (a string).
+    :param gpg_key: The :class:`.GPGKey` object used to sign the repository
+                    (or :data:`None`).
+    :param by_hash: :data:`True` if the indexes should be published under
+                    ``by-hash`` (see :func:`publish_by_hash()`), :data:`False`
+                    otherwise.
+    :param contents: :data:`True` if ``Contents-<arch>`` indexes should be
+                     published, :data:`False` otherwise.
+    :param release_fields: Refer to :func:`is_release_published()`.
+    :returns: :data:`True` if the ``Packages`` file in the repository is byte
+              for byte identical to the generated file, the ``Packages``
+              file is published under ``by-hash`` (only) when `by_hash` is
+              :data:`True`, ``Contents`` indexes exist (only) when `contents`
+              is :data:`True` and the ``Release`` file is up to date (see
+              :func:`is_release_published()`), :data:`False` otherwise.
+    """
+    published_file = os.path.join(directory, 'Packages')
+    return (
+        os.path.isfile(published_file)
+        and filecmp.cmp(packages_file, published_file, shallow=False)
+        and (not by_hash or os.path.isfile(os.path.join(directory, 'by-hash', 'SHA256', get_sha256(packages_file))))
+        and bool(glob.glob(os.path.join(directory, 'Contents-*.gz'))) == bool(contents)
+        and is_release_published(directory, gpg_key, release_fields)
+    )
+
+
+def is_release_published(directory, gpg_key=None, release_fields=None):
+    """
+    Check whether the published ``Release`` file has the requested fields and signature.
+
+    :param directory: The pathname of a directory containing a trivial
+                      repository (a string).
+    :param gpg_key: The :class:`.GPGKey` object used to sign the repository
+                    (or :data:`None`).
+    :param release_fields: A dictionary with the fields that should be set
+                           inside the ``Release`` file (see
+                           :func:`get_release_fields()`) or :data:`None` to
+                           ignore the fields of the ``Release`` file.
+    :returns: :data:`True` if the ``Release`` file exists, the fields in the
+              file (except for the date and checksums generated by
+              :man:`apt-ftparchive`) match `release_fields` and the file is
+              signed (only) when a GPG key is given (by that key, see
+              :func:`is_signed_by()`), :data:`False` otherwise.
+
+    Fields that :man:`apt-ftparchive` doesn't support are never included in
+    the ``Release`` file, so repositories with such fields in their
+    configuration are regenerated each time :func:`update_repository()` runs.
+    """
+    release_file = os.path.join(directory, 'Release')
+    signature_file = os.path.join(directory, 'Release.gpg')
+    if not (os.path.isfile(release_file) and os.path.isfile(signature_file) == bool(gpg_key)):
+        return False
+    if release_fields is not None:
+        with open(release_file, 'rb') as handle:
+            fields = parse_deb822(handle.read())
+        generated_fields = ('date', 'md5sum', 'sha1', 'sha256', 'sha512')
+        published_fields = dict((n.lower(), v) for n, v in fields.items() if n.lower() not in generated_fields)
+        if published_fields != dict((n.lower(), text_type(v).strip()) for n, v in release_fields.items()):
+            return False
+    return not gpg_key or is_signed_by(signature_file, gpg_key)
+
+
+def is_signed_by(filename, gpg_key):
+    """
+    Check whether a signature was made using the given GPG key.
+
+    :param filename: The pathname of an ASCII-armored signature (a string).
+    :param gpg_key: A :class:`.GPGKey` object.
+    :returns: :data:`True` if the key ID of the signature matches the
+              fingerprint of one of the secret (sub)keys selected by the GPG
+              key (all secret keys in the keyring or, when
+              :attr:`~.GPGKey.key_id` is set, the keys matching the key ID),
+              :data:`False` otherwise.
+
+    The key ID is taken from the output of ``gpg --list-packets``, this
+    doesn't require the public key of the signature to be available.
+    """
+    initialize_gnupg()
+    command = [gpg_key.gpg_command, '--list-secret-keys', '--with-colons']
+    if gpg_key.key_id:
+        command.append(pipes.quote(gpg_key.key_id))
+    listing = execute(' '.join(command), capture=True, check=False, silent=True, logger=logger) or ''
+    fingerprints = [fields[9].upper() for fields in (line.split(':') for line in listing.splitlines())
+                    if len(fields) >= 10 and fields[0] == 'fpr' and fields[9].isalnum()]
+    command = "%s --list-packets %s" % (gpg_key.gpg_command, pipes.quote(filename))
+    listing = execute(command, capture=True, check=False, silent=True, logger=logger) or ''
+    key_ids = [k.upper() for k in re.findall(r'\bkeyid ([0-9A-F]+)', listing, re.IGNORECASE)]
+    return bool(key_ids) and all(any(f.endswith(k) for f in fingerprints) for k in key_ids)
 
 
 def activate_repository(directory, gpg_key=None):
@@ -1,31 +1,41 @@
 # Debian packaging tools: Automated tests.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: May 11, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """Test suite for the `deb-pkg-tools` package."""
 
 # Standard library modules.
+import filecmp
 import functools
+import gc
+import glob
+import gzip
+import hashlib
+import io
+import json
 import logging
+import multiprocessing
 import os
 import re
 import shutil
 import sys
 import tempfile
+import time
 
 # External dependencies.
 from capturer import CaptureOutput
 from executor import ExternalCommandFailed, execute
-from humanfriendly import coerce_boolean
+from humanfriendly import Timer, coerce_boolean
 from humanfriendly.testing import PatchedAttribute, TestCase, run_cli, touch
 from humanfriendly.text import dedent
 from six import text_type
 from six.moves import StringIO
+from six.moves import cPickle as pickle
 
 # Modules included in our package.
-from deb_pkg_tools import package, version
+from deb_pkg_tools import offsets, package, repo, version
 from deb_pkg_tools.cache import PackageCache
 from deb_pkg_tools.checks import (
     DuplicateFilesFound,
@@ -34,6 +44,7 @@ from deb_pkg_tools.checks import (
     check_version_conflicts,
 )
 from deb_pkg_tools.cli import main
+from deb_pkg_tools.contents import update_contents
 from deb_pkg_tools.control import (
     create_control_file,
     load_control_file,
@@ -41,15 +52,20 @@ from deb_pkg_tools.control import (
     parse_control_fields,
     unparse_control_fields,
 )
-from deb_pkg_tools.deb822 import Deb822, dump_deb822, parse_deb822
+from deb_pkg_tools.deb822 import Deb822, Deb822Writer, dump_deb822, iter_deb822, lzma, parse_deb822
 from deb_pkg_tools.deps import (
+    PARSE_CACHE,
+    LazyRelationshipSet,
     Relationship,
     RelationshipSet,
     VersionedRelationship,
     parse_depends,
 )
 from deb_pkg_tools.gpg import GPGKey
+from deb_pkg_tools.graph import find_reverse_dependencies, load_dependency_graph
+from deb_pkg_tools.offsets import PackagesIndex, build_offsets_index, get_offsets_file
 from deb_pkg_tools.package import (
+    VersionIndex,
     build_package,
     collect_related_packages,
     copy_package_files,
@@ -60,11 +76,38 @@ from deb_pkg_tools.package import (
     group_by_latest_versions,
     inspect_package,
     inspect_package_contents,
+    match_relationships,
     parse_filename,
 )
+from deb_pkg_tools.pdiff import load_pdiff_history, update_pdiffs
+from deb_pkg_tools.pool import find_pool_archives, generate_suite, is_suite_published, update_pool_repository
 from deb_pkg_tools.printer import CustomPrettyPrinter
-from deb_pkg_tools.repo import apt_supports_trusted_option, update_repository
-from deb_pkg_tools.utils import find_debian_architecture, makedirs
+from deb_pkg_tools.repo import (
+    METADATA_DIGEST,
+    METADATA_DIRECTORY,
+    apt_supports_trusted_option,
+    find_published_archives,
+    get_sha256,
+    is_published,
+    is_signed_by,
+    limit_resource,
+    prune_by_hash,
+    publish_by_hash,
+    publish_metadata,
+    scan_packages,
+    update_repositories,
+    update_repository,
+)
+from deb_pkg_tools.utils import (
+    LRUCache,
+    ResourceLockedException,
+    atomic_lock,
+    find_debian_architecture,
+    makedirs,
+    supports_weak_references,
+)
+from deb_pkg_tools.version.native import compare_version_objects
+from deb_pkg_tools.watch import PollingWatcher, RepositoryWatcher, create_watcher
 
 # Initialize a logger.
 logger = logging.getLogger(__name__)
@@ -128,6 +171,30 @@ class DebPkgToolsTestCase(TestCase):
             # This should not complain that the directory already exists.
             makedirs(child)
 
+    def test_lru_cache(self):
+        """Test that the LRU cache evicts the least recently used entries."""
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        # Looking up 'a' makes 'b' the least recently used entry.
+        assert cache['a'] == 1
+        cache['c'] = 3
+        assert len(cache) == 2
+        assert 'a' in cache and 'c' in cache
+        assert 'b' not in cache
+        self.assertRaises(KeyError, lambda: cache['b'])
+        assert cache.get('b', 42) == 42
+        assert cache.hits == 1
+        assert cache.misses == 2
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.hits == cache.misses == 0
+        # Make sure the version comparison caches stay bounded.
+        with PatchedAttribute(version.NATIVE_COMPARISON_CACHE, 'maxsize', 10):
+            for i in range(100):
+                assert version.compare_versions_native('1.%i' % i, '<<', '2.0')
+            assert len(version.NATIVE_COMPARISON_CACHE) <= 10
+
     def test_file_copying(self):
         """Test that file copying using hard links actually works."""
         with Context() as finalizers:
@@ -187,6 +254,33 @@ class DebPkgToolsTestCase(TestCase):
         valid_architectures = execute('dpkg-architecture', '-L', capture=True).splitlines()
         assert find_debian_architecture() in valid_architectures
 
+    def test_atomic_lock(self):
+        """Test exclusive locking of directories."""
+        from deb_pkg_tools import utils
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            for fcntl in (utils.fcntl, None):
+                with PatchedAttribute(utils, 'fcntl', fcntl):
+                    with atomic_lock(directory) as lock:
+                        assert (lock.fd is not None) == bool(fcntl)
+                        self.assertRaises(ResourceLockedException, atomic_lock(directory, wait=False).__enter__)
+                        timer = Timer()
+                        self.assertRaises(ResourceLockedException, atomic_lock(directory, timeout=0.2).__enter__)
+                        assert timer.elapsed_time >= 0.2
+                    # Waiting processes claim the lock as soon as it's released.
+                    holder = multiprocessing.Process(target=hold_lock, args=(directory, 0.5))
+                    holder.start()
+                    finalizers.register(holder.join)
+                    time.sleep(0.2)
+                    with atomic_lock(directory) as lock:
+                        assert lock.wait_time > 0.1
+            # Locks held by processes that died are released.
+            holder = multiprocessing.Process(target=hold_lock, args=(directory, 0, True))
+            holder.start()
+            holder.join()
+            with atomic_lock(directory, wait=False):
+                pass
+
     def test_find_package_archives(self):
         """Test searching for package archives."""
         with Context() as finalizers:
@@ -211,6 +305,32 @@ class DebPkgToolsTestCase(TestCase):
         bad = ['one_1.0_all.deb', 'two_0.5_all.deb']
         self.assertRaises(ValueError, find_latest_version, bad)
 
+    def test_version_index(self):
+        """Make sure the version index agrees with linear evaluation of relationships."""
+        archives = [parse_filename('foo_%s_all.deb' % v) for v in ('0.5', '1.0', '1.00', '1.2~rc1', '1.2', '2.0', '3.4')]
+        archives.append(parse_filename('bar_1.0_all.deb'))
+        index = VersionIndex(archives)
+        for expression in ('foo', 'foo (>= 1.2)', 'foo (>= 1.2), foo (<< 2)', 'foo (= 1.0)', 'foo (>> 1.0)',
+                           'foo (<= 1.2~rc1)', 'foo (<< 1) | foo (>= 3), bar', 'foo (>> 1) | baz, foo (<< 1.2)',
+                           'foo (>> 3.4)', 'baz'):
+            relationship_sets = [parse_depends(expression)]
+            expected = [a for a in archives if a.name == 'foo' and match_relationships(a, relationship_sets)]
+            matches = index.find_matches('foo', relationship_sets)
+            if expression == 'baz':
+                assert matches is None
+            else:
+                assert set(matches) == set(expected), expression
+                newest = index.find_newest_match('foo', relationship_sets)
+                assert newest == (find_latest_version(expected) if expected else None)
+        # Architecture restrictions fall back to linear evaluation.
+        self.assertRaises(NotImplementedError, index.find_matches, 'foo', [parse_depends('foo [amd64]')])
+        # Relationships that don't apply to the target architecture are ignored.
+        relationship_sets = [parse_depends('foo (>= 1.0) [amd64], foo (<< 0.5) [i386]')]
+        for architecture in ('amd64', 'i386'):
+            expected = [a for a in archives if a.name == 'foo' and match_relationships(a, relationship_sets, architecture)]
+            assert set(index.find_matches('foo', relationship_sets, architecture)) == set(expected)
+        assert index.find_matches('foo', relationship_sets, 'armhf') is None
+
     def test_group_by_latest_versions(self):
         """Test the grouping by latest versions."""
         packages = ['one_1.0_all.deb', 'one_0.5_all.deb', 'two_1.5_all.deb', 'two_0.1_all.deb']
@@ -388,6 +508,123 @@ class DebPkgToolsTestCase(TestCase):
         dumped = dump_deb822(parsed)
         assert dumped == u"Description: \u2603\n"
 
+    def test_control_field_parsing_performance(self):
+        """Make sure parsing of huge control fields takes linear time."""
+        lines = [u"Package: huge", u"Description: Short description."]
+        lines.extend(u" Line %i of the long description." % i for i in range(200000))
+        text = u"\n".join(lines) + u"\n"
+        timer = Timer()
+        parsed = parse_deb822(text)
+        assert timer.elapsed_time < 3, "Parsing took %s!" % timer
+        assert len(parsed['Description'].splitlines()) == 200001
+        # Indented input (used in the test suite) is still dedented.
+        assert parse_deb822(u"\n    Package: indented\n    Version: 1.0\n") == Deb822(Package=u'indented', Version=u'1.0')
+
+    def test_deb822_writer(self):
+        """Test the streaming writer of deb822 paragraphs."""
+        paragraphs = [
+            Deb822(Version=u'1.0', Package=u'foo', Description=u'Short.\n\nLong \u2603', Custom=u'yes'),
+            Deb822(Package=u'bar', Version=u'2.0'),
+        ]
+        handle = io.BytesIO()
+        writer = Deb822Writer(handle, field_order=['Package', 'Version', 'Description'])
+        for paragraph in paragraphs:
+            writer.write(paragraph)
+        assert writer.count == 2
+        assert handle.getvalue() == dedent(u"""
+            Package: foo
+            Version: 1.0
+            Description: Short.
+             .
+             Long \u2603
+            Custom: yes
+
+            Package: bar
+            Version: 2.0
+        """).lstrip().encode('UTF-8') + b'\n'
+        assert list(iter_deb822(io.BytesIO(handle.getvalue()))) == paragraphs
+
+    def test_multi_paragraph_parsing(self):
+        """Test incremental parsing of files with multiple paragraphs."""
+        text = dedent(u"""
+            # Leading comment.
+            Package: one
+            Version: 1.0
+            Description: Short.
+             Long \u2603
+             .
+             description.
+
+            Package: two
+            Version: 2.0
+
+
+            Package: three
+        """).lstrip()
+        expected = [
+            Deb822(Package=u'one', Version=u'1.0', Description=u'Short.\nLong \u2603\n\ndescription.'),
+            Deb822(Package=u'two', Version=u'2.0'),
+            Deb822(Package=u'three'),
+        ]
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            plain = os.path.join(directory, 'Packages')
+            with open(plain, 'wb') as handle:
+                handle.write(text.encode('UTF-8'))
+            with gzip.open(plain + '.gz', 'wb') as handle:
+                handle.write(text.encode('UTF-8'))
+            filenames = [plain, plain + '.gz']
+            if lzma is not None:
+                with lzma.open(plain + '.xz', 'wb') as handle:
+                    handle.write(text.encode('UTF-8'))
+                filenames.append(plain + '.xz')
+            for filename in filenames:
+                assert list(iter_deb822(filename)) == expected, filename
+            # Test parsing from a text mode file-like object.
+            assert list(iter_deb822(StringIO(text))) == expected
+            # Test that errors report the filename and line number.
+            with open(plain, 'ab') as handle:
+                handle.write(b'\nnot a field\n')
+            try:
+                list(iter_deb822(plain))
+                assert False, "Expected ValueError!"
+            except ValueError as e:
+                assert plain in text_type(e)
+                assert 'line 15' in text_type(e)
+
+    def test_packages_offsets_index(self):
+        """Test random access to the paragraphs in a Packages file."""
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            packages_file = os.path.join(directory, 'Packages')
+            paragraphs = [
+                Deb822(Package=u'foo', Version=u'1.0', Architecture=u'amd64', Description=u'Foo\n\nbar \u2603'),
+                Deb822(Package=u'foo', Version=u'1.0', Architecture=u'i386'),
+                Deb822(Package=u'foo', Version=u'2.0', Architecture=u'amd64'),
+                Deb822(Package=u'bar', Version=u'0.1', Architecture=u'all'),
+            ]
+            with open(packages_file, 'wb') as handle:
+                for paragraph in paragraphs:
+                    paragraph.dump(handle)
+                    handle.write(b'\n')
+            index = build_offsets_index(packages_file)
+            assert len(index['entries']) == 4
+            assert os.path.isfile(get_offsets_file(packages_file))
+            with PackagesIndex(packages_file) as index:
+                assert len(index) == 4
+                assert ('foo', '2.0', 'amd64') in index
+                assert index.get('foo', '1.0', 'amd64') == paragraphs[0]
+                assert index.get('foo', '1.0', 'i386') == paragraphs[1]
+                assert index.get('foo', '3.0', 'amd64') is None
+                assert index.find('foo') == paragraphs[:3]
+                assert index.find('baz') == []
+            # Stale indexes are rebuilt automatically.
+            with open(packages_file, 'ab') as handle:
+                Deb822(Package=u'baz', Version=u'1.0', Architecture=u'all').dump(handle)
+            with PackagesIndex(packages_file) as index:
+                assert len(index) == 5
+                assert index.get('baz', '1.0', 'all')['Package'] == 'baz'
+
     def test_unicode_control_file_parsing(self):
         """Test support for Unicode characters in control file parsing."""
         with Context() as finalizers:
@@ -407,6 +644,13 @@ class DebPkgToolsTestCase(TestCase):
         with PatchedAttribute(version, 'PREFER_DPKG', True):
             self.version_comparison_helper()
 
+    def test_version_comparison_apt(self):
+        """Test the comparison of version objects (using python-apt when available)."""
+        with PatchedAttribute(version, 'PREFER_APT', True):
+            self.version_comparison_helper()
+        if not version.get_apt_pkg():
+            self.assertRaises(ImportError, version.compare_versions_apt, '1', '<<', '2')
+
     def version_comparison_helper(self):
         """Test the comparison of version objects."""
         # V() shortcut for deb_pkg_tools.version.Version().
@@ -445,6 +689,66 @@ class DebPkgToolsTestCase(TestCase):
         assert not V('0.5') != V('0:0.5')  # unusual semantics
         # Test the handling of the '~' token.
         assert V("1.3~rc2") < V("1.3")
+        # Test the batched sorting and comparison functions.
+        unsorted = ['1.3', '1:0.1', '1.3~rc2', '0.5', '1.3']
+        assert version.sort_versions(unsorted) == ['0.5', '1.3~rc2', '1.3', '1.3', '1:0.1']
+        assert version.sort_versions(unsorted, reverse=True) == ['1:0.1', '1.3', '1.3', '1.3~rc2', '0.5']
+        assert version.sort_versions([('b', '1.0'), ('a', '0.5')], key=lambda p: p[1]) == [('a', '0.5'), ('b', '1.0')]
+        assert version.max_version(unsorted) == '1:0.1'
+        assert version.max_version([('b', '1.0'), ('a', '1.0')], key=lambda p: p[1]) == ('b', '1.0')
+        assert version.compare_versions_many([('1.0', '0.5'), ('0.5', '0:0.5'), ('1.3~rc2', '1.3')]) == [1, 0, -1]
+
+    def test_version_interning(self):
+        """Make sure identical version strings share a single Version object."""
+        v1 = version.Version('1:2.0-1')
+        v2 = version.Version(u'1:2.0-1')
+        assert v1 is v2
+        assert version.Version(v1) is v1
+        assert v1.epoch == 1
+        assert v1.upstream_version == '2.0'
+        assert v1.debian_revision == '1'
+        # Pickling preserves interning.
+        assert pickle.loads(pickle.dumps(v1)) is v1
+        # Interned objects are released when they're no longer referenced.
+        key = (version.Version, '1:2.0-1')
+        assert key in version.INTERNED_VERSIONS
+        if supports_weak_references(str):
+            del v1, v2
+            gc.collect()
+            assert key not in version.INTERNED_VERSIONS
+
+    def test_version_interning_fallback(self):
+        """Make sure versions are interned when weak references to strings aren't supported."""
+        assert supports_weak_references(object)
+        # Patch the module namespace (not the deprecation proxy that wraps it).
+        namespace = getattr(version, 'module', version)
+        with PatchedAttribute(namespace, 'INTERNED_VERSIONS', LRUCache(maxsize=2)):
+            v1 = version.Version('1.0')
+            assert version.Version('1.0') is v1
+            assert v1.upstream_version == '1.0'
+            version.Version('2.0')
+            version.Version('3.0')
+            # The least recently used version was evicted.
+            assert (version.Version, '1.0') not in namespace.INTERNED_VERSIONS
+            assert len(namespace.INTERNED_VERSIONS) == 2
+            assert version.Version('1.0') == v1
+
+    def test_version_sort_keys(self):
+        """Make sure version sort keys agree with the reference implementation."""
+        samples = [
+            '', '0', '00', '0~', '~', '~~', '~~a', '~a', 'a', 'a~', 'ab', '1', '1.0', '1.00', '1.0~rc1',
+            '1.0~rc1~beta', '1.0+b1', '1.0a', '1.0-1', '1.0-1~bpo1', '1.0-1.1', '1:0.5', '2:0.1', '0:1.0',
+            '1.0-0', '10', '9', '1.2.3-4ubuntu1', '1.2.3-4ubuntu1.1', '1.2.3-4+deb10u1',
+        ]
+        for v1 in samples:
+            for v2 in samples:
+                expected = compare_version_objects(version.Version(v1), version.Version(v2))
+                key1 = version.version_sort_key(v1)
+                key2 = version.version_sort_key(v2)
+                assert expected == (key1 > key2) - (key1 < key2), (v1, v2)
+        assert sorted(samples, key=version.version_sort_key) == sorted(samples, key=functools.cmp_to_key(
+            lambda v1, v2: compare_version_objects(version.Version(v1), version.Version(v2))
+        ))
 
     def test_relationship_parsing(self):
         """Test the parsing of Debian package relationship declarations."""
@@ -464,6 +768,55 @@ class DebPkgToolsTestCase(TestCase):
         self.assertRaises(ValueError, parse_depends, 'foo (bar) (baz)')
         self.assertRaises(ValueError, parse_depends, 'foo (bar baz qux)')
 
+    def test_relationship_parse_cache(self):
+        """Test that parsed relationship expressions are shared."""
+        set1 = parse_depends('libc6 (>= 2.15), python | python3')
+        set2 = parse_depends(['libc6 (>= 2.15)', 'zlib1g'])
+        assert set1.relationships[0] is set2.relationships[0]
+        assert parse_depends('libc6 (>= 2.15), python | python3') is set1
+        # Expressions that fail to parse aren't cached.
+        for i in range(2):
+            self.assertRaises(ValueError, parse_depends, 'foo (bar) (baz)')
+        assert ('parse_depends', 'foo (bar) (baz)') not in PARSE_CACHE
+        # Iterators of expressions are parsed (and cached) correctly.
+        expressions = ['pkg-a (>= 1.0)', 'pkg-b']
+        set3 = parse_depends(e for e in expressions)
+        assert [r.name for r in set3.relationships] == ['pkg-a', 'pkg-b']
+        assert parse_depends(expressions) is set3
+
+    def test_relationship_objects(self):
+        """Test that relationship objects are immutable, hashable and picklable."""
+        relationship_set = parse_depends('python (>= 2.6) [amd64], python-foo | python-bar')
+        relationship = relationship_set.relationships[0]
+        self.assertRaises(AttributeError, setattr, relationship, 'name', 'other')
+        assert not hasattr(relationship, '__dict__')
+        copy = pickle.loads(pickle.dumps(relationship_set))
+        assert copy == relationship_set
+        assert hash(copy) == hash(relationship_set)
+        assert repr(copy) == repr(relationship_set)
+        assert Relationship(name='a') < Relationship(name='b')
+        assert Relationship(name='a') < VersionedRelationship(name='a', operator='>=', version='1')
+        assert len(set([Relationship(name='a'), Relationship(name='a', architectures=[])])) == 1
+
+    def test_lazy_relationship_parsing(self):
+        """Test lazy parsing of relationship fields."""
+        text = u'python (>=2.6),  python-foo|python-bar'
+        fields = parse_control_fields({'Package': 'foo', 'Depends': text}, lazy=True)
+        lazy_set = fields['Depends']
+        assert isinstance(lazy_set, LazyRelationshipSet)
+        # Round tripping an untouched field doesn't parse it.
+        assert unparse_control_fields(fields)['Depends'] == text
+        copy = pickle.loads(pickle.dumps(lazy_set))
+        for value in (lazy_set, copy):
+            self.assertRaises(AttributeError, RelationshipSet.relationships.__get__, value)
+        # The first use parses the expression.
+        eager_set = parse_depends(text)
+        assert lazy_set == eager_set
+        assert hash(lazy_set) == hash(eager_set)
+        assert repr(lazy_set) == repr(eager_set)
+        assert lazy_set.matches('python', '2.7')
+        assert copy.names == eager_set.names
+
     def test_architecture_restriction_parsing(self):
         """Test the parsing of architecture restrictions."""
         relationship_set = parse_depends('qux [i386 amd64]')
@@ -525,6 +878,31 @@ class DebPkgToolsTestCase(TestCase):
         assert relationship_set.matches('python', '3.0') is False  # name in alternative matched, version didn't
         assert list(relationship_set.names) == ['python']
 
+    def test_restriction_evaluation(self):
+        """Test the evaluation of architecture and build profile restrictions."""
+        relationship_set = parse_depends('foo [amd64 i386], bar [!amd64], baz [linux-any], qux [any-arm]')
+        # Architecture restrictions can't be evaluated without a target architecture.
+        self.assertRaises(NotImplementedError, relationship_set.matches, 'foo')
+        assert relationship_set.matches('foo', architecture='amd64') is True
+        assert relationship_set.matches('foo', architecture='armhf') is None
+        assert relationship_set.matches('bar', architecture='amd64') is None
+        assert relationship_set.matches('bar', architecture='i386') is True
+        assert relationship_set.matches('baz', architecture='amd64') is True
+        assert relationship_set.matches('baz', architecture='kfreebsd-amd64') is None
+        assert relationship_set.matches('qux', architecture='armhf') is True
+        assert relationship_set.matches('qux', architecture='arm64') is None
+        # Build profile restrictions are ignored unless profiles are given.
+        relationship_set = parse_depends('debhelper (>= 9) <!nocheck> <stage1 cross>')
+        assert relationship_set.matches('debhelper', '10') is True
+        assert relationship_set.matches('debhelper', '10', profiles=[]) is True
+        assert relationship_set.matches('debhelper', '10', profiles=['nocheck']) is None
+        assert relationship_set.matches('debhelper', '10', profiles=['nocheck', 'stage1', 'cross']) is True
+        assert relationship_set.matches('debhelper', '8', profiles=[]) is False
+        # Restrictions survive serialization.
+        assert text_type(relationship_set) == 'debhelper (>= 9) <!nocheck> <stage1 cross>'
+        assert parse_depends(text_type(relationship_set)) == relationship_set
+        assert "profiles=(('!nocheck',), ('stage1', 'cross'))" in repr(relationship_set)
+
     def test_custom_pretty_printer(self):
         """Test pretty printing of control file fields and parsed relationships."""
         printer = CustomPrettyPrinter()
@@ -703,6 +1081,23 @@ class DebPkgToolsTestCase(TestCase):
             returncode, output = run_cli(main, '--update', '/a/directory/that/will/never/exist')
             assert returncode != 0
 
+    def test_cli_action_order(self):
+        """Test that repositories are updated in command line order."""
+        from deb_pkg_tools import cli
+        with Context() as finalizers:
+            d1, d2, d3 = (finalizers.mkdtemp() for i in range(3))
+            calls = []
+            with PatchedAttribute(cli, 'update_repository', lambda d, cache: calls.append(('update', [d]))):
+                with PatchedAttribute(cli, 'update_repositories', lambda ds, cache: calls.append(('update', ds))):
+                    with PatchedAttribute(cli, 'activate_repository', lambda d: calls.append(('activate', d))):
+                        returncode, output = run_cli(main, '-u', d1, '-a', d2)
+                        assert returncode == 0
+                        assert calls == [('update', [d1]), ('activate', d2)]
+                        calls[:] = []
+                        returncode, output = run_cli(main, '-u', d1, '-a', d2, '-u', d3, '-u', d1)
+                        assert returncode == 0
+                        assert calls == [('update', [d1, d3]), ('activate', d2)]
+
     def test_with_repo_cli(self):
         """Test ``deb-pkg-tools --with-repo``."""
         if SKIP_SLOW_TESTS:
@@ -949,6 +1344,572 @@ class DebPkgToolsTestCase(TestCase):
             assert sorted(os.listdir(target_directory)) == \
                 sorted(map(os.path.basename, [package1, package2, package3, package4]))
 
+    def test_dependency_graph(self):
+        """Test the dependency graph of a repository and its incremental updates."""
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            package1 = self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-1',
+                Depends='deb-pkg-tools-package-2',
+            ))
+            package2_1 = self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-2',
+                Version='1',
+                Depends='deb-pkg-tools-package-3',
+            ))
+            package2_2 = self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-2',
+                Version='2',
+                Depends='deb-pkg-tools-package-3',
+            ))
+            package3 = self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-3',
+            ))
+            graph = load_dependency_graph(directory, cache=self.package_cache)
+            # The newest version satisfying a relationship is selected.
+            assert [a.filename for a in graph.dependencies(package1)] == [package2_2]
+            assert [a.filename for a in graph.closure(package1)] == [package2_2, package3]
+            assert [a.filename for a in graph.reverse_dependencies(package3)] == [package2_1, package2_2]
+            assert [a.filename for a in graph.reverse_dependencies(package3, transitive=True)] == \
+                [package1, package2_1, package2_2]
+            # Check the exported formats.
+            exported = json.loads(graph.to_json())
+            assert len(exported['nodes']) == 4
+            assert [os.path.basename(package1), os.path.basename(package2_2)] in exported['edges']
+            assert '"%s" -> "%s";' % (os.path.basename(package1), os.path.basename(package2_2)) in graph.to_dot()
+            # The persisted graph is updated incrementally after changes.
+            os.unlink(package2_2)
+            graph = load_dependency_graph(directory, cache=self.package_cache)
+            assert [a.filename for a in graph.closure(package1)] == [package2_1, package3]
+            self.assertRaises(KeyError, graph.closure, package2_2)
+            # Loading an up to date graph doesn't change it.
+            assert not graph.update(cache=self.package_cache)
+
+    def test_reverse_dependencies(self):
+        """Test the reverse dependency queries (including ``deb-pkg-tools --rdepends``)."""
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            package1 = self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-1',
+                Depends='deb-pkg-tools-package-3 (>= 2)',
+            ))
+            package2 = self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-2',
+                Depends='deb-pkg-tools-package-3 (<< 2) | deb-pkg-tools-package-4',
+            ))
+            self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-3',
+                Version='1',
+            ))
+
+            def rdepends(*args):
+                return [a.filename for a in find_reverse_dependencies(*args, directory=directory,
+                                                                      cache=self.package_cache)]
+            assert rdepends('deb-pkg-tools-package-3', None) == [package1, package2]
+            assert rdepends('deb-pkg-tools-package-3', '1') == [package2]
+            assert rdepends('deb-pkg-tools-package-3', '2.5') == [package1]
+            assert rdepends('deb-pkg-tools-package-4', None) == [package2]
+            assert rdepends('deb-pkg-tools-package-5', None) == []
+            # Test the command line interface.
+            returncode, output = run_cli(main, '--rdepends=deb-pkg-tools-package-3=1', directory)
+            assert returncode == 0
+            assert os.path.basename(package2) in output
+            assert os.path.basename(package1) not in output
+
+    def test_dependency_graph_architectures(self):
+        """Test architecture restrictions in the dependency graph of a repository."""
+        from deb_pkg_tools import graph
+
+        def inspect_package_fields(filename, cache=None):
+            # dpkg-deb refuses to build archives with architecture restrictions.
+            fields = Deb822(original(filename, cache))
+            if filename in restrictions:
+                fields['Depends'] = parse_depends(restrictions[filename])
+            return fields
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            package1 = self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-1',
+                Architecture='amd64',
+            ))
+            package2 = self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-2',
+                Architecture='amd64',
+                Version='1',
+            ))
+            self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-3',
+            ))
+            package4 = self.test_package_building(directory, overrides=dict(
+                Package='deb-pkg-tools-package-4',
+            ))
+            restrictions = {
+                package1: 'deb-pkg-tools-package-2 (>= 1) [amd64], deb-pkg-tools-package-3 [i386]',
+                package4: 'deb-pkg-tools-package-2 [amd64], deb-pkg-tools-package-3 [!amd64]',
+            }
+            original = graph.inspect_package_fields
+            with PatchedAttribute(graph, 'inspect_package_fields', inspect_package_fields):
+                dependency_graph = load_dependency_graph(directory)
+            # Restrictions are evaluated using the architecture of the depending archive.
+            assert [a.filename for a in dependency_graph.dependencies(package1)] == [package2]
+            assert [a.filename for a in dependency_graph.reverse_dependencies(package2)] == [package1]
+            assert [a.name for a in dependency_graph.dependencies(package4)] == ['deb-pkg-tools-package-3']
+
+            def rdepends(*args):
+                return [a.filename for a in dependency_graph.find_reverse_dependencies(*args)]
+            assert rdepends('deb-pkg-tools-package-2') == [package1]
+            assert rdepends('deb-pkg-tools-package-2', '1') == [package1]
+            assert rdepends('deb-pkg-tools-package-2', '0.5') == []
+            assert rdepends('deb-pkg-tools-package-3') == [package4]
+
+    def test_deterministic_packages_file(self):
+        """Test that scanning the same package archives results in identical Packages files."""
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            for name, number in (('b', '1.0'), ('a', '1.10'), ('a', '1.9')):
+                self.test_package_building(directory, overrides=dict(
+                    Package='deb-pkg-tools-%s' % name,
+                    Version=number,
+                ))
+            output = finalizers.mkdtemp()
+            outputs = [os.path.join(output, 'Packages.%i' % i) for i in range(3)]
+            for filename in outputs:
+                scan_packages(directory, packages_file=filename, cache=self.package_cache)
+            contents = []
+            for filename in outputs:
+                with open(filename, 'rb') as handle:
+                    contents.append(handle.read())
+            assert contents[0] == contents[1] == contents[2]
+            paragraphs = list(iter_deb822(outputs[0]))
+            assert [(p['Package'], p['Version']) for p in paragraphs] == [
+                ('deb-pkg-tools-a', '1.9'),
+                ('deb-pkg-tools-a', '1.10'),
+                ('deb-pkg-tools-b', '1.0'),
+            ]
+            # Fields are written in canonical order.
+            assert list(paragraphs[0].keys())[:2] == ['Package', 'Architecture']
+            # Detection of up to date repositories.
+            assert not is_published(directory, outputs[0])
+            shutil.copy(outputs[0], os.path.join(directory, 'Packages'))
+            touch(os.path.join(directory, 'Release'))
+            assert is_published(directory, outputs[0])
+
+    def test_unchanged_repository_update(self):
+        """Test that touched archives don't cause repeated repository scans."""
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            self.test_package_building(directory)
+            archive = glob.glob(os.path.join(directory, '*.deb'))[0]
+            # Publish the metadata of the archive.
+            scan_packages(directory, packages_file=os.path.join(directory, 'Packages'), cache=self.package_cache)
+            for filename in ('Packages', 'Packages.gz', 'Release'):
+                touch(os.path.join(directory, filename))
+                os.utime(os.path.join(directory, filename), (0, 0))
+            packages_file = os.path.join(directory, 'Packages')
+            build_offsets_index(packages_file)
+            # The touched archive is scanned again, but the metadata isn't regenerated.
+            update_repository(directory, cache=self.package_cache)
+            assert os.path.getmtime(os.path.join(directory, 'Release')) >= os.path.getmtime(archive)
+            # The offset index of the `Packages' file doesn't become stale.
+            assert os.path.getmtime(packages_file) == 0
+            with PatchedAttribute(offsets, 'build_offsets_index', lambda *args: self.fail("Rebuilt index!")):
+                with PackagesIndex(packages_file) as index:
+                    assert len(index) == 1
+            # The next update takes the fast path (the archives aren't scanned),
+            # unless the fields of the Release file need to be changed.
+            digest_file = os.path.join(directory, METADATA_DIRECTORY, METADATA_DIGEST)
+            with PatchedAttribute(repo, 'scan_packages', lambda *args, **kw: self.fail("Scanned archives!")):
+                update_repository(directory, cache=self.package_cache)
+                # The fast path only compares modification times and the digest
+                # of the published configuration (it doesn't read `Packages').
+                with PatchedAttribute(repo, 'find_published_archives', lambda *args: self.fail("Read Packages!")):
+                    with PatchedAttribute(repo, 'is_release_published', lambda *args: self.fail("Checked Release!")):
+                        update_repository(directory, cache=self.package_cache)
+                # Without the digest the published metadata is checked (once).
+                os.unlink(digest_file)
+                update_repository(directory, cache=self.package_cache)
+                assert os.path.isfile(digest_file)
+                self.assertRaises(AssertionError, update_repository, directory,
+                                  release_fields=dict(origin='changed'), cache=self.package_cache)
+
+    def test_published_release_fields(self):
+        """Test that changes to the fields and the signature of the Release file are detected."""
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            packages_file = os.path.join(directory, 'Packages')
+            touch(packages_file)
+            with open(os.path.join(directory, 'Release'), 'w') as handle:
+                handle.write(dedent('''
+                    Origin: example
+                    Date: Sun, 18 Oct 2026 00:00:00 UTC
+                    SHA256:
+                     e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855 0 Packages
+                '''))
+            assert is_published(directory, packages_file, release_fields=dict(Origin='example'))
+            assert not is_published(directory, packages_file, release_fields=dict(origin='changed'))
+            assert not is_published(directory, packages_file, release_fields=dict(origin='example', label='new'))
+            assert not is_published(directory, packages_file, release_fields={})
+            if SKIP_SLOW_TESTS:
+                return self.skipTest("skipping slow tests")
+            # Signatures made using a different GPG key are detected.
+            keys = [GPGKey(
+                description="GPG key pair generated for unit tests",
+                directory=finalizers.mkdtemp(),
+                name="deb-pkg-tools test suite",
+            ) for i in range(2)]
+            execute(keys[0].gpg_command + ' --armor --sign --detach-sign --output Release.gpg Release', directory=directory)
+            assert is_signed_by(os.path.join(directory, 'Release.gpg'), keys[0])
+            assert not is_signed_by(os.path.join(directory, 'Release.gpg'), keys[1])
+            assert is_published(directory, packages_file, keys[0], release_fields=dict(origin='example'))
+            assert not is_published(directory, packages_file, keys[1], release_fields=dict(origin='example'))
+            # Signing subkeys and keyrings with multiple keys are supported.
+            primary = keys[0].identifier
+            gpg = ' '.join((keys[0].scoped_command[0], '--homedir', keys[0].directory, '--batch', '--passphrase', "''"))
+
+            def list_fingerprints():
+                listing = execute(gpg + ' --list-secret-keys --with-colons', capture=True)
+                return set(line.split(':')[9] for line in listing.splitlines() if line.startswith('fpr:'))
+            existing = list_fingerprints()
+            execute(gpg + ' --quick-add-key %s default sign never' % primary)
+            subkey = (list_fingerprints() - existing).pop()
+            execute(gpg + ' --quick-gen-key other@example.com default default never')
+            execute(gpg + ' --yes --local-user %s! --armor --detach-sign --output Release.gpg Release' % subkey,
+                    directory=directory)
+            signature_file = os.path.join(directory, 'Release.gpg')
+            assert is_signed_by(signature_file, GPGKey(directory=keys[0].directory, key_id=primary))
+            assert not is_signed_by(signature_file, GPGKey(directory=keys[0].directory, key_id='other@example.com'))
+
+    def test_incremental_packages_file(self):
+        """Test reuse of the paragraphs of unchanged archives by scan_packages()."""
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            self.test_package_building(directory, overrides=dict(Package='deb-pkg-tools-a', Version='1'))
+            archive = glob.glob(os.path.join(directory, '*.deb'))[0]
+            packages_file = os.path.join(finalizers.mkdtemp(), 'Packages')
+            paragraphs = {}
+            scan_packages(directory, packages_file=packages_file, paragraphs=paragraphs)
+            assert list(paragraphs) == [archive]
+            # The paragraph of an unchanged archive is reused.
+            paragraphs[archive][2]['Description'] = 'Reused'
+            scan_packages(directory, packages_file=packages_file, paragraphs=paragraphs)
+            assert list(iter_deb822(packages_file))[0]['Description'] == 'Reused'
+            # Changed archives are scanned again and removed archives are forgotten.
+            os.utime(archive, (0, 0))
+            scan_packages(directory, packages_file=packages_file, paragraphs=paragraphs)
+            assert list(iter_deb822(packages_file))[0]['Description'] != 'Reused'
+            os.unlink(archive)
+            scan_packages(directory, packages_file=packages_file, paragraphs=paragraphs)
+            assert paragraphs == {}
+
+    def test_concurrent_repository_updates(self):
+        """Test updating multiple repositories concurrently."""
+        with Context() as finalizers:
+            directories = []
+            for i in range(3):
+                # Repositories that are up to date are skipped.
+                directory = finalizers.mkdtemp()
+                touch(os.path.join(directory, 'Packages'))
+                touch(os.path.join(directory, 'Release'))
+                directories.append(directory)
+            # Failures are reported without affecting the other repositories.
+            bogus = os.path.join(finalizers.mkdtemp(), 'not-a-directory')
+            touch(bogus)
+            assert update_repositories(directories + [bogus], concurrency=2) == [bogus]
+            # Resource limits are only enforced in worker processes.
+            with limit_resource('cpu'):
+                pass
+
+    def test_repository_watcher(self):
+        """Test detection of changed package archives."""
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            for factory in (functools.partial(PollingWatcher, interval=0.05), create_watcher):
+                watcher = factory(directory)
+                finalizers.register(watcher.close)
+                wrapper = RepositoryWatcher(directory, delay=0.3, watcher=watcher)
+                assert wrapper.wait_for_changes(timeout=0.1) == set()
+                # A burst of changes is reported at once, other files are ignored.
+                for filename in ('a.deb', 'b.deb', 'Packages'):
+                    touch(os.path.join(directory, filename))
+                assert wrapper.wait_for_changes(timeout=5) == set(['a.deb', 'b.deb'])
+                os.unlink(os.path.join(directory, 'a.deb'))
+                assert wrapper.wait_for_changes(timeout=5) == set(['a.deb'])
+                os.unlink(os.path.join(directory, 'b.deb'))
+                os.unlink(os.path.join(directory, 'Packages'))
+                wrapper.wait_for_changes(timeout=1)
+
+    def test_metadata_publication(self):
+        """Test atomic publication of repository metadata."""
+        def stage(**files):
+            version_directory = tempfile.mkdtemp(dir=metadata_directory)
+            for filename, contents in files.items():
+                with open(os.path.join(version_directory, filename.replace('_', '.')), 'w') as handle:
+                    handle.write(contents)
+            return version_directory
+
+        def read(filename):
+            with open(os.path.join(directory, filename)) as handle:
+                return handle.read()
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            metadata_directory = os.path.join(directory, METADATA_DIRECTORY)
+            os.mkdir(metadata_directory)
+            # Regular files (from older versions) are replaced by symbolic links.
+            for filename in ('Packages', 'Release.gpg'):
+                with open(os.path.join(directory, filename), 'w') as handle:
+                    handle.write('old\n')
+            publish_metadata(directory, stage(Packages='Filename: foo.deb\n', Release='one\n', Release_gpg='sig\n'))
+            assert os.path.islink(os.path.join(directory, 'Packages'))
+            assert read('Packages') == 'Filename: foo.deb\n'
+            assert read('Release.gpg') == 'sig\n'
+            assert find_published_archives(directory) == set(['foo.deb'])
+            # Files that are no longer generated are removed, as are old versions.
+            publish_metadata(directory, stage(Packages='', Release='two\n'))
+            assert read('Release') == 'two\n'
+            assert not os.path.lexists(os.path.join(directory, 'Release.gpg'))
+            assert len(os.listdir(metadata_directory)) == 2
+            assert find_published_archives(directory) == set()
+            assert find_published_archives(metadata_directory) is None
+
+    def test_by_hash_publication(self):
+        """Test publication of indexes under their SHA256 digest."""
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            version_directory = finalizers.mkdtemp()
+            by_hash_directory = os.path.join(directory, 'by-hash', 'SHA256')
+            digests = []
+            for contents in (b'one\n', b'two\n'):
+                with open(os.path.join(version_directory, 'Packages'), 'wb') as handle:
+                    handle.write(contents)
+                published = publish_by_hash(directory, version_directory)
+                assert len(published) == 1
+                digest = published.pop()
+                assert digest == hashlib.sha256(contents).hexdigest()
+                with open(os.path.join(by_hash_directory, digest), 'rb') as handle:
+                    assert handle.read() == contents
+                digests.append(digest)
+            # Unreferenced indexes are kept for the retention period.
+            assert prune_by_hash(directory, keep=digests[1:], retention=60) == 0
+            assert prune_by_hash(directory, keep=digests[1:], retention=-60) == 1
+            assert os.listdir(by_hash_directory) == digests[1:]
+
+    def test_by_hash_repository_update(self):
+        """Test that update_repository() publishes the indexes under their SHA256 digest."""
+        if SKIP_SLOW_TESTS:
+            return self.skipTest("skipping slow tests")
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            by_hash_directory = os.path.join(directory, 'by-hash', 'SHA256')
+            published = []
+            for number in ('1', '2'):
+                self.test_package_building(directory, overrides=dict(Version=number))
+                update_repository(directory, cache=self.package_cache, by_hash=True)
+                with open(os.path.join(directory, 'Release')) as handle:
+                    release = parse_deb822(handle.read())
+                assert release['Acquire-By-Hash'] == 'yes'
+                for filename in ('Packages', 'Packages.gz'):
+                    digest = get_sha256(os.path.join(directory, filename))
+                    assert filecmp.cmp(os.path.join(directory, filename), os.path.join(by_hash_directory, digest))
+                    assert digest in release['SHA256']
+                    published.append(digest)
+            # The indexes referenced by the previous Release file are kept.
+            assert sorted(os.listdir(by_hash_directory)) == sorted(published)
+
+    def test_pdiff_generation(self):
+        """Test generation of incremental diffs between ``Packages`` files."""
+        def paragraph(name, version, description='Description: example\n'):
+            return 'Package: %s\nVersion: %s\nFilename: ./%s_%s_all.deb\n%s\n' % (name, version, name, version, description)
+        revisions = [
+            paragraph('bar', '1.0') + paragraph('baz', '1.0') + paragraph('foo', '1.0') + paragraph('qux', '1.0'),
+            paragraph('bar', '1.0') + paragraph('baz', '1.0', 'Description: changed\n') + paragraph('baz', '2.0') +
+            paragraph('qux', '1.0') + paragraph('zed', '1.0'),
+            paragraph('aaa', '1.0') + paragraph('baz', '2.0') + paragraph('qux', '1.0'),
+        ]
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            diff_directory = None
+            for i, (old, new) in enumerate(zip(revisions, revisions[1:])):
+                old_file = os.path.join(directory, 'Packages.%i' % i)
+                new_file = os.path.join(directory, 'Packages.%i' % (i + 1))
+                for filename, contents in ((old_file, old), (new_file, new)):
+                    with open(filename, 'w') as handle:
+                        handle.write(contents)
+                previous_directory = diff_directory
+                diff_directory = os.path.join(directory, 'Packages.diff.%i' % i)
+                name = update_pdiffs(old_file, new_file, diff_directory, previous_directory, history=1)
+                # Applying the patch to the old file reproduces the new file.
+                with gzip.open(os.path.join(diff_directory, name + '.gz')) as handle:
+                    script = handle.read().decode('UTF-8')
+                assert apply_ed_script(old, script) == new
+                # Only the most recent patch is kept and listed in the index.
+                assert sorted(os.listdir(diff_directory)) == sorted(['Index', name + '.gz'])
+                entries = load_pdiff_history(diff_directory)
+                assert [e['name'] for e in entries] == [name]
+                assert entries[0]['history'] == (hashlib.sha256(old.encode('UTF-8')).hexdigest(), len(old))
+                assert entries[0]['patch'] == (hashlib.sha256(script.encode('UTF-8')).hexdigest(), len(script))
+                with open(os.path.join(diff_directory, 'Index')) as handle:
+                    fields = parse_deb822(handle.read())
+                assert fields['SHA256-Current'] == '%s %i' % (hashlib.sha256(new.encode('UTF-8')).hexdigest(), len(new))
+            # No patch is generated when the file didn't change.
+            assert update_pdiffs(new_file, new_file, os.path.join(directory, 'unchanged'), diff_directory) is None
+            assert len(load_pdiff_history(os.path.join(directory, 'unchanged'))) == 1
+
+    def test_pdiff_repository_update(self):
+        """Test that update_repository() publishes incremental diffs of the ``Packages`` file."""
+        if SKIP_SLOW_TESTS:
+            return self.skipTest("skipping slow tests")
+
+        def read(filename):
+            with io.open(os.path.join(directory, filename), encoding='UTF-8') as handle:
+                return handle.read()
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            diff_directory = os.path.join(directory, 'Packages.diff')
+            self.test_package_building(directory, overrides=dict(Version='1'))
+            update_repository(directory, cache=self.package_cache, pdiffs=True)
+            assert load_pdiff_history(diff_directory) == []
+            old_packages = read('Packages')
+            # Updating the repository publishes a patch for the old Packages file.
+            self.test_package_building(directory, overrides=dict(Version='2'))
+            update_repository(directory, cache=self.package_cache, pdiffs=True)
+            entries = load_pdiff_history(diff_directory)
+            assert len(entries) == 1
+            with gzip.open(os.path.join(diff_directory, entries[0]['name'] + '.gz')) as handle:
+                script = handle.read().decode('UTF-8')
+            assert apply_ed_script(old_packages, script) == read('Packages')
+            # The index is listed in the Release file.
+            assert 'Packages.diff/Index' in parse_deb822(read('Release'))['SHA256']
+
+    def test_contents_index_generation(self):
+        """Test generation of ``Contents-<arch>`` indexes."""
+        with Context() as finalizers:
+            repository_directory = finalizers.mkdtemp()
+            for name, architecture, section in (('foo', 'all', 'doc'), ('bar', 'amd64', 'libs')):
+                build_directory = finalizers.mkdtemp()
+                create_control_file(os.path.join(build_directory, 'DEBIAN', 'control'), {
+                    'Architecture': architecture,
+                    'Description': 'Bogus value for mandatory field',
+                    'Maintainer': 'Peter Odding',
+                    'Package': name,
+                    'Section': section,
+                    'Version': '1',
+                })
+                touch(os.path.join(build_directory, 'usr', 'share', 'doc', 'shared'))
+                touch(os.path.join(build_directory, 'usr', 'share', 'doc', name))
+                build_package(build_directory, repository_directory)
+            archives = find_package_archives(repository_directory)
+            # Use a tiny chunk size to exercise the external merge sort.
+            assert update_contents(archives, repository_directory, chunk_size=2) == ['Contents-amd64.gz']
+            with gzip.open(os.path.join(repository_directory, 'Contents-amd64.gz')) as handle:
+                lines = [line.split() for line in handle.read().decode('UTF-8').splitlines()]
+            assert lines == [
+                ['usr/share/doc/bar', 'libs/bar'],
+                ['usr/share/doc/foo', 'doc/foo'],
+                ['usr/share/doc/shared', 'doc/foo,libs/bar'],
+            ]
+
+    def test_contents_repository_update(self):
+        """Test that update_repository() publishes ``Contents-<arch>`` indexes."""
+        if SKIP_SLOW_TESTS:
+            return self.skipTest("skipping slow tests")
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            self.test_package_building(directory, contents={'usr/share/doc/example/README': 'Example\n'})
+            update_repository(directory, cache=self.package_cache, contents=True)
+            with gzip.open(os.path.join(directory, 'Contents-all.gz')) as handle:
+                lines = [line.split() for line in handle.read().decode('UTF-8').splitlines()]
+            assert lines == [['usr/share/doc/example/README', 'misc/%s' % TEST_PACKAGE_NAME]]
+            with open(os.path.join(directory, 'Release')) as handle:
+                assert 'Contents-all.gz' in parse_deb822(handle.read())['SHA256']
+            # The indexes are removed when they're no longer requested.
+            touch(glob.glob(os.path.join(directory, '*.deb'))[0])
+            update_repository(directory, cache=self.package_cache, contents=False)
+            assert not os.path.exists(os.path.join(directory, 'Contents-all.gz'))
+
+    def test_pool_suite_generation(self):
+        """Test generation of the indexes of suites in a ``pool`` / ``dists`` layout."""
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            for name, architecture, component in (('foo', 'all', 'main'), ('bar', 'amd64', 'contrib')):
+                build_directory = finalizers.mkdtemp()
+                create_control_file(os.path.join(build_directory, 'DEBIAN', 'control'), {
+                    'Architecture': architecture,
+                    'Description': 'Bogus value for mandatory field',
+                    'Maintainer': 'Peter Odding',
+                    'Package': name,
+                    'Version': '1',
+                })
+                pool_directory = os.path.join(directory, 'pool', component, name[0], name)
+                makedirs(pool_directory)
+                build_package(build_directory, pool_directory)
+            archives = find_pool_archives(directory)
+            assert [(a.component, a.pathname) for a in archives] == [
+                ('contrib', 'contrib/b/bar/bar_1_amd64.deb'),
+                ('main', 'main/f/foo/foo_1_all.deb'),
+            ]
+            paragraphs = dict((a.pathname, dict(Package=a.name, Filename='pool/' + a.pathname)) for a in archives)
+            suite_directory = finalizers.mkdtemp()
+            generate_suite(suite_directory, 'stable', archives, paragraphs, ['amd64', 'i386'])
+
+            def read_index(component, architecture):
+                with open(os.path.join(suite_directory, component, 'binary-%s' % architecture, 'Packages'), 'rb') as handle:
+                    return [fields['Filename'] for fields in iter_deb822(handle)]
+            assert read_index('main', 'amd64') == ['pool/main/f/foo/foo_1_all.deb']
+            assert read_index('main', 'i386') == ['pool/main/f/foo/foo_1_all.deb']
+            assert read_index('contrib', 'amd64') == ['pool/contrib/b/bar/bar_1_amd64.deb']
+            assert read_index('contrib', 'i386') == []
+            assert os.path.isfile(os.path.join(suite_directory, 'contrib', 'binary-i386', 'Packages.gz'))
+            # Identical indexes aren't published again.
+            published_directory = finalizers.mkdtemp()
+            shutil.copytree(suite_directory, os.path.join(published_directory, 'stable'))
+            assert not is_suite_published(os.path.join(published_directory, 'stable'), suite_directory)
+            touch(os.path.join(published_directory, 'stable', 'Release'))
+            assert is_suite_published(os.path.join(published_directory, 'stable'), suite_directory)
+            # Changes to the fields of the Release file are detected.
+            assert is_suite_published(os.path.join(published_directory, 'stable'), suite_directory, release_fields={})
+            assert not is_suite_published(os.path.join(published_directory, 'stable'), suite_directory,
+                                          release_fields=dict(origin='changed'))
+
+    def test_pool_repository_update(self):
+        """Test the creation of a repository with a ``pool`` / ``dists`` layout."""
+        if SKIP_SLOW_TESTS:
+            return self.skipTest("skipping slow tests")
+        with Context() as finalizers:
+            directory = finalizers.mkdtemp()
+            for name, architecture, component in (('foo', 'all', 'main'), ('bar', 'amd64', 'contrib')):
+                build_directory = finalizers.mkdtemp()
+                create_control_file(os.path.join(build_directory, 'DEBIAN', 'control'), {
+                    'Architecture': architecture,
+                    'Description': 'Bogus value for mandatory field',
+                    'Maintainer': 'Peter Odding',
+                    'Package': name,
+                    'Version': '1',
+                })
+                pool_directory = os.path.join(directory, 'pool', component, name[0], name)
+                makedirs(pool_directory)
+                build_package(build_directory, pool_directory)
+            suites = {'stable': ['main/*'], 'unstable': ['*']}
+            assert update_pool_repository(directory, suites, cache=self.package_cache) == ['stable', 'unstable']
+
+            def read_index(suite, component):
+                pathname = os.path.join(directory, 'dists', suite, component, 'binary-amd64', 'Packages')
+                with open(pathname, 'rb') as handle:
+                    return [fields['Filename'] for fields in iter_deb822(handle)]
+            assert read_index('stable', 'main') == ['pool/main/f/foo/foo_1_all.deb']
+            assert not os.path.exists(os.path.join(directory, 'dists', 'stable', 'contrib'))
+            assert read_index('unstable', 'contrib') == ['pool/contrib/b/bar/bar_1_amd64.deb']
+            for suite in suites:
+                with open(os.path.join(directory, 'dists', suite, 'Release')) as handle:
+                    assert 'main/binary-amd64/Packages' in parse_deb822(handle.read())['SHA256']
+            # Suites whose indexes didn't change aren't published again.
+            assert update_pool_repository(directory, suites, cache=self.package_cache) == []
+            # Unless the fields of their Release files change.
+            changed = update_pool_repository(directory, suites, release_fields=dict(origin='changed'),
+                                             cache=self.package_cache)
+            assert changed == ['stable', 'unstable']
+            with open(os.path.join(directory, 'dists', 'stable', 'Release')) as handle:
+                assert parse_deb822(handle.read())['Origin'] == 'changed'
+
     def test_repository_creation(self, preserve=False):
         """Test the creation of trivial repositories."""
         if SKIP_SLOW_TESTS:
@@ -1042,6 +2003,16 @@ class DebPkgToolsTestCase(TestCase):
                 self.assertRaises(EnvironmentError, GPGKey, **options)
 
 
+def hold_lock(directory, seconds, crash=False):
+    """Hold a lock on a directory in a child process (optionally without releasing it)."""
+    lock = atomic_lock(directory)
+    lock.__enter__()
+    time.sleep(seconds)
+    if crash:
+        os._exit(0)
+    lock.__exit__()
+
+
 def get_conffiles(package_archive):
     """Use ``dpkg --info ... conffiles`` to inspect marked configuration files."""
     try:
@@ -1059,6 +2030,26 @@ def match(pattern, lines):
             return m.group(1)
 
 
+def apply_ed_script(text, script):
+    """Apply the subset of ed commands generated by :func:`.diff_paragraphs()` to a string."""
+    lines = text.splitlines()
+    script = script.splitlines()
+    while script:
+        command = script.pop(0)
+        m = re.match(r'^(\d+)(?:,(\d+))?([acd])$', command)
+        start, end, action = int(m.group(1)), int(m.group(2) or m.group(1)), m.group(3)
+        replacement = []
+        if action in 'ac':
+            while script[0] != '.':
+                replacement.append(script.pop(0))
+            script.pop(0)
+        if action == 'a':
+            lines[start:start] = replacement
+        else:
+            lines[start - 1:end] = replacement
+    return ''.join(line + '\n' for line in lines)
+
+
 def normalize_repr_output(expression):
     """
     Enable string comparison between :func:`repr()` output on different Python versions.
@@ -1,7 +1,7 @@
 # Debian packaging tools: Utility functions.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: April 19, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """
@@ -13,6 +13,7 @@ modules in the `deb-pkg-tools` package.
 """
 
 # Standard library modules.
+import collections
 import errno
 import hashlib
 import logging
@@ -20,6 +21,13 @@ import os
 import random
 import tempfile
 import time
+import weakref
+
+# The fcntl module is only available on UNIX.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # External dependencies.
 from executor import execute, ExternalCommandFailed
@@ -29,6 +37,7 @@ from humanfriendly.terminal.spinners import Spinner
 
 # Public identifiers that require documentation.
 __all__ = (
+    "LRUCache",
     "ResourceLockedException",
     "atomic_lock",
     "compact",
@@ -38,6 +47,7 @@ __all__ = (
     "makedirs",
     "optimize_order",
     "sha1",
+    "supports_weak_references",
 )
 
 # Initialize a logger.
@@ -102,6 +112,22 @@ def optimize_order(package_archives):
     return package_archives
 
 
+def supports_weak_references(base=str):
+    """
+    Check whether instances of subclasses of a built in type support weak references.
+
+    :param base: The built in type (a class, defaults to :class:`str`).
+    :returns: :data:`True` if weak references are supported, :data:`False`
+              otherwise (for example Python 2 doesn't support weak references
+              to instances of :class:`str` subclasses).
+    """
+    try:
+        weakref.ref(type('WeakReferenceProbe', (base,), {})())
+        return True
+    except TypeError:
+        return False
+
+
 def find_debian_architecture():
     """
     Find the Debian architecture of the current environment.
@@ -171,9 +197,6 @@ class atomic_lock(object):
     """
     Context manager for atomic locking of files and directories.
 
-    This context manager exploits the fact that :func:`os.mkdir()` on UNIX
-    is an atomic operation, which means it will only work on UNIX.
-
     Intended to be used with Python's :keyword:`with` statement:
 
     .. code-block:: python
@@ -181,44 +204,252 @@ class atomic_lock(object):
        with atomic_lock('/var/www/apt-archive/some/repository'):
           # Inside the with block you have exclusive access.
           pass
+
+    Two locking mechanisms are supported:
+
+    - When the :mod:`fcntl` module is available an exclusive :man:`flock`
+      lock is claimed on a lock file in the system wide temporary directory.
+      Waiting for the lock blocks in the kernel (so the lock is claimed as
+      soon as it's released) and the lock is released automatically when
+      the process holding the lock dies. The lock file is never removed
+      (removing it would allow two processes to lock different files).
+
+    - Otherwise (or when the file system doesn't support :man:`flock`) the
+      lock is a directory in the system wide temporary directory, because
+      :func:`os.mkdir()` is an atomic operation. Waiting for the lock means
+      polling for the directory to disappear and a process that dies while
+      holding the lock leaves the directory behind.
+
+    The number of seconds spent waiting for the lock is available in
+    :attr:`wait_time` and logged when the lock is claimed.
     """
 
-    def __init__(self, pathname, wait=True):
+    def __init__(self, pathname, wait=True, timeout=None):
         """
         Prepare to atomically lock the given pathname.
 
         :param pathname: The pathname of a file or directory (a string).
         :param wait: Block until the lock can be claimed (a boolean, defaults
                      to :data:`True`).
+        :param timeout: The maximum number of seconds to wait for the lock
+                        (a number or :data:`None` to wait forever, only
+                        relevant when `wait` is :data:`True`).
 
-        If ``wait=False`` and the file or directory cannot be locked,
-        :exc:`ResourceLockedException` will be raised when entering the
-        :keyword:`with` block.
+        If ``wait=False`` or the timeout expires and the file or directory
+        cannot be locked, :exc:`ResourceLockedException` will be raised when
+        entering the :keyword:`with` block.
         """
         self.wait = bool(wait)
+        self.timeout = timeout
         self.pathname = os.path.realpath(pathname)
         self.lock_directory = os.path.join(tempfile.gettempdir(), '%s.lock' % sha1(self.pathname))
+        self.lock_file = os.path.join(tempfile.gettempdir(), '%s.flock' % sha1(self.pathname))
+        self.fd = None
+        self.wait_time = 0
 
     def __enter__(self):
         """Atomically lock the given pathname."""
-        spinner = Spinner()
         timer = Timer()
+        if not (fcntl and self.acquire_flock()):
+            self.acquire_directory()
+        self.wait_time = timer.elapsed_time
+        logger.debug("Locked %s (waited %s).", self.pathname, timer)
+        return self
+
+    def acquire_flock(self):
+        """
+        Claim the lock using :man:`flock`.
+
+        :returns: :data:`True` if the lock was claimed, :data:`False` if
+                  the file system doesn't support :man:`flock`.
+        :raises: :exc:`ResourceLockedException` when the lock can't be claimed.
+        """
+        try:
+            # Don't pass O_CREAT when the lock file exists, because that fails
+            # for files owned by other users in sticky directories like /tmp.
+            fd = os.open(self.lock_file, os.O_RDONLY)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                return False
+            fd = os.open(self.lock_file, os.O_RDONLY | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                if not self.wait:
+                    raise ResourceLockedException("Failed to lock %s for exclusive access!" % self.pathname)
+                logger.info("Waiting for lock on %s ..", self.pathname)
+                if self.timeout is None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                else:
+                    self.retry(lambda: fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB))
+            self.fd = fd
+            return True
+        except (IOError, OSError) as e:
+            os.close(fd)
+            if e.errno in (errno.ENOLCK, errno.EINVAL, getattr(errno, 'EOPNOTSUPP', errno.EINVAL)):
+                logger.debug("Falling back to directory locking (flock() failed: %s).", e)
+                return False
+            raise
+        except Exception:
+            os.close(fd)
+            raise
+
+    def acquire_directory(self):
+        """
+        Claim the lock by creating a directory.
+
+        :raises: :exc:`ResourceLockedException` when the lock can't be claimed.
+        """
+        if not makedirs(self.lock_directory):
+            if not self.wait:
+                raise ResourceLockedException("Failed to lock %s for exclusive access!" % self.pathname)
+            spinner = Spinner()
+            timer = Timer()
+
+            def attempt():
+                if not makedirs(self.lock_directory):
+                    spinner.step(label="Waiting for lock on %s: %s .." % (self.pathname, timer))
+                    raise ResourceLockedException("Failed to lock %s for exclusive access!" % self.pathname)
+            try:
+                self.retry(attempt, errors=(ResourceLockedException,), interval=0.1)
+            finally:
+                spinner.clear()
+
+    def retry(self, function, errors=(IOError, OSError), interval=0.001):
+        """
+        Retry a non-blocking lock attempt until it succeeds or :attr:`timeout` expires.
+
+        :param function: The function that attempts to claim the lock.
+        :param errors: The exception types that indicate the lock is held.
+        :param interval: The initial number of seconds between attempts. The
+                         interval doubles after each attempt (up to 0.1
+                         seconds).
+        :raises: :exc:`ResourceLockedException` when the timeout expires.
+        """
+        deadline = None if self.timeout is None else time.time() + self.timeout
         while True:
-            if makedirs(self.lock_directory):
-                return
-            elif self.wait:
-                spinner.step(label="Waiting for lock on %s: %s .." % (self.pathname, timer))
-                time.sleep(0.1)
-            else:
-                msg = "Failed to lock %s for exclusive access!"
-                raise ResourceLockedException(msg % self.pathname)
+            try:
+                return function()
+            except errors as e:
+                if getattr(e, 'errno', errno.EAGAIN) not in (errno.EAGAIN, errno.EACCES):
+                    raise
+            if deadline is not None and time.time() >= deadline:
+                raise ResourceLockedException("Timed out waiting for lock on %s!" % self.pathname)
+            time.sleep(interval)
+            interval = min(interval * 2, 0.1)
 
     def __exit__(self, exc_type=None, exc_value=None, traceback=None):
         """Unlock the previously locked pathname."""
-        if os.path.isdir(self.lock_directory):
+        if self.fd is not None:
+            # Closing the file descriptor releases the lock.
+            os.close(self.fd)
+            self.fd = None
+        elif os.path.isdir(self.lock_directory):
             os.rmdir(self.lock_directory)
 
 
+class LRUCache(object):
+
+    """
+    A dictionary-like cache that holds a bounded number of entries.
+
+    When the cache is full, storing a new entry evicts the least recently used
+    entry. This makes it possible to cache the results of expensive operations
+    in long running processes without the cache growing without bounds.
+
+    .. attribute:: maxsize
+
+       The maximum number of entries in the cache (an integer).
+
+    .. attribute:: hits
+
+       The number of successful lookups (an integer).
+
+    .. attribute:: misses
+
+       The number of failed lookups (an integer).
+    """
+
+    def __init__(self, maxsize):
+        """
+        Initialize an :class:`LRUCache` object.
+
+        :param maxsize: The maximum number of entries in the cache (an integer).
+        """
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        """Check whether the cache contains the given key (without updating statistics)."""
+        return key in self.entries
+
+    def __len__(self):
+        """Get the number of entries in the cache."""
+        return len(self.entries)
+
+    def __getitem__(self, key):
+        """
+        Get a value from the cache.
+
+        :param key: The key of the value.
+        :returns: The cached value.
+        :raises: :exc:`~exceptions.KeyError` when the key isn't in the cache.
+        """
+        try:
+            # Move the entry to the end of the ordered dictionary to
+            # mark it as the most recently used entry (we avoid using
+            # move_to_end() because it's not available on Python 2).
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        """
+        Store a value in the cache, evicting the least recently used entry when the cache is full.
+
+        :param key: The key of the value.
+        :param value: The value to store.
+        """
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries from the cache and reset the statistics."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Get a value from the cache.
+
+        :param key: The key of the value.
+        :param default: The value to return when the key isn't in the cache.
+        :returns: The cached value or `default`.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        """Render a human friendly representation of the cache (including statistics)."""
+        return "%s(maxsize=%i, size=%i, hits=%i, misses=%i)" % (
+            self.__class__.__name__, self.maxsize, len(self), self.hits, self.misses,
+        )
+
+
 class ResourceLockedException(Exception):
 
     """Raised by :class:`atomic_lock()` when the lock can't be claimed."""
@@ -1,7 +1,7 @@
 # Debian packaging tools: Version comparison and sorting.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: April 19, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """
@@ -12,7 +12,7 @@ according to `section 5.6.12 of the Debian Policy Manual`_. The main entry
 points for users of the Python API are the :func:`compare_versions()` function
 and the :class:`Version` class.
 
-This module contains two Debian version comparison implementations:
+This module contains three Debian version comparison implementations:
 
 :func:`compare_versions_native()`
  This is a pure Python implementation of the Debian version sorting algorithm.
@@ -24,32 +24,53 @@ This module contains two Debian version comparison implementations:
  with the implementation of :func:`compare_versions_native()`, for more on that
  please refer to :data:`PREFER_DPKG`.
 
+:func:`compare_versions_apt()`
+ This uses the compiled ``apt_pkg.version_compare()`` function provided by
+ python-apt_ (when it's installed). Because python-apt_ uses the GPL2 license
+ it's not a dependency of `deb-pkg-tools`, however when you have it installed
+ anyway you can opt in to using it, please refer to :data:`PREFER_APT`.
+
 .. _section 5.6.12 of the Debian Policy Manual: http://www.debian.org/doc/debian-policy/ch-controlfields.html#s-f-Version
 """
 
 # Standard library modules.
+import functools
 import logging
 import os
+import weakref
 
 # External dependencies.
 from executor import execute
 from humanfriendly import coerce_boolean
+from humanfriendly.decorators import cached
 from humanfriendly.deprecation import define_aliases
 
 # Modules included in our package.
-from deb_pkg_tools.version.native import compare_version_objects
+from deb_pkg_tools.utils import LRUCache, supports_weak_references
+from deb_pkg_tools.version.native import get_version_sort_key
 
 # Public identifiers that require documentation.
 __all__ = (
+    'COMPARISON_CACHE_SIZE',
     'DPKG_COMPARISON_CACHE',
+    'INTERNED_VERSIONS',
     'NATIVE_COMPARISON_CACHE',
+    'PREFER_APT',
     'PREFER_DPKG',
     'Version',
     'coerce_version',
     'compare_versions',
+    'compare_versions_apt',
+    'compare_versions_many',
     'compare_versions_native',
     'compare_versions_external',
+    'get_apt_pkg',
+    'interpret_comparison',
     'logger',
+    'make_sort_key',
+    'max_version',
+    'sort_versions',
+    'version_sort_key',
 )
 
 PREFER_DPKG = coerce_boolean(os.environ.get('DPT_VERSION_COMPAT', 'false'))
@@ -71,20 +92,47 @@ acceptable values).
 .. _python-apt: https://packages.debian.org/python-apt
 """
 
-DPKG_COMPARISON_CACHE = {}
+PREFER_APT = coerce_boolean(os.environ.get('DPT_VERSION_APT', 'false'))
+"""
+:data:`True` to prefer :func:`compare_versions_apt()` over
+:func:`compare_versions_native()`, :data:`False` otherwise (the
+default is :data:`False`).
+
+The environment variable ``$DPT_VERSION_APT`` can be used to control the
+value of this variable (see :func:`~humanfriendly.coerce_boolean()` for
+acceptable values). When python-apt_ isn't installed this option is ignored
+and :func:`compare_versions_native()` is used instead. When both
+:data:`PREFER_DPKG` and :data:`PREFER_APT` are :data:`True` then
+:data:`PREFER_DPKG` takes precedence.
+"""
+
+COMPARISON_CACHE_SIZE = int(os.environ.get('DPT_VERSION_CACHE_SIZE', '10000'))
+"""
+The maximum number of entries in :data:`DPKG_COMPARISON_CACHE` and
+:data:`NATIVE_COMPARISON_CACHE` (an integer, defaults to 10000).
+
+The environment variable ``$DPT_VERSION_CACHE_SIZE`` can be used to control the
+value of this variable. Because the caches are created when this module is
+imported, changing the value of this variable afterwards has no effect (you
+can change the :attr:`~deb_pkg_tools.utils.LRUCache.maxsize` attribute of
+the caches instead).
+"""
+
+DPKG_COMPARISON_CACHE = LRUCache(maxsize=COMPARISON_CACHE_SIZE)
 """
-This dictionary is used by :func:`compare_versions_external()` to cache ``dpkg
---compare-versions`` results. Each key in the dictionary is a tuple of three
-values: (version1, operator, version2). Each value in the dictionary is a
-boolean (:data:`True` if the comparison succeeded, :data:`False` if it failed).
+This :class:`~deb_pkg_tools.utils.LRUCache` is used by
+:func:`compare_versions_external()` to cache ``dpkg --compare-versions``
+results. Each key in the cache is a tuple of three values: (version1,
+operator, version2). Each value in the cache is a boolean (:data:`True` if the
+comparison succeeded, :data:`False` if it failed).
 """
 
-NATIVE_COMPARISON_CACHE = {}
+NATIVE_COMPARISON_CACHE = LRUCache(maxsize=COMPARISON_CACHE_SIZE)
 """
-This dictionary is used by :func:`compare_versions_native()` to cache the
-results of comparisons between version strings. Each key in the dictionary is a
-tuple of two values: (version1, version2). Each value is one of the following
-integers:
+This :class:`~deb_pkg_tools.utils.LRUCache` is used by
+:func:`compare_versions_native()` to cache the results of comparisons between
+version strings. Each key in the cache is a tuple of two values: (version1,
+version2). Each value is one of the following integers:
 
 - -1 means version1 sorts before version2
 - 0 means version1 and version2 are equal
@@ -94,6 +142,20 @@ This cache is a lot more efficient than :data:`DPKG_COMPARISON_CACHE` because
 the cache key doesn't contain operators.
 """
 
+INTERNED_VERSIONS = (weakref.WeakValueDictionary() if supports_weak_references(str)
+                     else LRUCache(maxsize=COMPARISON_CACHE_SIZE))
+"""
+This weak-valued dictionary is used by :class:`Version` to ensure that
+identical version strings share a single :class:`Version` object (as long as
+that object is referenced elsewhere). Each key in the dictionary is a tuple of
+two values: (class, version_string). Each value is a :class:`Version` object.
+
+Python 2 doesn't support weak references to :class:`str` subclasses, in that
+case an :class:`~deb_pkg_tools.utils.LRUCache` with a maximum size of
+:data:`COMPARISON_CACHE_SIZE` is used instead (which means the most recently
+used :class:`Version` objects are kept alive).
+"""
+
 # Initialize a logger.
 logger = logging.getLogger(__name__)
 
@@ -125,10 +187,30 @@ def compare_versions(version1, operator, version2):
     """
     if PREFER_DPKG:
         return compare_versions_external(version1, operator, version2)
+    elif PREFER_APT and get_apt_pkg():
+        return compare_versions_apt(version1, operator, version2)
     else:
         return compare_versions_native(version1, operator, version2)
 
 
+def compare_versions_apt(version1, operator, version2):
+    """
+    Compare Debian package versions using python-apt_.
+
+    :param version1: The version on the left side of the comparison (a string).
+    :param operator: The operator to use in the comparison (a string).
+    :param version2: The version on the right side of the comparison (a string).
+    :returns: :data:`True` if the comparison succeeds, :data:`False` if it fails.
+    :raises: :exc:`~exceptions.ImportError` when python-apt_ isn't installed.
+
+    .. seealso:: :data:`PREFER_APT` and :func:`get_apt_pkg()`
+    """
+    apt_pkg = get_apt_pkg()
+    if not apt_pkg:
+        raise ImportError("The python-apt package is required to compare versions using apt_pkg!")
+    return interpret_comparison(apt_pkg.version_compare(version1, version2), operator)
+
+
 def compare_versions_external(version1, operator, version2):
     """
     Compare Debian package versions using the external command ``dpkg --compare-versions ...``.
@@ -163,7 +245,7 @@ def compare_versions_native(version1, operator, version2):
     :param version2: The version on the right side of the comparison (a string).
     :returns: :data:`True` if the comparison succeeds, :data:`False` if it fails.
 
-    .. seealso:: :data:`NATIVE_COMPARISON_CACHE` and :func:`.compare_version_objects()`
+    .. seealso:: :data:`NATIVE_COMPARISON_CACHE` and :attr:`Version.sort_key`
     """
     # Compare the two version numbers and remember the result so that
     # we don't have to compare two version numbers more than once.
@@ -171,11 +253,27 @@ def compare_versions_native(version1, operator, version2):
     try:
         value = NATIVE_COMPARISON_CACHE[key]
     except KeyError:
-        version1 = coerce_version(version1)
-        version2 = coerce_version(version2)
-        value = compare_version_objects(version1, version2)
+        key1 = coerce_version(version1).sort_key
+        key2 = coerce_version(version2).sort_key
+        value = (key1 > key2) - (key1 < key2)
         NATIVE_COMPARISON_CACHE[key] = value
     # Translate the comparison result to the requested operator.
+    return interpret_comparison(value, operator)
+
+
+def interpret_comparison(value, operator):
+    """
+    Translate the result of a version comparison to the result of an operator.
+
+    :param value: A negative integer (meaning version1 sorts before version2),
+                  zero (meaning the versions are equal) or a positive integer
+                  (meaning version1 sorts after version2).
+    :param operator: The operator to use in the comparison (a string).
+    :returns: :data:`True` if the comparison succeeds, :data:`False` if it fails.
+    :raises: :exc:`~exceptions.ValueError` when the operator isn't supported.
+
+    Used by :func:`compare_versions_native()` and :func:`compare_versions_apt()`.
+    """
     if operator == '=':
         # Equality.
         return value == 0
@@ -196,6 +294,148 @@ def compare_versions_native(version1, operator, version2):
         raise ValueError(msg % operator)
 
 
+@cached
+def get_apt_pkg():
+    """
+    Import and initialize the ``apt_pkg`` module provided by python-apt_.
+
+    :returns: The ``apt_pkg`` module or :data:`None` when python-apt_ isn't
+              installed (or can't be initialized).
+    """
+    try:
+        import apt_pkg
+        apt_pkg.init_system()
+        return apt_pkg
+    except Exception as e:
+        logger.debug("Failed to initialize python-apt (%s), falling back to native version comparison.", e)
+        return None
+
+
+def version_sort_key(value):
+    """
+    Get a sort key for a Debian package version.
+
+    :param value: A version string or :class:`Version` object.
+    :returns: The value of :attr:`Version.sort_key`.
+
+    This function is intended to be used as the `key` argument of
+    :func:`sorted()`, :func:`max()` and similar functions:
+
+      >>> from deb_pkg_tools.version import version_sort_key
+      >>> sorted(['1.0', '1:0.1', '1.0~rc1'], key=version_sort_key)
+      ['1.0~rc1', '1.0', '1:0.1']
+
+    Note that this always uses the pure Python implementation of version
+    comparison (regardless of :data:`PREFER_DPKG`).
+    """
+    return coerce_version(value).sort_key
+
+
+def sort_versions(values, key=None, reverse=False):
+    """
+    Sort Debian package versions.
+
+    :param values: An iterable of version strings and/or :class:`Version`
+                   objects (or arbitrary values when `key` is given).
+    :param key: An optional function that extracts the version from each value
+                (similar to the `key` argument of :func:`sorted()`).
+    :param reverse: :data:`True` to sort in descending order (defaults to
+                    :data:`False`).
+    :returns: A sorted list of values.
+
+    Each distinct version is converted to a sort key only once, after which the
+    values are sorted using plain tuple comparisons. Like :func:`sorted()` this
+    function is stable, so values with equal versions retain their relative
+    order.
+    """
+    return sorted(values, key=make_sort_key(key), reverse=reverse)
+
+
+def max_version(values, key=None):
+    """
+    Find the highest Debian package version.
+
+    :param values: An iterable of version strings and/or :class:`Version`
+                   objects (or arbitrary values when `key` is given).
+    :param key: An optional function that extracts the version from each value
+                (similar to the `key` argument of :func:`max()`).
+    :returns: The value with the highest version. When multiple values share
+              the highest version the first one is returned.
+    :raises: :exc:`~exceptions.ValueError` when `values` is empty.
+    """
+    return max(values, key=make_sort_key(key))
+
+
+def compare_versions_many(pairs):
+    """
+    Compare several pairs of Debian package versions.
+
+    :param pairs: An iterable of tuples with two values each (version strings
+                  and/or :class:`Version` objects).
+    :returns: A list with one integer for each pair:
+
+              - -1 means version1 sorts before version2
+              - 0 means version1 and version2 are equal
+              - 1 means version1 sorts after version2
+
+    Each distinct version is converted to a sort key only once, which makes
+    this a lot faster than calling :func:`compare_versions()` in a loop when
+    the same versions occur in several pairs.
+    """
+    get_key = make_sort_key()
+    results = []
+    for version1, version2 in pairs:
+        key1 = get_key(version1)
+        key2 = get_key(version2)
+        results.append((key1 > key2) - (key1 < key2))
+    return results
+
+
+def make_sort_key(key=None):
+    """
+    Create a function that converts values to comparable version sort keys.
+
+    :param key: An optional function that extracts the version from each value.
+    :returns: A function that takes one argument and returns a value that can
+              be compared using Python's comparison operators.
+
+    The returned function caches the sort key of each distinct version string,
+    so it's intended to be used for the duration of a single sort or batch of
+    comparisons. When :data:`PREFER_DPKG` is :data:`True` the returned sort
+    keys use :func:`compare_versions_external()` and when :data:`PREFER_APT`
+    is :data:`True` (and python-apt_ is installed) they use the compiled
+    ``apt_pkg.version_compare()`` function.
+
+    This function is used by :func:`sort_versions()`, :func:`max_version()`
+    and :func:`compare_versions_many()`.
+    """
+    apt_pkg = get_apt_pkg() if (PREFER_APT and not PREFER_DPKG) else None
+    if apt_pkg:
+        apt_key = functools.cmp_to_key(apt_pkg.version_compare)
+        return lambda value: apt_key(key(value) if key else value)
+    if PREFER_DPKG:
+        def compare_external(version1, version2):
+            if compare_versions_external(version1, '<<', version2):
+                return -1
+            elif compare_versions_external(version1, '>>', version2):
+                return 1
+            else:
+                return 0
+        external_key = functools.cmp_to_key(compare_external)
+        return lambda value: external_key(key(value) if key else value)
+    sort_keys = {}
+
+    def native_key(value):
+        version = key(value) if key else value
+        try:
+            return sort_keys[version]
+        except KeyError:
+            sort_key = coerce_version(version).sort_key
+            sort_keys[version] = sort_key
+            return sort_key
+    return native_key
+
+
 class Version(str):
 
     """
@@ -229,26 +469,57 @@ class Version(str):
     .. attribute:: debian_revision
 
        A string containing the Debian revision suffixed to the version number.
+
+    .. attribute:: sort_key
+
+       A tuple that encodes the Debian version sorting order (see
+       :func:`.get_version_sort_key()`). The sort key is computed on first
+       access and then cached. Unless :data:`PREFER_DPKG` or :data:`PREFER_APT`
+       is :data:`True` rich comparison of :class:`Version` objects is implemented by comparing
+       their sort keys, which avoids repeatedly tokenizing the same strings.
+
+    :class:`Version` objects are interned (see :data:`INTERNED_VERSIONS`) which
+    means that constructing a :class:`Version` object for a version string that
+    is already in use returns the existing object, including its parsed
+    components, cached hash and cached sort key.
     """
 
-    def __init__(self, value):
+    def __new__(cls, value):
         """
-        Initialize a :class:`Version` object.
+        Get the :class:`Version` object for a Debian version number.
 
         :param value: A string containing a Debian version number.
+        :returns: A new or existing :class:`Version` object.
         """
-        if ":" in value:
-            epoch, _, value = value.partition(":")
-            self.epoch = int(epoch)
-        else:
-            self.epoch = 0
-        if "-" in value:
-            upstream, _, debian = value.rpartition("-")
-            self.upstream_version = upstream
-            self.debian_revision = debian
-        else:
-            self.upstream_version = value
-            self.debian_revision = ""
+        text = str(value)
+        key = (cls, text)
+        instance = INTERNED_VERSIONS.get(key)
+        if instance is None:
+            instance = super(Version, cls).__new__(cls, text)
+            if ":" in text:
+                epoch, _, text = text.partition(":")
+                instance.epoch = int(epoch)
+            else:
+                instance.epoch = 0
+            if "-" in text:
+                upstream, _, debian = text.rpartition("-")
+                instance.upstream_version = upstream
+                instance.debian_revision = debian
+            else:
+                instance.upstream_version = text
+                instance.debian_revision = ""
+            INTERNED_VERSIONS[key] = instance
+        return instance
+
+    def __reduce__(self):
+        """
+        Enable pickling of :class:`Version` objects.
+
+        Only the version string is pickled, so that unpickling goes through
+        :func:`__new__()` (and the intern table) and cached values like the
+        hash (which can differ between Python processes) aren't persisted.
+        """
+        return (self.__class__, (str(self),))
 
     def __hash__(self):
         """Enable adding :class:`Version` objects to sets and using them as dictionary keys."""
@@ -259,9 +530,22 @@ class Version(str):
             self._cached_hash = value
             return value
 
+    @property
+    def sort_key(self):
+        """A tuple that encodes the Debian version sorting order (computed on first access)."""
+        try:
+            return self._cached_sort_key
+        except AttributeError:
+            value = get_version_sort_key(self)
+            self._cached_sort_key = value
+            return value
+
     def __eq__(self, other):
         """Enable equality comparison between :class:`Version` objects."""
-        if type(self) is type(other):
+        if self is other:
+            # Interning makes identity checks a cheap fast path.
+            return True
+        elif type(self) is type(other):
             return (
                 (self.epoch == other.epoch)
                 and (self.upstream_version == other.upstream_version)
@@ -272,23 +556,48 @@ class Version(str):
 
     def __ne__(self, other):
         """Enable non-equality comparison between version objects."""
-        return not compare_versions(self, '=', other) if type(self) is type(other) else NotImplemented
+        if type(self) is not type(other):
+            return NotImplemented
+        elif PREFER_DPKG or PREFER_APT:
+            return not compare_versions(self, '=', other)
+        else:
+            return self.sort_key != other.sort_key
 
     def __lt__(self, other):
         """Enable less-than comparison between version objects."""
-        return compare_versions(self, '<<', other) if type(self) is type(other) else NotImplemented
+        if type(self) is not type(other):
+            return NotImplemented
+        elif PREFER_DPKG or PREFER_APT:
+            return compare_versions(self, '<<', other)
+        else:
+            return self.sort_key < other.sort_key
 
     def __le__(self, other):
         """Enable less-than-or-equal comparison between version objects."""
-        return compare_versions(self, '<=', other) if type(self) is type(other) else NotImplemented
+        if type(self) is not type(other):
+            return NotImplemented
+        elif PREFER_DPKG or PREFER_APT:
+            return compare_versions(self, '<=', other)
+        else:
+            return self.sort_key <= other.sort_key
 
     def __gt__(self, other):
         """Enable greater-than comparison between version objects."""
-        return compare_versions(self, '>>', other) if type(self) is type(other) else NotImplemented
+        if type(self) is not type(other):
+            return NotImplemented
+        elif PREFER_DPKG or PREFER_APT:
+            return compare_versions(self, '>>', other)
+        else:
+            return self.sort_key > other.sort_key
 
     def __ge__(self, other):
         """Enable greater-than-or-equal comparison between version objects."""
-        return compare_versions(self, '>=', other) if type(self) is type(other) else NotImplemented
+        if type(self) is not type(other):
+            return NotImplemented
+        elif PREFER_DPKG or PREFER_APT:
+            return compare_versions(self, '>=', other)
+        else:
+            return self.sort_key >= other.sort_key
 
 
 # Define aliases for backwards compatibility.
@@ -1,7 +1,7 @@
 # Debian packaging tools: Version comparison and sorting.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: April 19, 2020
+# Last Change: October 18, 2026
 # URL: https://github.com/xolox/python-deb-pkg-tools
 
 """
@@ -27,6 +27,7 @@ implementation was (just slightly) faster than python-apt_!
 
 # Standard library modules.
 import logging
+import re
 import string
 
 # External dependencies.
@@ -40,12 +41,17 @@ __all__ = (
     'get_digit_prefix',
     'get_non_digit_prefix',
     'get_order_mapping',
+    'get_string_sort_key',
+    'get_version_sort_key',
     'logger',
 )
 
 # Initialize a logger.
 logger = logging.getLogger(__name__)
 
+# Compiled regular expression to split version strings into (non-digit, digit) parts.
+TOKEN_PATTERN = re.compile(r'([^0-9]*)([0-9]*)')
+
 
 def compare_strings(version1, version2):
     """
@@ -123,9 +129,12 @@ def compare_version_objects(version1, version2):
               - 0 means version1 and version2 are equal
               - 1 means version1 sorts after version2
 
-    This function is used by :func:`~deb_pkg_tools.version.compare_versions_native()`
-    to perform the comparison of Debian version strings, after which the operator is
-    interpreted by :func:`~deb_pkg_tools.version.compare_versions_native()`.
+    This function implements the Debian version sorting algorithm by directly
+    comparing the components of the two versions. Nowadays
+    :func:`~deb_pkg_tools.version.compare_versions_native()` compares the sort
+    keys returned by :func:`get_version_sort_key()` instead (which is faster
+    when the same versions are compared more than once) but this function
+    remains available as a reference implementation.
     """
     logger.debug("Comparing Debian version numbers %r and %r ..", version1, version2)
     # Handle differences in the "epoch".
@@ -145,6 +154,64 @@ def compare_version_objects(version1, version2):
     return 0
 
 
+def get_string_sort_key(value):
+    """
+    Get a sort key for an upstream version string or Debian revision string.
+
+    :param value: An upstream version string or Debian revision string.
+    :returns: A tuple of integers.
+
+    The tuples returned by this function compare according to the same rules
+    as :func:`compare_strings()`, which means they can be compared using plain
+    tuple comparison (which is a lot faster than repeatedly tokenizing the same
+    strings). The tuple consists of the following values, in order:
+
+    - For each non-digit part, the sort order of each character (according to
+      :func:`get_order_mapping()`) followed by the sort order of the empty
+      string (so that e.g. '~' sorts before the end of a part).
+    - For each digit part, its numerical value.
+
+    Trailing parts that are empty (that is to say equivalent to the end of the
+    string) are stripped and a fixed suffix representing the end of the string
+    is appended, so that e.g. '1.0' and '1.0~rc1' compare correctly.
+    """
+    mapping = get_order_mapping()
+    # Characters that aren't in the mapping sort after all known characters.
+    unknown = len(mapping)
+    end_of_part = mapping[""]
+    parts = [(non_digits, int(digits) if digits else 0) for non_digits, digits in TOKEN_PATTERN.findall(value)]
+    # Strip trailing parts that compare equal to the end of the string.
+    while parts and parts[-1] == ("", 0):
+        parts.pop()
+    key = []
+    for non_digits, number in parts:
+        for c in non_digits:
+            key.append(mapping.get(c, unknown + ord(c)))
+        key.append(end_of_part)
+        key.append(number)
+    # Terminate the key with the representation of the end of the string.
+    key.extend((end_of_part, 0, end_of_part))
+    return tuple(key)
+
+
+def get_version_sort_key(version):
+    """
+    Get a sort key for a :class:`.Version` object.
+
+    :param version: A :class:`.Version` object.
+    :returns: A tuple with three values: The epoch (an integer) and the values
+              returned by :func:`get_string_sort_key()` for the upstream
+              version and Debian revision.
+
+    This function is used to compute :attr:`.Version.sort_key`.
+    """
+    return (
+        version.epoch,
+        get_string_sort_key(version.upstream_version),
+        get_string_sort_key(version.debian_revision),
+    )
+
+
 def get_digit_prefix(characters):
     """
     Get the digit prefix from a given list of characters.
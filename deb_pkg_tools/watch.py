@@ -0,0 +1,310 @@
+# Debian packaging tools: Repository watcher.
+#
+# Author: Peter Odding <peter@peterodding.com>
+# Last Change: October 18, 2026
+# URL: https://github.com/xolox/python-deb-pkg-tools
+
+"""
+Update trivial repositories as soon as package archives are added or removed.
+
+Running ``deb-pkg-tools --update-repo`` periodically (e.g. from cron) means
+that uploaded package archives only become installable after the next run.
+The :class:`RepositoryWatcher` class (available on the command line as
+``deb-pkg-tools --watch``) instead waits for changes to the ``*.deb`` archives
+in a repository directory and updates the repository right after a burst of
+uploads has settled down:
+
+- On Linux :man:`inotify` is used (through :mod:`ctypes`, see
+  :class:`InotifyWatcher`), on other platforms (or when inotify isn't
+  available) the directory is polled (see :class:`PollingWatcher`).
+
+- The paragraphs of the ``Packages`` file are kept in memory between updates
+  (see the `paragraphs` argument of :func:`.scan_packages()`), so only the
+  archives that were added or changed are inspected. The
+  :class:`.PackageCache` given to the watcher also stays in memory.
+"""
+
+# Standard library modules.
+import ctypes
+import ctypes.util
+import errno
+import glob
+import logging
+import os
+import select
+import struct
+import time
+
+# External dependencies.
+from humanfriendly import Timer, format_path
+from humanfriendly.text import pluralize
+
+# Modules included in our package.
+from deb_pkg_tools.repo import update_repository
+
+# Public identifiers that require documentation.
+__all__ = (
+    "InotifyWatcher",
+    "PollingWatcher",
+    "RepositoryWatcher",
+    "WATCH_DELAY",
+    "WATCH_INTERVAL",
+    "create_watcher",
+    "logger",
+)
+
+WATCH_DELAY = float(os.environ.get('DPT_WATCH_DELAY', '2'))
+"""
+The number of seconds without changes after which :class:`RepositoryWatcher`
+updates the repository (a number, defaults to 2). Changes to multiple archives
+within this period result in a single update. The environment variable
+``$DPT_WATCH_DELAY`` can be used to control the value of this variable.
+"""
+
+WATCH_INTERVAL = float(os.environ.get('DPT_WATCH_INTERVAL', '1'))
+"""
+The number of seconds between scans of the repository directory by
+:class:`PollingWatcher` (a number, defaults to 1). The environment variable
+``$DPT_WATCH_INTERVAL`` can be used to control the value of this variable.
+"""
+
+# Event flags from <sys/inotify.h>.
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+# The layout of `struct inotify_event' (without the variable length name).
+INOTIFY_EVENT = struct.Struct('iIII')
+
+# Initialize a logger.
+logger = logging.getLogger(__name__)
+
+
+class RepositoryWatcher(object):
+
+    """Keep a trivial repository up to date by watching for changed package archives."""
+
+    def __init__(self, directory, cache=None, delay=None, watcher=None, **options):
+        """
+        Initialize a :class:`RepositoryWatcher` object.
+
+        :param directory: The pathname of a directory with ``*.deb`` packages (a string).
+        :param cache: The :class:`.PackageCache` to use (defaults to :data:`None`).
+        :param delay: The number of seconds to wait for a burst of changes to
+                      settle down (a number, defaults to :data:`WATCH_DELAY`).
+        :param watcher: The object that reports changes (defaults to the
+                        result of :func:`create_watcher()`).
+        :param options: Any keyword arguments are passed on to
+                        :func:`.update_repository()`.
+        """
+        self.directory = directory
+        self.cache = cache
+        self.delay = WATCH_DELAY if delay is None else delay
+        self.watcher = watcher or create_watcher(directory)
+        self.options = options
+        self.paragraphs = {}
+
+    def run(self):
+        """
+        Update the repository and keep it up to date (until interrupted).
+
+        When an update fails (for example because an archive is corrupt or
+        the repository is locked by another process) the error is logged and
+        the update is retried after :attr:`delay` seconds.
+        """
+        logger.info("Watching repository %s for changes (using %s) ..",
+                    format_path(self.directory), self.watcher.__class__.__name__)
+        pending = True
+        while True:
+            if pending:
+                pending = not self.update()
+            changes = self.wait_for_changes(timeout=self.delay if pending else None)
+            if changes:
+                logger.info("Detected changes to %s: %s", pluralize(len(changes), "archive"), ", ".join(sorted(changes)))
+                pending = True
+
+    def update(self):
+        """
+        Update the repository.
+
+        :returns: :data:`True` if the update succeeded, :data:`False` otherwise.
+        """
+        timer = Timer()
+        try:
+            update_repository(self.directory, cache=self.cache, paragraphs=self.paragraphs, **self.options)
+            logger.info("Repository %s is up to date (took %s).", format_path(self.directory), timer)
+            return True
+        except Exception:
+            logger.exception("Failed to update repository %s!", format_path(self.directory))
+            return False
+
+    def wait_for_changes(self, timeout=None):
+        """
+        Wait for a burst of changes to the package archives.
+
+        :param timeout: The maximum number of seconds to wait for the first
+                        change (a number or :data:`None` to wait forever).
+        :returns: A set with the filenames of the archives that changed
+                  (possibly empty when the timeout expired).
+
+        After the first change this keeps collecting changes until no
+        changes have been reported for :attr:`delay` seconds.
+        """
+        changes = set(self.watcher.wait(timeout))
+        while changes:
+            more = self.watcher.wait(self.delay)
+            if not more:
+                break
+            changes.update(more)
+        return changes
+
+    def close(self):
+        """Release the resources of the underlying watcher."""
+        self.watcher.close()
+
+
+def create_watcher(directory):
+    """
+    Create an object that reports changes to the package archives in a directory.
+
+    :param directory: The pathname of a directory (a string).
+    :returns: An :class:`InotifyWatcher` object when inotify is available,
+              otherwise a :class:`PollingWatcher` object.
+    """
+    try:
+        return InotifyWatcher(directory)
+    except EnvironmentError as e:
+        logger.debug("Falling back to polling (inotify isn't available: %s).", e)
+        return PollingWatcher(directory)
+
+
+class InotifyWatcher(object):
+
+    """Report changes to the package archives in a directory using :man:`inotify`."""
+
+    def __init__(self, directory):
+        """
+        Initialize an :class:`InotifyWatcher` object.
+
+        :param directory: The pathname of a directory (a string).
+        :raises: :exc:`~exceptions.EnvironmentError` when inotify isn't
+                 available on this platform.
+        """
+        library = ctypes.util.find_library('c')
+        try:
+            libc = ctypes.CDLL(library, use_errno=True)
+            inotify_init1 = libc.inotify_init1
+            inotify_add_watch = libc.inotify_add_watch
+        except (AttributeError, OSError):
+            raise EnvironmentError(errno.ENOSYS, "inotify isn't supported")
+        inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise EnvironmentError(code, os.strerror(code))
+        mask = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+        pathname = directory.encode('UTF-8') if not isinstance(directory, bytes) else directory
+        if inotify_add_watch(self.fd, pathname, mask) < 0:
+            code = ctypes.get_errno()
+            os.close(self.fd)
+            raise EnvironmentError(code, os.strerror(code), directory)
+        self.directory = directory
+
+    def wait(self, timeout=None):
+        """
+        Wait for changes to package archives.
+
+        :param timeout: The maximum number of seconds to wait (a number or
+                        :data:`None` to wait forever).
+        :returns: A set with the filenames of the archives that changed
+                  (empty when the timeout expired).
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 1024 * 64)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return set()
+            raise
+        changes = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('UTF-8', 'replace')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, report a change so the repository is updated.
+                changes.add(u'*')
+            elif name.endswith(u'.deb'):
+                changes.add(name)
+        return changes
+
+    def close(self):
+        """Close the inotify file descriptor."""
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+
+    """Report changes to the package archives in a directory by polling."""
+
+    def __init__(self, directory, interval=None):
+        """
+        Initialize a :class:`PollingWatcher` object.
+
+        :param directory: The pathname of a directory (a string).
+        :param interval: The number of seconds between scans (a number,
+                         defaults to :data:`WATCH_INTERVAL`).
+        """
+        self.directory = directory
+        self.interval = WATCH_INTERVAL if interval is None else interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        """
+        Get the size and last modified time of the package archives.
+
+        :returns: A dictionary with filenames as keys and (size, mtime)
+                  tuples as values.
+        """
+        snapshot = {}
+        for pathname in glob.glob(os.path.join(self.directory, '*.deb')):
+            try:
+                stat = os.stat(pathname)
+                snapshot[os.path.basename(pathname)] = (stat.st_size, stat.st_mtime)
+            except OSError:
+                # The archive was removed while we were scanning.
+                pass
+        return snapshot
+
+    def wait(self, timeout=None):
+        """
+        Wait for changes to package archives.
+
+        :param timeout: The maximum number of seconds to wait (a number or
+                        :data:`None` to wait forever).
+        :returns: A set with the filenames of the archives that changed
+                  (empty when the timeout expired).
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            snapshot = self.scan()
+            changes = set(n for n in set(snapshot) | set(self.snapshot) if snapshot.get(n) != self.snapshot.get(n))
+            self.snapshot = snapshot
+            if changes:
+                return changes
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return changes
+            time.sleep(self.interval if remaining is None else min(self.interval, remaining))
+
+    def close(self):
+        """Nothing to release (provided for compatibility with :class:`InotifyWatcher`)."""